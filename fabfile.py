@@ -1,14 +1,29 @@
+import base64
 import boto3
 import datetime
 import glob
+import hashlib
+import imp
+import importlib
 import jinja2
+import jinja2.meta
 import json
+import multiprocessing
 import os
 import pprint
+import Queue
+import re
+import shutil
 import subprocess
+import sys
+import tempfile
+import threading
+import time
 import yaml
+import zipfile
 
 from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 from botocore.exceptions import ClientError, ValidationError
 
 import logging; logging.basicConfig()
@@ -46,16 +61,80 @@ INPUT_FILES  = glob.glob(os.path.join(INPUT_DIR, '*{0}'.format(INPUT_EXT)))
 
 OUTPUT_DIR   = os.path.join(ROOT_DIR, '_output')
 OUTPUT_EXT   = '.template'
-OUTPUT_FILES = glob.glob(os.path.join(OUTPUT_DIR, '*{0}'.format(OUTPUT_EXT)))
+RENDER_MANIFEST = os.path.join(OUTPUT_DIR, '.render_manifest.json')
+
+# Hashes of rendered template bodies that have passed validate_template, so they are not sent again.
+VALIDATION_CACHE = os.path.join(OUTPUT_DIR, '.validation_cache.json')
+TEMPLATE_SECTIONS = {'AWSTemplateFormatVersion', 'Description', 'Metadata', 'Parameters', 'Mappings', 'Conditions',
+                     'Transform', 'Resources', 'Outputs', 'Rules'}
 
 # Ensure that .local.yaml config files are loaded last, so that they take precedence in the config dict.
 CONFIG_DIR   = os.path.join(ROOT_DIR, 'cloudformation_config')
 CONFIG_FILES = sorted(glob.glob(os.path.join(CONFIG_DIR, '*{0}'.format('.yaml'))), reverse=True)
 
+# Tag holding the hash of the template body and parameters a stack was last provisioned from.
+STACK_HASH_TAG = 'fab-aws:inputs-hash'
+CHANGE_SET_POLL = 1.0
+
+# Stack event polling backs off from STACK_POLL_MIN to STACK_POLL_MAX seconds while nothing is happening.
+STACK_POLL_MIN = 2.0
+STACK_POLL_MAX = 30.0
+
 LAMBDA_DIR = os.path.join(ROOT_DIR, 'lambda')
 BUILDS_SUBDIR = '_builds'
-STAGING_SUBDIR = '_staging'
+DEPS_CACHE_SUBDIR = '_deps_cache'
+BUILD_MANIFEST = '.build_manifest.json'
 LAMBDA_CONFIG_SUBDIR = 'lambda_config'
+LAMBDA_PARSED_CONFIG = 'config.json'
+
+# A function whose package has this (standard library only) module gets its `env.sites` compiled into a site
+# registry by the module's compile_registry(), in place of the list in the pre-parsed config.
+SITE_REGISTRY_MODULE = 'registry.py'
+
+# Packages above the inline limit of update_function_code are staged through S3, in multipart chunks.
+LAMBDA_INLINE_ZIP_LIMIT = 50 * 1024 * 1024
+S3_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Every zip entry gets the same timestamp, so that identical inputs give a byte-identical build.
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+# Run in a Lambda function directory to time the import of its entry point, broken down per module.
+IMPORT_PROFILER = '''
+import sys, time
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+original_import = builtins.__import__
+stack, timings = [], []
+
+def timed_import(name, *args, **kwargs):
+    is_new = name not in sys.modules
+    stack.append(0.0)
+    start = time.time()
+    try:
+        return original_import(name, *args, **kwargs)
+    finally:
+        elapsed = time.time() - start
+        children = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        if is_new:
+            timings.append((elapsed - children, elapsed, len(stack), name))
+
+builtins.__import__ = timed_import
+sys.path.insert(0, '.')
+start = time.time()
+import index
+total = time.time() - start
+builtins.__import__ = original_import
+
+print('{0:>10} {1:>10}  {2}'.format('self (ms)', 'cumul (ms)', 'module'))
+for (self_time, cumulative, depth, name) in sorted(timings, reverse=True)[:int(sys.argv[1])]:
+    print('{0:>10.1f} {1:>10.1f}  {2}{3}'.format(self_time * 1000, cumulative * 1000, '  ' * depth, name))
+print('Total time to import index (including module-level config): {0:.1f}ms'.format(total * 1000))
+'''
 
 
 def load_config():
@@ -65,7 +144,11 @@ def load_config():
                           'git', 'log', '-1', '--pretty=%B']).strip().replace('"', '')
                                                                      .replace('#', '')
                                                                      .replace('\n', '')
-                                                                     .replace(':', ' '),
+                                                                     .replace(':', ' ')
+                                                                     .replace('[', '')
+                                                                     .replace(']', '')
+                                                                     .replace('{', '')
+                                                                     .replace('}', ''),
                       'uncommitted': True if subprocess.call(
                           'git diff-index --quiet HEAD --'.split(' ')) else False }}
 
@@ -97,10 +180,739 @@ def load_config():
     return config
 
 
+def parse_lambda_config(lambda_config_dir):
+    """Merge the YAML config files of a Lambda function into a dict keyed by basename.
+
+    As in the function's own config.py, .local.yaml files take precedence over non-local.
+
+    Args:
+        lambda_config_dir: (str) The lambda_config directory of the function.
+    """
+    config = {}
+    for config_file in sorted(glob.glob(os.path.join(lambda_config_dir, '*.yaml')), reverse=True):
+        with open(config_file, 'r') as config_file_contents:
+            data = yaml.load(config_file_contents.read())
+            if not data:
+                continue
+            basename = os.path.basename(config_file).split('.')[0]
+            if basename in config:
+                config[basename].update(data)
+            else:
+                config[basename] = data
+    return config
+
+
+def jinja_environment():
+    """(jinja2.Environment) The environment in which templates from the input directory are rendered."""
+    env = jinja2.Environment(trim_blocks=True, lstrip_blocks=True, undefined=jinja2.StrictUndefined)
+    env.loader = jinja2.FileSystemLoader(INPUT_DIR)
+    return env
+
+
+def template_inputs_hash(env, basename, config):
+    """Hash everything that the rendered output of a template depends on.
+
+    That is: the template source, the source of any templates it includes or extends, and the values of the
+    config keys (including git metadata) that any of them reference.
+
+    Args:
+        env: (jinja2.Environment) The Jinja environment.
+        basename: (str) The template name, without extension; e.g. 'dn_stack'.
+        config: (dict) The loaded config.
+    Returns:
+        (str) A hex digest.
+    """
+    sha = hashlib.sha256(basename)
+    pending = ['{0}{1}'.format(basename, INPUT_EXT)]
+    seen = set()
+    variables = set()
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        source = env.loader.get_source(env, name)[0]
+        sha.update(name)
+        sha.update(source.encode('utf-8'))
+        ast = env.parse(source)
+        variables |= jinja2.meta.find_undeclared_variables(ast)
+        for referenced in jinja2.meta.find_referenced_templates(ast):
+            # A dynamic include could be any template; so depend on all of them.
+            pending.extend([referenced] if referenced else env.loader.list_templates())
+
+    for variable in sorted(variables):
+        sha.update(json.dumps([variable, config.get(variable)], sort_keys=True, default=str))
+    return sha.hexdigest()
+
+
+def render_template(args):
+    """Render one yaml.jinja template to JSON in the output directory. Run in a process pool by `render`.
+
+    Args:
+        args: (tuple) The input file path, and the config to inject.
+    Returns:
+        (str) The output file path.
+    """
+    (input_file, config) = args
+    basename = os.path.basename(input_file).split('.')[0]
+    template = jinja_environment().get_template('{0}{1}'.format(basename, INPUT_EXT))
+    rendered = template.render(**dict(config, __name__=basename))
+    data = yaml.load(rendered)
+
+    output_str  = json.dumps(data, indent=2, separators=(',', ': '))
+    output_file = os.path.join(OUTPUT_DIR, basename) + OUTPUT_EXT
+    with open(output_file, 'w') as output_contents:
+        output_contents.write(output_str)
+    return output_file
+
+
+def describe_stack(client, stack_name):
+    """(dict) The description of the named stack; None if there is no such stack."""
+    try:
+        return client.describe_stacks(StackName=stack_name)['Stacks'][0]
+    except ClientError:
+        return None
+
+
+def stack_inputs(template_name, config):
+    """The rendered template body and parameters for a stack, and a hash of them.
+
+    Args:
+        template_name: (str) The name of the template from the input directory.
+        config: (dict) The loaded config.
+    Returns:
+        (tuple) The template body, the parameters list, and the hex digest of both.
+    """
+    with open(os.path.join(OUTPUT_DIR, template_name + OUTPUT_EXT)) as output_contents:
+        body = output_contents.read()
+    parameters = config.get(template_name, {}).get('parameters', [])
+    digest = hashlib.sha256()
+    digest.update(body)
+    digest.update(json.dumps(parameters, sort_keys=True))
+    return (body, parameters, digest.hexdigest())
+
+
+def stack_tags(stack, inputs_hash):
+    """(list) The stack's existing tags, with the STACK_HASH_TAG set to the given inputs hash."""
+    tags = [tag for tag in (stack or {}).get('Tags', []) if tag['Key'] != STACK_HASH_TAG]
+    return tags + [{'Key': STACK_HASH_TAG, 'Value': inputs_hash}]
+
+
+def create_stack(client, template_name, stack_name, config):
+    """Submit a create_stack of the rendered template, tagged with its inputs hash; does not wait for it to finish.
+
+    Returns:
+        (dict) The API response.
+    """
+    (body, parameters, inputs_hash) = stack_inputs(template_name, config)
+    return client.create_stack(StackName=stack_name,
+                               TemplateBody=body,
+                               Parameters=parameters,
+                               Capabilities=['CAPABILITY_IAM'],
+                               Tags=stack_tags(None, inputs_hash))
+
+
+def wait_for_change_set(client, change_set_arn):
+    """Wait for a change set to be created.
+
+    Returns:
+        (tuple) The final change set status, its status reason, and the list of all its changes.
+    """
+    delay = CHANGE_SET_POLL
+    while True:
+        response = client.describe_change_set(ChangeSetName=change_set_arn)
+        if not response['Status'].endswith('_IN_PROGRESS') and response['Status'] != 'CREATE_PENDING':
+            break
+        time.sleep(delay)
+        delay = min(STACK_POLL_MAX, delay * 2)
+    changes = list(response.get('Changes', []))
+    while response.get('NextToken'):
+        response = client.describe_change_set(ChangeSetName=change_set_arn, NextToken=response['NextToken'])
+        changes.extend(response.get('Changes', []))
+    return (response['Status'], response.get('StatusReason', ''), changes)
+
+
+def plan_stack_update(client, stack, template_name, config):
+    """Create a change set updating a stack to its rendered template, unless nothing has changed.
+
+    The hash of the template body and parameters is kept in the STACK_HASH_TAG of the stack; when it matches
+    the local inputs, no change set is created at all. When a change set turns out to be empty, it is deleted.
+
+    Args:
+        client: (botocore.client.CloudFormation) The CloudFormation client.
+        stack: (dict) The description of the existing stack.
+        template_name: (str) The name of the template from the input directory.
+        config: (dict) The loaded config.
+    Returns:
+        (str) The ARN of a change set, ready to execute; None if the stack is already up to date.
+    """
+    stack_name = stack['StackName']
+    (body, parameters, inputs_hash) = stack_inputs(template_name, config)
+    deployed_hash = dict((tag['Key'], tag['Value']) for tag in stack.get('Tags', [])).get(STACK_HASH_TAG)
+    if deployed_hash == inputs_hash:
+        logger.info('Stack %s is up to date with %s; skipping update', stack_name, template_name)
+        return None
+
+    response = client.create_change_set(StackName=stack_name,
+                                        ChangeSetName='fab-{0}-{1}'.format(inputs_hash[:12], int(time.time())),
+                                        TemplateBody=body,
+                                        Parameters=parameters,
+                                        Capabilities=['CAPABILITY_IAM'],
+                                        Tags=stack_tags(stack, inputs_hash),
+                                        ChangeSetType='UPDATE')
+    (status, reason, changes) = wait_for_change_set(client, response['Id'])
+    if status != 'CREATE_COMPLETE':
+        client.delete_change_set(ChangeSetName=response['Id'])
+        if "didn't contain changes" in reason or 'No updates are to be performed' in reason:
+            logger.info('Stack %s has no changes from %s; skipping update', stack_name, template_name)
+            return None
+        raise RuntimeError('Change set for {0} failed: {1}'.format(stack_name, reason))
+
+    for change in changes:
+        change = change.get('ResourceChange', {})
+        logger.info('[%s] %s %s (%s)%s', stack_name, change.get('Action'), change.get('LogicalResourceId'),
+                    change.get('ResourceType'),
+                    '; replacement: ' + change['Replacement'] if change.get('Replacement') in ('True', 'Conditional') else '')
+    if not changes:
+        logger.info('[%s] Only stack tags or parameters change', stack_name)
+    return response['Id']
+
+
+def stack_succeeded(status):
+    """(bool) Whether a status from provision_stack means the stack is as rendered."""
+    return status == 'UNCHANGED' or (status.endswith('_COMPLETE') and 'ROLLBACK' not in status)
+
+
+def find_import_values(node):
+    """(list) The names imported with Fn::ImportValue anywhere within a template (or part of one)."""
+    if isinstance(node, dict):
+        found = []
+        for (key, value) in node.items():
+            if key == 'Fn::ImportValue' and isinstance(value, basestring):
+                found.append(value)
+            else:
+                found.extend(find_import_values(value))
+        return found
+    if isinstance(node, list):
+        return [name for item in node for name in find_import_values(item)]
+    return []
+
+
+def template_dependencies(template_names, config):
+    """The templates that each of the given templates depends on, amongst the given templates.
+
+    Args:
+        template_names: (list) Names of rendered templates.
+        config: (dict) The loaded config.
+    Returns:
+        (dict) A set of template names, keyed by template name.
+    """
+    bodies = {}
+    exports = {}
+    for name in template_names:
+        with open(os.path.join(OUTPUT_DIR, name + OUTPUT_EXT)) as output_contents:
+            bodies[name] = json.load(output_contents)
+        for output in bodies[name].get('Outputs', {}).values():
+            export = output.get('Export', {}).get('Name')
+            if isinstance(export, basestring):
+                exports[export] = name
+
+    dependencies = {}
+    for name in template_names:
+        dependencies[name] = set(config.get(name, {}).get('depends_on', []))
+        dependencies[name].update(exports[i] for i in find_import_values(bodies[name]) if i in exports)
+        dependencies[name].discard(name)
+        for outside in dependencies[name] - set(template_names):
+            logger.info('%s depends on %s, which is not being provisioned; assuming it exists', name, outside)
+        dependencies[name] &= set(template_names)
+    return dependencies
+
+
+def topological_order(dependencies):
+    """(list) The template names ordered so that each comes after those it depends on; aborts on a cycle."""
+    order = []
+    remaining = dict((name, set(deps)) for (name, deps) in dependencies.items())
+    while remaining:
+        ready = sorted(name for (name, deps) in remaining.items() if not deps - set(order))
+        if not ready:
+            abort('Circular dependency between stacks: {0}'.format(', '.join(sorted(remaining))))
+        order.extend(ready)
+        for name in ready:
+            del remaining[name]
+    return order
+
+
+class StackEventStreamer(object):
+    """Logs the events of a stack as they happen, until its operation settles.
+
+    Events are fetched incrementally: describe_stack_events is paged (newest first) only as far back as the
+    last event already seen. Polling backs off exponentially while there are no new events.
+    """
+
+    def __init__(self, client, stack_name, poll_min=STACK_POLL_MIN, poll_max=STACK_POLL_MAX):
+        self.client = client
+        self.stack_name = stack_name
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        self._last_event_id = None
+
+    def mark(self):
+        """Skip the events that have already happened; call before submitting an operation on an existing stack."""
+        try:
+            events = self.client.describe_stack_events(StackName=self.stack_name)['StackEvents']
+        except ClientError:
+            return
+        if events:
+            self._last_event_id = events[0]['EventId']
+
+    def new_events(self):
+        """(list) The events since the last call, oldest first."""
+        events = []
+        kwargs = {'StackName': self.stack_name}
+        while True:
+            response = self.client.describe_stack_events(**kwargs)
+            for event in response['StackEvents']:
+                if event['EventId'] == self._last_event_id:
+                    response.pop('NextToken', None)
+                    break
+                events.append(event)
+            if not response.get('NextToken'):
+                break
+            kwargs['NextToken'] = response['NextToken']
+        if events:
+            self._last_event_id = events[0]['EventId']
+        return list(reversed(events))
+
+    def wait(self):
+        """Log events until the stack's operation settles.
+
+        Returns:
+            (str) The final stack status; e.g. 'CREATE_COMPLETE' or 'UPDATE_ROLLBACK_COMPLETE'.
+        """
+        delay = self.poll_min
+        while True:
+            events = self.new_events()
+            for event in events:
+                logger.info('[%s] %s %s %s %s', self.stack_name, event['Timestamp'], event['ResourceStatus'],
+                            event['LogicalResourceId'], event.get('ResourceStatusReason', ''))
+                if (event['ResourceType'] == 'AWS::CloudFormation::Stack' and
+                        event['LogicalResourceId'] == self.stack_name and
+                        not event['ResourceStatus'].endswith('_IN_PROGRESS')):
+                    return event['ResourceStatus']
+            delay = self.poll_min if events else min(self.poll_max, delay * 2)
+            time.sleep(delay)
+
+
+def provision_stack(client, template_name, config, stack):
+    """Create or update one stack, and stream its events until it settles.
+
+    Args:
+        client: (botocore.client.CloudFormation) The CloudFormation client.
+        template_name: (str) The name of the template from the input directory.
+        config: (dict) The loaded config.
+        stack: (dict) The description of the existing stack; None to create it.
+    Returns:
+        (tuple) The template name, and the final stack status; 'UNCHANGED', or a description of the failure.
+    """
+    stack_name = config[template_name]['stack_name']
+    try:
+        streamer = StackEventStreamer(client, stack_name)
+        if stack:
+            change_set_arn = plan_stack_update(client, stack, template_name, config)
+            if not change_set_arn:
+                return (template_name, 'UNCHANGED')
+            streamer.mark()
+            client.execute_change_set(ChangeSetName=change_set_arn)
+        else:
+            create_stack(client, template_name, stack_name, config)
+        return (template_name, streamer.wait())
+    except ClientError as e:
+        logger.error('Unable to provision %s. Exception: %s', stack_name, e)
+        return (template_name, 'FAILED: {0}'.format(e))
+    except Exception as e:  # Anything escaping the pool thread would leave provision_graph waiting forever.
+        logger.exception('Unable to provision %s', stack_name)
+        return (template_name, 'FAILED: {0}'.format(e))
+
+
+def provision_graph(client, dependencies, config, existing, max_workers):
+    """Provision stacks on a thread pool; each once those it depends on have succeeded.
+
+    Args:
+        client: (botocore.client.CloudFormation) The CloudFormation client.
+        dependencies: (dict) A set of template names that each template depends on, keyed by template name.
+        config: (dict) The loaded config.
+        existing: (dict) The description of each template's existing stack (None if it does not exist).
+        max_workers: (int) The most stacks to provision at once.
+    Returns:
+        (dict) The final status of each template's stack, keyed by template name.
+    """
+    results = {}
+    remaining = dict(dependencies)
+    finished = Queue.Queue()
+    pool = ThreadPool(max_workers)
+    running = 0
+    try:
+        while remaining or running:
+            ready = [name for (name, deps) in remaining.items() if deps <= set(results)]
+            for name in ready:
+                del remaining[name]
+                failed = [d for d in dependencies[name] if not stack_succeeded(results[d])]
+                if failed:
+                    results[name] = 'SKIPPED: {0} failed'.format(', '.join(sorted(failed)))
+                    continue
+                pool.apply_async(provision_stack, (client, name, config, existing[name]), callback=finished.put)
+                running += 1
+            if ready and not running:
+                continue  # Skipped stacks may have unblocked others.
+            (name, status) = finished.get()
+            results[name] = status
+            running -= 1
+    finally:
+        pool.close()
+    return results
+
+
+def output_files():
+    """(list) The rendered template files currently in the output directory."""
+    return sorted(glob.glob(os.path.join(OUTPUT_DIR, '*{0}'.format(OUTPUT_EXT))))
+
+
+def template_references(node, found=None):
+    """Collect the Ref, Fn::GetAtt and Fn::Sub targets anywhere within a template (or part of one).
+
+    Returns:
+        (list) Tuples of the intrinsic function name and the logical name it refers to.
+    """
+    found = [] if found is None else found
+    if isinstance(node, list):
+        for item in node:
+            template_references(item, found)
+    elif isinstance(node, dict):
+        for (key, value) in node.items():
+            if key == 'Ref' and isinstance(value, basestring):
+                found.append(('Ref', value))
+            elif key == 'Fn::GetAtt' and isinstance(value, (list, basestring)):
+                target = value[0] if isinstance(value, list) else value.split('.')[0]
+                found.append(('Fn::GetAtt', target))
+            elif key == 'Fn::Sub':
+                (text, variables) = (value[0], value[1]) if isinstance(value, list) else (value, {})
+                if isinstance(text, basestring):
+                    for name in re.findall(r'\$\{([^!}][^}]*)\}', text):
+                        if name not in variables:
+                            found.append(('Fn::Sub', name.split('.')[0]))
+                template_references(variables, found)
+            else:
+                template_references(value, found)
+    return found
+
+
+def prevalidate_template(body):
+    """Check a rendered template offline, for the mistakes that would otherwise cost a validate_template call.
+
+    Args:
+        body: (str) The rendered template body.
+    Returns:
+        (list) Descriptions of the problems found; empty if there are none.
+    """
+    try:
+        template = json.loads(body)
+    except ValueError as e:
+        return ['Invalid JSON: {0}'.format(e)]
+    if not isinstance(template, dict):
+        return ['Template is not a JSON object']
+
+    errors = ['Unknown section {0}'.format(key) for key in sorted(set(template) - TEMPLATE_SECTIONS)]
+    resources = template.get('Resources')
+    if not isinstance(resources, dict) or not resources:
+        return errors + ['Template has no Resources']
+    for (name, resource) in sorted(resources.items()):
+        if not isinstance(resource, dict) or not isinstance(resource.get('Type'), basestring):
+            errors.append('Resource {0} has no Type'.format(name))
+    if 'Transform' in template:
+        return errors  # Macros may add resources and parameters that cannot be seen here.
+
+    names = set(resources) | set(template.get('Parameters', {}))
+    for (function, target) in sorted(set(template_references(template))):
+        if target.startswith('AWS::'):
+            continue
+        if function == 'Fn::GetAtt' and target not in resources:
+            errors.append('Fn::GetAtt of unknown resource {0}'.format(target))
+        elif function != 'Fn::GetAtt' and target not in names:
+            errors.append('{0} of unknown resource or parameter {1}'.format(function, target))
+    for (name, resource) in sorted(resources.items()):
+        depends_on = resource.get('DependsOn', []) if isinstance(resource, dict) else []
+        for target in [depends_on] if isinstance(depends_on, basestring) else depends_on:
+            if target not in resources:
+                errors.append('Resource {0} DependsOn unknown resource {1}'.format(name, target))
+    return errors
+
+
+def validate_remote(args):
+    """Validate one template body against the CloudFormation API; runs on the validate thread pool.
+
+    Args:
+        args: (tuple) The CloudFormation client, the output file name, and the template body.
+    Returns:
+        (tuple) The output file name, and the validation error (None if it is valid).
+    """
+    (client, output_file, body) = args
+    try:
+        client.validate_template(TemplateBody=body)
+        return (output_file, None)
+    except (ClientError, ValidationError) as e:
+        return (output_file, e)
+
+
+def cached_dependencies(lambda_root):
+    """Install a Lambda function's requirements into a cache directory keyed by a hash of requirements.txt.
+
+    Args:
+        lambda_root: (str) The root directory of the Lambda function.
+    Returns:
+        (tuple) The directory of installed dependencies, and whether it was already cached.
+    """
+    requirements_file = os.path.join(lambda_root, 'requirements.txt')
+    with open(requirements_file, 'rb') as requirements_contents:
+        digest = hashlib.sha256(requirements_contents.read()).hexdigest()
+    deps_dir = os.path.join(lambda_root, DEPS_CACHE_SUBDIR, digest)
+    if os.path.isdir(deps_dir):
+        return (deps_dir, True)
+
+    # Install beside the cache entry and move it into place, so an interrupted install is never used.
+    partial_dir = deps_dir + '.partial'
+    local('rm -rf {0}'.format(partial_dir))
+    local('pip install --no-compile -r {0} -t {1}'.format(requirements_file, partial_dir))
+    os.rename(partial_dir, deps_dir)
+    return (deps_dir, False)
+
+
+def package_entries(lambda_root, function_name, deps_dir):
+    """The files of a Lambda function's deployable package, by their path within the zip.
+
+    Later sources override earlier ones: the installed dependencies, the top level *.py (e.g. index.py), the
+    lambda_config dir plus its pre-parsed config JSON (and compiled site registry), and the function's module
+    directory.
+
+    Returns:
+        (dict) Tuples of the source path (or None) and the contents (or None), keyed by path within the zip.
+    """
+    entries = {}
+
+    def add_tree(source_dir, prefix):
+        for (dirpath, dirnames, filenames) in os.walk(source_dir):
+            dirnames[:] = [d for d in dirnames if d != '__pycache__']
+            for filename in filenames:
+                if not filename.endswith(('.pyc', '.pyo')):
+                    path = os.path.join(dirpath, filename)
+                    arcname = os.path.relpath(path, source_dir).replace(os.sep, '/')
+                    entries[prefix + arcname] = (path, None)
+
+    lambda_config_dir = os.path.join(lambda_root, LAMBDA_CONFIG_SUBDIR)
+    add_tree(deps_dir, '')
+    for path in glob.glob(os.path.join(lambda_root, '*.py')):
+        entries[os.path.basename(path)] = (path, None)
+    add_tree(lambda_config_dir, LAMBDA_CONFIG_SUBDIR + '/')
+    parsed_config = parse_lambda_config(lambda_config_dir)
+    registry_module = os.path.join(lambda_root, function_name, SITE_REGISTRY_MODULE)
+    env = parsed_config.get('env', {})
+    if os.path.exists(registry_module) and env.get('sites'):
+        registry = imp.load_source('{0}_registry'.format(function_name), registry_module)
+        try:
+            (contents, stats) = registry.compile_registry(env.pop('sites'), env)
+        except registry.SiteRegistryError as e:
+            abort(str(e))
+        entries[LAMBDA_CONFIG_SUBDIR + '/' + registry.REGISTRY_FILE] = (None, contents)
+        logger.info('Compiled site registry: %(sites)d sites (%(duplicates)d duplicates dropped) on %(hosts)d hosts, '
+                    'in %(buckets)d buckets', stats)
+    entries[LAMBDA_CONFIG_SUBDIR + '/' + LAMBDA_PARSED_CONFIG] = (
+        None, json.dumps(parsed_config, indent=2, sort_keys=True))
+    add_tree(os.path.join(lambda_root, function_name), function_name + '/')
+    return entries
+
+
+def package_hash(entries, deps_dir):
+    """(str) A hash of the package's sources and config; dependencies are represented by their cache key."""
+    digest = hashlib.sha256(os.path.basename(deps_dir))
+    for (arcname, (path, contents)) in sorted(entries.items()):
+        if path and path.startswith(deps_dir + os.sep):
+            continue
+        if contents is None:
+            with open(path, 'rb') as source:
+                contents = source.read()
+        digest.update('{0}\0{1}\0'.format(arcname, hashlib.sha256(contents).hexdigest()))
+    return digest.hexdigest()
+
+
+def write_package(entries, zip_path):
+    """Write the package entries to a zip, in sorted order and with fixed timestamps, so it is reproducible."""
+    partial_path = zip_path + '.partial'
+    with zipfile.ZipFile(partial_path, 'w', zipfile.ZIP_DEFLATED) as package:
+        for (arcname, (path, contents)) in sorted(entries.items()):
+            info = zipfile.ZipInfo(arcname, ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            executable = path and os.stat(path).st_mode & 0o111
+            info.external_attr = (0o755 if executable else 0o644) << 16
+            if contents is None:
+                with open(path, 'rb') as source:
+                    contents = source.read()
+            package.writestr(info, contents)
+    os.rename(partial_path, zip_path)
+
+
+def code_sha256(path):
+    """(str) The base64 SHA256 of a file, as Lambda reports CodeSha256; the file is read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as contents:
+        for chunk in iter(lambda: contents.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return base64.b64encode(digest.digest())
+
+
+def stage_package(client, path, bucket, key):
+    """Upload a package to S3 with a streamed multipart upload, unless an object already exists at the key.
+
+    Args:
+        client: (botocore.client.S3) An S3 client for the bucket's region.
+        path: (str) The package zip file.
+        bucket: (str) The S3 bucket to stage it in.
+        key: (str) The S3 key; content addressed, so an existing object is the same package.
+    """
+    from boto3.s3.transfer import TransferConfig
+    try:
+        client.head_object(Bucket=bucket, Key=key)
+        logger.info('Package already staged at s3://{0}/{1}'.format(bucket, key))
+        return
+    except ClientError:
+        pass
+    transfer_config = TransferConfig(multipart_threshold=S3_MULTIPART_CHUNKSIZE,
+                                     multipart_chunksize=S3_MULTIPART_CHUNKSIZE)
+    client.upload_file(path, bucket, key, Config=transfer_config)
+    logger.info('Staged package at s3://{0}/{1}'.format(bucket, key))
+
+
+class DeployPackage(object):
+    """A build being deployed; staged in each region's S3 bucket once, however many targets use that bucket."""
+
+    def __init__(self, path, sha256, s3_bucket=None, s3_key=None):
+        self.path = path
+        self.sha256 = sha256
+        self.s3_bucket = s3_bucket
+        self.s3_key = s3_key
+        self._lock = threading.Lock()
+        self._bucket_locks = {}
+
+    def code(self, s3_client, account, region):
+        """(dict) The update_function_code arguments giving the package to a function in the account and region."""
+        if not self.s3_bucket:
+            with open(self.path, 'rb') as zip_file:
+                return {'ZipFile': zip_file.read()}
+        bucket = self.s3_bucket.format(region=region, account=account)
+        with self._lock:
+            bucket_lock = self._bucket_locks.setdefault(bucket, threading.Lock())
+        with bucket_lock:
+            stage_package(s3_client, self.path, bucket, self.s3_key)
+        return {'S3Bucket': bucket, 'S3Key': self.s3_key}
+
+
+class DeployTarget(object):
+    """A Lambda function ARN to deploy to; its region and account are taken from the ARN."""
+
+    def __init__(self, arn):
+        parts = arn.split(':')
+        if len(parts) < 7 or parts[2] != 'lambda':
+            abort('Not a Lambda function ARN: {0}'.format(arn))
+        self.arn = arn
+        self.region = parts[3]
+        self.account = parts[4]
+
+    def deploy(self, clients, package, alias=None, force=False):
+        """Deploy the package to this target; never raises, so one target cannot stop the others.
+
+        Args:
+            clients: (dict) The Lambda and S3 clients for each (account, region), as from fleet_clients.
+            package: (DeployPackage) The build to deploy.
+            alias: (str) Publish a version, and point this alias at it.
+            force: (bool) Upload the package even if the deployed code matches it.
+        Returns:
+            (dict) The arn, the result ('updated', 'unchanged' or 'failed: ...'), the version and the seconds taken.
+        """
+        started = time.time()
+        (client, s3_client) = clients[(self.account, self.region)]
+        result = {'arn': self.arn, 'version': None}
+        try:
+            deployed_sha256 = client.get_function_configuration(FunctionName=self.arn)['CodeSha256']
+            if deployed_sha256 == package.sha256 and not force:
+                result['result'] = 'unchanged'
+                if alias:
+                    result['version'] = client.publish_version(FunctionName=self.arn,
+                                                               CodeSha256=package.sha256)['Version']
+            else:
+                response = client.update_function_code(FunctionName=self.arn, Publish=bool(alias),
+                                                       **package.code(s3_client, self.account, self.region))
+                if response['CodeSha256'] != package.sha256:
+                    raise RuntimeError('deployed CodeSha256 {0} does not match the build'.format(response['CodeSha256']))
+                result['result'] = 'updated'
+                result['version'] = response['Version'] if alias else None
+            if alias:
+                point_alias(client, self.arn, alias, result['version'])
+        except Exception as e:
+            logger.error('Unable to deploy to {0}. Exception: {1}'.format(self.arn, e))
+            result['result'] = 'failed: {0}'.format(e)
+        result['seconds'] = time.time() - started
+        return result
+
+
+def point_alias(client, arn, alias, version):
+    """Point a function's alias at a version, creating the alias if it does not exist."""
+    try:
+        client.update_alias(FunctionName=arn, Name=alias, FunctionVersion=version)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ResourceNotFoundException':
+            raise
+        client.create_alias(FunctionName=arn, Name=alias, FunctionVersion=version)
+
+
+def fleet_clients(targets, role_name=None, s3_bucket=None):
+    """Create one Lambda client (and S3 client, if staging) per account and region of the deploy targets.
+
+    Clients are created up front on this thread, as boto3 sessions are not safe to share across threads.
+
+    Args:
+        targets: (list) The DeployTargets.
+        role_name: (str) The IAM role to assume in accounts other than the current one.
+        s3_bucket: (str) The S3 bucket the package will be staged in, if any.
+    Returns:
+        (dict) Tuples of the Lambda client and the S3 client (or None), keyed by (account, region).
+    """
+    sessions = {}
+    current_account = boto3.client('sts').get_caller_identity()['Account'] if role_name else None
+    for account in set(target.account for target in targets):
+        if role_name and account != current_account:
+            credentials = boto3.client('sts').assume_role(
+                RoleArn='arn:aws:iam::{0}:role/{1}'.format(account, role_name),
+                RoleSessionName='fab-deploy')['Credentials']
+            sessions[account] = boto3.session.Session(aws_access_key_id=credentials['AccessKeyId'],
+                                                      aws_secret_access_key=credentials['SecretAccessKey'],
+                                                      aws_session_token=credentials['SessionToken'])
+        else:
+            sessions[account] = boto3.session.Session()
+
+    clients = {}
+    for (account, region) in set((target.account, target.region) for target in targets):
+        s3_client = sessions[account].client('s3', region_name=region) if s3_bucket else None
+        clients[(account, region)] = (sessions[account].client('lambda', region_name=region), s3_client)
+    return clients
+
+
 # Fabric tasks.
 @task(default=True)
-def render():
-    """Render yaml.jinja to JSON, via the loaded config."""
+def render(force=False, processes=None):
+    """Render yaml.jinja to JSON, via the loaded config; skipping templates whose inputs are unchanged.
+
+    Args:
+        force: (bool) Render every template, whether or not its inputs have changed.
+        processes: (int) The number of processes to render in; defaults to the number of CPUs.
+    """
     if not INPUT_FILES:
         abort('No YAML files present in directory')
 
@@ -108,43 +920,101 @@ def render():
         logger.info('Created directory: %s', OUTPUT_DIR)
         os.makedirs(OUTPUT_DIR)
 
-    # Load the Jinja environment.
-    env = jinja2.Environment(trim_blocks=True, lstrip_blocks=True, undefined=jinja2.StrictUndefined)
-    env.loader = jinja2.FileSystemLoader(INPUT_DIR)
+    # Load the config and the Jinja environment, once for all templates.
+    config = load_config()
+    env = jinja_environment()
+
+    manifest = {}
+    if os.path.exists(RENDER_MANIFEST) and str(force).lower() != 'true':
+        with open(RENDER_MANIFEST, 'r') as manifest_contents:
+            manifest = json.load(manifest_contents)
 
-    # For each file in the input directory; run through a Jinja render and convert to JSON.
+    # Work out which templates' inputs have changed since they were last rendered.
+    hashes = {}
+    changed = []
     for input_file in INPUT_FILES:
         basename = os.path.basename(input_file).split('.')[0]
-        template = env.get_template('{0}{1}'.format(basename, INPUT_EXT))
-        config   = load_config()
-        config.update({'__name__': basename})
-        rendered = template.render(**config)
-        data = yaml.load(rendered)
-
-        output_str  = json.dumps(data, indent=2, separators=(',', ': '))
-        output_file = os.path.join(OUTPUT_DIR, os.path.basename(input_file).split('.')[0]) + OUTPUT_EXT
-        with open(output_file, 'w') as output_contents:
-            output_contents.write(output_str)
+        hashes[basename] = template_inputs_hash(env, basename, config)
+        output_file = os.path.join(OUTPUT_DIR, basename) + OUTPUT_EXT
+        if manifest.get(basename) == hashes[basename] and os.path.exists(output_file):
+            logger.info('Skipped %s; unchanged since last render', os.path.basename(input_file))
+        else:
+            changed.append(input_file)
+
+    # Run each changed file through a Jinja render and convert to JSON, in parallel.
+    if changed:
+        pool = multiprocessing.Pool(int(processes) if processes else None)
+        try:
+            output_files = pool.map(render_template, [(input_file, config) for input_file in changed])
+        finally:
+            pool.close()
+            pool.join()
+        for (input_file, output_file) in zip(changed, output_files):
             logger.info('Converted %s to %s', os.path.basename(input_file), os.path.basename(output_file))
 
+    manifest.update(hashes)
+    with open(RENDER_MANIFEST, 'w') as manifest_contents:
+        json.dump(manifest, manifest_contents, indent=2, sort_keys=True)
+
 
 @task
-def validate():
-    """Validates the rendered template against the CloudFormation API."""
-    client = boto3.client('cloudformation')
-    for output_file in OUTPUT_FILES:
+def validate(force=False, max_workers=8):
+    """Validates the rendered templates against the CloudFormation API.
+
+    Templates are first checked offline, so that malformed JSON and references to unknown resources fail
+    without any API call. Templates whose exact body has already passed are not sent again; the rest are
+    validated concurrently.
+
+    Args:
+        force: (bool) Validate every template with the API, whether or not it has passed before.
+        max_workers: (int) The most validate_template calls to make at once.
+    """
+    bodies = {}
+    failed = False
+    for output_file in output_files():
         with open(output_file, 'r') as output_contents:
-            try:
-                client.validate_template(TemplateBody=output_contents.read())
-            except (ClientError, ValidationError) as e:
-                logger.error('Unable to validate {0}. Exception: {1}'.format(output_file, e))
-                abort('Template validation error')
+            bodies[output_file] = output_contents.read()
+        for error in prevalidate_template(bodies[output_file]):
+            logger.error('Unable to validate {0}. {1}'.format(output_file, error))
+            failed = True
+    if failed:
+        abort('Template validation error')
+
+    validated = set()
+    if os.path.exists(VALIDATION_CACHE) and str(force).lower() != 'true':
+        with open(VALIDATION_CACHE, 'r') as cache_contents:
+            validated = set(json.load(cache_contents))
+    hashes = dict((f, hashlib.sha256(body).hexdigest()) for (f, body) in bodies.iteritems())
+    pending = sorted(f for f in bodies if hashes[f] not in validated)
+    logger.info('Validating {0} of {1} templates; the rest are unchanged since they last passed'.format(
+        len(pending), len(bodies)))
+
+    if pending:
+        client = boto3.client('cloudformation')
+        pool = ThreadPool(min(int(max_workers), len(pending)))
+        try:
+            results = pool.map(validate_remote, [(client, f, bodies[f]) for f in pending])
+        finally:
+            pool.close()
+        for (output_file, error) in results:
+            if error:
+                logger.error('Unable to validate {0}. Exception: {1}'.format(output_file, error))
+                failed = True
+            else:
+                validated.add(hashes[output_file])
+        with open(VALIDATION_CACHE, 'w') as cache_contents:
+            json.dump(sorted(validated & set(hashes.values())), cache_contents, indent=2)
+    if failed:
+        abort('Template validation error')
 
 
 @task
 def provision(template_name=None, stack_name=None):
     """Creates or updates a CloudFormation stack based on the supplied template type name.
 
+    An existing stack is updated through a change set, so that only real changes are shown and applied; if the
+    rendered template and parameters hash to the same value as when the stack was last provisioned, it is skipped.
+
     Args:
         template_name: (str) The name of the template from the input directory.
         stack_name: (str) The stack name to use for CloudFormation.
@@ -157,37 +1027,75 @@ def provision(template_name=None, stack_name=None):
 
     config = load_config()
 
-    update = False
-    try:
-        resp = client.describe_stacks(StackName=stack_name)
-        message = 'Stack {0} exists, and is in state {1}. Proceed with update?'.format(
-            stack_name, resp['Stacks'][0]['StackStatus'])
-        if not confirm(message):
-            abort('Aborting.')
-        else:
-            update = True
-    except ClientError:
+    stack = describe_stack(client, stack_name)
+    if not stack:
         logger.info('No stack named {0}; proceeding with stack creation'.format(stack_name))
-
-    with open(os.path.join(OUTPUT_DIR, template_name + OUTPUT_EXT)) as output_contents:
-        if update:
-            response = client.update_stack(StackName=stack_name,
-                                           TemplateBody=output_contents.read(),
-                                           Parameters=config.get(template_name, {}).get('parameters', []),
-                                           Capabilities=['CAPABILITY_IAM'])
-        else:
-            response = client.create_stack(StackName=stack_name,
-                                           TemplateBody=output_contents.read(),
-                                           Parameters=config.get(template_name, {}).get('parameters', []),
-                                           Capabilities=['CAPABILITY_IAM'])
+        response = create_stack(client, template_name, stack_name, config)
         logger.info(json.dumps(response, indent=2))
+        return
+
+    change_set_arn = plan_stack_update(client, stack, template_name, config)
+    if not change_set_arn:
+        return
+    message = 'Stack {0} exists, and is in state {1}. Apply the changes above?'.format(stack_name, stack['StackStatus'])
+    if not confirm(message):
+        client.delete_change_set(ChangeSetName=change_set_arn)
+        abort('Aborting.')
+    client.execute_change_set(ChangeSetName=change_set_arn)
+    logger.info('Executing change set {0}'.format(change_set_arn))
+
+
+@task
+def provision_all(templates=None, max_workers=4):
+    """Creates or updates several CloudFormation stacks at once, in dependency order.
+
+    Each template's stack name is the `stack_name` key of its config. A stack depends on another if it has an
+    `Fn::ImportValue` of one of the other's exported outputs, or names it in the `depends_on` list of its config.
+    Independent stacks are provisioned concurrently, and the events of each are streamed until it settles; the
+    dependents of a stack that fails are skipped.
+
+    Args:
+        templates: (str) Semicolon separated template names; defaults to every template with a `stack_name`.
+        max_workers: (int) The most stacks to provision at once.
+    """
+    config = load_config()
+    if templates:
+        template_names = templates.split(';')
+    else:
+        template_names = sorted(name for (name, item) in config.iteritems() if name != 'git' and 'stack_name' in item)
+    if not template_names:
+        abort('No templates to provision; give templates, or set `stack_name` in their config')
+    for name in template_names:
+        if not config.get(name, {}).get('stack_name'):
+            abort('No stack_name configured for {0}'.format(name))
+        if not os.path.exists(os.path.join(OUTPUT_DIR, name + OUTPUT_EXT)):
+            abort('No rendered template for {0}; run `render` first'.format(name))
+
+    dependencies = template_dependencies(template_names, config)
+    order = topological_order(dependencies)
+    client = boto3.client('cloudformation')
+    existing = dict((name, describe_stack(client, config[name]['stack_name'])) for name in order)
+    for name in order:
+        logger.info('%s %s (stack %s)%s', 'Update' if existing[name] else 'Create', name, config[name]['stack_name'],
+                    '; after ' + ', '.join(sorted(dependencies[name])) if dependencies[name] else '')
+    if any(existing.values()) and not confirm('Some stacks exist, and will be updated where changed. Proceed?'):
+        abort('Aborting.')
+
+    results = provision_graph(client, dependencies, config, existing, int(max_workers))
+    for name in order:
+        logger.info('%s (stack %s): %s', name, config[name]['stack_name'], results[name])
+    if not all(stack_succeeded(status) for status in results.values()):
+        abort('Not every stack was provisioned successfully')
 
 
 @task
 def clean():
     """"Deletes all the rendered _output CloudFormation files."""
-    for f in OUTPUT_FILES:
+    for f in output_files():
         os.remove(f)
+    for f in (RENDER_MANIFEST, VALIDATION_CACHE):
+        if os.path.exists(f):
+            os.remove(f)
 
 
 @task
@@ -221,51 +1129,139 @@ def invoke(function_name=None):
 
 
 @task
-def build(function_name=None):
+def coldstart_profile(function_name=None, top=30):
+    """Times a fresh import of the given Lambda function's index.py, broken down per module.
+
+    The import is of the latest build (built first, if out of date), extracted to a temporary directory; so
+    it loads the pre-parsed config JSON and compiled site registry, as the deployed function does.
+
+    Args:
+        function_name: (str) The Lambda function within the lambda/ directory to work on.
+        top: (int) The number of slowest modules to report.
+    """
+    if not function_name:
+        abort('Must provide function_name')
+
+    build(function_name)
+    builds = sorted(glob.glob(os.path.join(LAMBDA_DIR, function_name, BUILDS_SUBDIR, '*.zip')))
+    package_dir = tempfile.mkdtemp(prefix='{0}-coldstart-'.format(function_name))
+    try:
+        with zipfile.ZipFile(builds[-1]) as package:
+            package.extractall(package_dir)
+        output = subprocess.check_output(['python', '-c', IMPORT_PROFILER, str(int(top))],
+                                         cwd=package_dir, stderr=subprocess.STDOUT)
+    finally:
+        shutil.rmtree(package_dir)
+    logger.info('Cold start profile for %s (build %s):\n%s', function_name, os.path.basename(builds[-1]), output)
+
+
+@task
+def analytics(function_name=None, days=30, targets=None, output=None, format='csv', max_workers=8):
+    """Reports uptime, outages, MTTR and latency percentiles per site, from the given Lambda function's history.
+
+    The history is read from the function's result table, many sites at once, into NumPy arrays; so this needs
+    numpy installed locally (and pyarrow, to export Parquet), though the function itself does not.
+
+    Args:
+        function_name: (str) The Lambda function within the lambda/ directory to work on.
+        days: (int) The number of days of history, up to now.
+        targets: (str) The names of the sites, separated by semicolons; defaults to the function's `sites`.
+        output: (str) A path prefix to export the summary, outages and checks to; e.g. 'reports/30d'.
+        format: (str) The export format: 'csv' or 'parquet'.
+        max_workers: (int) The most sites to read at once.
+    """
+    if not function_name:
+        abort('Must provide function_name')
+
+    lambda_root = os.path.join(LAMBDA_DIR, function_name)
+    env = parse_lambda_config(os.path.join(lambda_root, LAMBDA_CONFIG_SUBDIR)).get('env', {})
+    targets = targets.split(';') if targets else [site['name'] for site in env.get('sites', [])]
+    if not targets:
+        abort('No sites to report on; provide targets')
+
+    sys.path.insert(0, lambda_root)
+    CheckHistory = importlib.import_module('{0}.analytics'.format(function_name)).CheckHistory
+    history = CheckHistory.load(env['dynamo_table'], targets, days=int(days), max_workers=int(max_workers))
+
+    columns = ['checks', 'uptime', 'outages', 'mttr', 'longest_outage'] + [
+        'p{0}'.format(p) for p in CheckHistory.PERCENTILES]
+    width = max(len(name) for name in targets)
+    lines = ['{0:<{1}} '.format('site', width) + ' '.join('{0:>14}'.format(c) for c in columns)]
+    for row in history.summary():
+        lines.append('{0:<{1}} '.format(row['target'], width) + ' '.join(
+            '{0:>14}'.format('-' if row[c] is None else row[c]) for c in columns))
+    logger.info('Last %s days of %s (uptime %%; MTTR and longest outage in seconds; latency in ms):\n%s',
+                days, function_name, '\n'.join(lines))
+
+    if output:
+        for path in history.export(output, format):
+            logger.info('Wrote %s', path)
+
+
+@task
+def build(function_name=None, force=False):
     """Creates a deployable package for the given Lambda function in its _builds/ directory.
 
+    Dependencies are installed once per distinct requirements.txt, into _deps_cache/. The zip is written
+    in-process with sorted entries and fixed timestamps, so the same inputs always give the same bytes; if the
+    latest build was made from the same sources, config and requirements, no new build is made.
+
     Args:
         function_name: (str) The Lambda function within the lambda/ directory to work on.
+        force: (bool) Make a new build, even if the latest one is up to date.
     """
     if not function_name:
         abort('Must provide function_name')
 
+    started = time.time()
     lambda_root = os.path.join(LAMBDA_DIR, function_name)
-    module_dir = os.path.join(lambda_root, function_name)
-    lambda_config_dir = os.path.join(lambda_root, LAMBDA_CONFIG_SUBDIR)
-    staging_dir = os.path.join(lambda_root, STAGING_SUBDIR)
     builds_dir = os.path.join(lambda_root, BUILDS_SUBDIR)
+    manifest_file = os.path.join(builds_dir, BUILD_MANIFEST)
     build_filename = '{0}-{1}.zip'.format(
         datetime.datetime.now().isoformat().replace(':', '.'), function_name)
+    if not os.path.isdir(builds_dir):
+        os.makedirs(builds_dir)
 
-    # Erase previous runs of the build task.
-    local('rm -rf {0}'.format(staging_dir))
-
-    # Set up staging and builds directories.
-    local('mkdir -p {0}'.format(staging_dir))
-    local('mkdir -p {0}'.format(builds_dir))
+    (deps_dir, cached) = cached_dependencies(lambda_root)
+    deps_seconds = time.time() - started
+    entries = package_entries(lambda_root, function_name, deps_dir)
+    inputs_hash = package_hash(entries, deps_dir)
 
-    # Install the lambda specific requirements.
-    local('pip install -r {0}/requirements.txt -t {1}'.format(lambda_root, staging_dir))
-
-    # Copy the top level *.py (e.g. index.py) and lambda_config dir into the staging_dir.
-    local('cp -R {0}/*.py {1}'.format(lambda_root, staging_dir))
-    local('cp -R {0} {1}'.format(lambda_config_dir, staging_dir))
-
-    # Copy the module directory into the staging dir.
-    local('cp -R {0} {1}'.format(module_dir, staging_dir))
+    manifest = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file, 'r') as manifest_contents:
+            manifest = json.load(manifest_contents)
+    builds = sorted(glob.glob(os.path.join(builds_dir, '*.{0}'.format('zip'))))
+    if (str(force).lower() != 'true' and manifest.get('inputs_hash') == inputs_hash and
+            builds and os.path.basename(builds[-1]) == manifest.get('build')):
+        logger.info('Build %s is up to date (%.2fs)', builds[-1], time.time() - started)
+        return
 
-    # Zip the whole thing up, and move it to the builds dir.
-    local('cd {0}; zip -r {1} ./*; mv {1} {2}'.format(staging_dir, build_filename, builds_dir))
+    write_package(entries, os.path.join(builds_dir, build_filename))
+    with open(manifest_file, 'w') as manifest_contents:
+        json.dump({'inputs_hash': inputs_hash, 'build': build_filename}, manifest_contents, indent=2)
+    logger.info('Built %s: %d files in %.2fs (dependencies %.2fs, %s)', build_filename, len(entries),
+                time.time() - started, deps_seconds, 'cached' if cached else 'installed')
 
 
 @task
-def deploy(function_name=None, arn=None):
-    """Uploads the latest build of the function package to the Lambda ARN.
+def deploy(function_name=None, arn=None, s3_bucket=None, force=False, alias=None, role_name=None, max_workers=8):
+    """Uploads the latest build of the function package to one or more Lambda ARNs.
+
+    Targets are deployed concurrently, and a failure in one does not stop the others; a summary of each
+    target's result and latency is logged at the end. Nothing is uploaded to a target whose deployed CodeSha256
+    already matches the build. Packages are sent inline up to LAMBDA_INLINE_ZIP_LIMIT; larger ones (or any, if
+    s3_bucket is given) are staged in S3 under a key derived from their hash, and the function is pointed at the
+    S3 object.
 
     Args:
         function_name: (str) The Lambda function within the lambda/ directory to work on.
-        arn: (str) The ARN of the deployed function.
+        arn: (str) The ARN of the deployed function; or several, separated by semicolons.
+        s3_bucket: (str) The S3 bucket to stage the package in; '{region}' and '{account}' are replaced per target.
+        force: (bool) Upload the package even if the deployed code matches it.
+        alias: (str) Publish a version on each target, and point this alias at it.
+        role_name: (str) The IAM role to assume in target accounts other than the current one.
+        max_workers: (int) The most targets to deploy at once.
     """
     if not function_name:
         abort('Must provide function_name')
@@ -280,10 +1276,28 @@ def deploy(function_name=None, arn=None):
     latest_build = builds[-1]
     logging.info('Preparing to deploy build: {0}'.format(latest_build))
 
-    client = boto3.client('lambda')
-    with open(latest_build, 'rb') as zip_file:
-        response = client.update_function_code(FunctionName=arn, ZipFile=zip_file.read())
-        logger.info(json.dumps(response, indent=2))
+    local_sha256 = code_sha256(latest_build)
+    s3_key = '{0}/{1}.zip'.format(function_name, base64.b64decode(local_sha256).encode('hex'))
+    size = os.path.getsize(latest_build)
+    if size > LAMBDA_INLINE_ZIP_LIMIT and not s3_bucket:
+        abort('Build is {0} bytes, over the inline limit of {1}; deploy with s3_bucket'.format(
+            size, LAMBDA_INLINE_ZIP_LIMIT))
+
+    targets = [DeployTarget(target_arn) for target_arn in arn.split(';')]
+    clients = fleet_clients(targets, role_name, s3_bucket)
+    package = DeployPackage(latest_build, local_sha256, s3_bucket, s3_key)
+    pool = ThreadPool(min(int(max_workers), len(targets)))
+    try:
+        results = pool.map(lambda target: target.deploy(clients, package, alias, str(force).lower() == 'true'),
+                           targets)
+    finally:
+        pool.close()
+
+    for result in results:
+        logger.info('{0}: {1}{2} in {3:.2f}s'.format(result['arn'], result['result'],
+                    ' (version {0})'.format(result['version']) if result['version'] else '', result['seconds']))
+    if any(result['result'].startswith('failed') for result in results):
+        abort('Not every target was deployed successfully')
 
 
 
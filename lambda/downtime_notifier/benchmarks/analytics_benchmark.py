@@ -0,0 +1,142 @@
+"""Times CheckHistory's vectorized summary over millions of synthetic results, against a per-item Python loop.
+
+Each site is checked every 5 minutes; each check finds it down with a small chance, and a down site stays
+down for a few checks. Both ways must give the same uptime, outage counts and MTTR. With --load, a smaller
+history is also written to moto and read back with CheckHistory.load, in full and compact items.
+
+Usage: python benchmarks/analytics_benchmark.py [--rows N] [--sites N] [--load N]
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# The stand-ins shared with the tests.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+
+import numpy as np
+
+from downtime_notifier.analytics import CheckHistory
+
+
+INTERVAL = 300
+
+
+def synthetic_history(rows, sites, seed=0):
+    """(CheckHistory) rows results, spread evenly over sites, ending now."""
+    random = np.random.RandomState(seed)
+    per_site = rows // sites
+    end = int(time.time())
+    start = end - per_site * INTERVAL
+    target = np.repeat(np.arange(sites), per_site)
+    epoch = start + np.tile(np.arange(per_site, dtype=np.int64) * INTERVAL, sites)
+    # An outage starts on 0.5% of checks, and lasts 1 to 12 checks.
+    down = np.zeros(len(target), dtype=bool)
+    for length in range(1, 13):
+        starts = np.flatnonzero(random.random_sample(len(target)) < 0.005 / 12)
+        for offset in range(length):
+            down[np.minimum(starts + offset, len(target) - 1)] = True
+    latency_ms = random.lognormal(5, 0.6, len(target)).astype(np.float32)
+    latency_ms[random.random_sample(len(target)) < 0.01] = np.nan
+    return CheckHistory(['site-{0}'.format(i) for i in range(sites)], target, epoch, ~down, latency_ms, start, end)
+
+
+def loop_summary(history):
+    """(dict) Uptime, outage count and MTTR per site, computed one result at a time."""
+    result = {}
+    for (target, epoch, up) in zip(history.target.tolist(), history.epoch.tolist(), history.up.tolist()):
+        site = result.setdefault(target, {'checks': 0, 'up': 0, 'outages': 0, 'recovered': 0, 'recovery': 0,
+                                          'down_since': None})
+        site['checks'] += 1
+        if up:
+            site['up'] += 1
+            if site['down_since'] is not None:
+                site['recovered'] += 1
+                site['recovery'] += epoch - site['down_since']
+                site['down_since'] = None
+        elif site['down_since'] is None:
+            site['outages'] += 1
+            site['down_since'] = epoch
+    return dict((history.targets[t], (round(100.0 * s['up'] / s['checks'], 1), s['outages'],
+                                      round(float(s['recovery']) / s['recovered'], 1) if s['recovered'] else None))
+                for (t, s) in result.items())
+
+
+def load_from_moto(rows, sites):
+    """Write a history to moto, half as full result items and half as compact ones, and time reading it."""
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+    from moto import mock_dynamodb2
+    from downtime_notifier import AwsClients
+    from fakes import TABLE
+    from fakes import create_table
+
+    history = synthetic_history(rows, sites)
+    with mock_dynamodb2():
+        AwsClients.reset()
+        create_table()
+        with AwsClients.table(TABLE).batch_writer() as batch:
+            for (i, (target, epoch, up, latency_ms)) in enumerate(zip(
+                    history.target.tolist(), history.epoch.tolist(), history.up.tolist(),
+                    history.latency_ms.tolist())):
+                timings = None if latency_ms != latency_ms else [0, 0, 0, 0, int(round(latency_ms))]
+                if i % 2:
+                    item = {'TargetId': history.targets[target], 'Timestamp': '{0:010d}'.format(epoch),
+                            't': epoch, 'e': not up}
+                    key = 'p'
+                else:
+                    item = {'TargetId': history.targets[target], 'IsExceptional': not up,
+                            'Timestamp': str(datetime.datetime.utcfromtimestamp(epoch))}
+                    key = 'Timings'
+                if timings:
+                    item[key] = timings
+                batch.put_item(Item=item)
+        start = time.time()
+        loaded = CheckHistory.load(TABLE, history.targets, days=(history.end - history.start) // 86400 + 1,
+                                   end=history.end)
+        seconds = time.time() - start
+    assert (loaded.epoch == history.epoch).all() and (loaded.up == history.up).all()
+    fields = ('target', 'checks', 'uptime', 'outages', 'mttr', 'longest_outage')
+    assert [[row[f] for f in fields] for row in loaded.summary()] == [
+        [row[f] for f in fields] for row in history.summary()]
+    print('load: {0} results of {1} sites read from moto in {2:.2f}s, summaries match'.format(
+        len(loaded.epoch), sites, seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=2000000, help='Synthetic results to summarise.')
+    parser.add_argument('--sites', type=int, default=200, help='Sites to spread them over.')
+    parser.add_argument('--load', type=int, default=0, help='Results to write to moto and load back; 0 to skip.')
+    args = parser.parse_args()
+
+    start = time.time()
+    history = synthetic_history(args.rows, args.sites)
+    print('generated {0} results of {1} sites in {2:.2f}s'.format(len(history.epoch), args.sites,
+                                                                   time.time() - start))
+
+    start = time.time()
+    summary = history.summary()
+    vectorized = time.time() - start
+    outages = history.outages()
+    print('vectorized: {0:.3f}s ({1} outages, {2} ongoing)'.format(vectorized, len(outages['start']),
+                                                                  int(outages['ongoing'].sum())))
+
+    start = time.time()
+    looped = loop_summary(history)
+    loop = time.time() - start
+    print('loop:       {0:.3f}s ({1:.0f}x slower, without percentiles)'.format(loop, loop / vectorized))
+
+    for row in summary:
+        assert looped[row['target']] == (row['uptime'], row['outages'], row['mttr']), (row, looped[row['target']])
+    print('uptime, outages and MTTR match for all {0} sites'.format(len(summary)))
+
+    if args.load:
+        load_from_moto(args.load, min(args.sites, 20))
+
+
+if __name__ == '__main__':
+    main()
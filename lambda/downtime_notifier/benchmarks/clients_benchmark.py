@@ -0,0 +1,53 @@
+"""Measures the per-run cost of creating boto3 clients/resources, with and without the AwsClients registry.
+
+Usage: python benchmarks/clients_benchmark.py [site_count]
+
+No AWS calls are made; this only measures client and resource construction for one run's worth of
+StateTrackers, plus the SNS and KMS clients.
+"""
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import boto3
+
+from downtime_notifier import AwsClients
+from downtime_notifier import StateTracker
+
+
+class FakeChecker(object):
+    name = 'site'
+    url = 'http://127.0.0.1/'
+
+
+def unshared_run(site_count):
+    """One run's worth of construction, as before the registry: a resource per tracker."""
+    for i in range(site_count):
+        boto3.resource('dynamodb').Table('ResultTable')
+    boto3.client('sns')
+    boto3.client('kms')
+
+
+def shared_run(site_count):
+    """One run's worth of construction through the registry."""
+    timestamp = datetime.datetime.now()
+    for i in range(site_count):
+        StateTracker(FakeChecker(), 'ResultTable', timestamp)
+    AwsClients.client('sns')
+    AwsClients.client('kms')
+
+
+def main(site_count):
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+    for (label, run) in (('unshared', unshared_run), ('registry', shared_run)):
+        for run_number in ('cold', 'warm'):
+            start = time.time()
+            run(site_count)
+            print('{0:>8} {1}: {2:.3f}s for {3} sites'.format(label, run_number, time.time() - start, site_count))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,107 @@
+"""Compares body bytes transferred per run with and without conditional GETs, against a stub server and moto.
+
+The stub serves each site a page with an ETag, honouring If-None-Match with a 304; the page of every
+fifth site changes between runs. Validators are carried from run to run in the latest items, as in the
+handler.
+
+Usage: python benchmarks/conditional_benchmark.py [site_count] [body_kb]
+"""
+import datetime
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# The stand-ins shared with the tests.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+
+from moto import mock_dynamodb2
+
+from fakes import TABLE
+from fakes import create_table
+from stub_server import StubHandler
+from stub_server import start_stub_server
+
+
+EXPECTED_TEXT = 'Top Stories'
+RUNS = 4
+
+
+def versioned_handler(body_kb):
+    """(class) A handler serving a body_kb page per path, with an ETag of its version, and counting body bytes."""
+    filler = 'x' * (body_kb * 1024)
+
+    class VersionedHandler(StubHandler):
+        version = [0]
+        body_bytes = [0]
+        lock = threading.Lock()
+
+        def do_GET(self):
+            site = int(self.path.strip('/'))
+            # Every fifth site's page changes on every run.
+            etag = '"{0}-{1}"'.format(site, self.version[0] if site % 5 == 0 else 0)
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = EXPECTED_TEXT + filler
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(body)
+            with self.lock:
+                self.body_bytes[0] += len(body)
+    return VersionedHandler
+
+
+def run(server, site_count, conditional):
+    """Check every site once, recording results in bulk; return (seconds, body bytes sent, 304 count)."""
+    from downtime_notifier import BatchStateStore
+    from downtime_notifier import Checker
+    from downtime_notifier import StateTracker
+
+    handler = server.RequestHandlerClass
+    handler.body_bytes[0] = 0
+    checkers = [Checker('http://127.0.0.1:{0}/{1}'.format(server.server_port, i), 'site-{0}'.format(i),
+                        expected_text=EXPECTED_TEXT, conditional_get=conditional) for i in range(site_count)]
+    store = BatchStateStore(TABLE)
+    start = time.time()
+    if conditional:
+        latest = store.load_latest([c.name for c in checkers])
+        for checker in checkers:
+            item = latest.get(checker.name) or {}
+            checker.use_validators(item.get('ETag'), item.get('LastModified'))
+    for checker in checkers:
+        checker.run()
+    store.put_results([StateTracker(c, TABLE, datetime.datetime.now()) for c in checkers])
+    assert not any(c.exceptional for c in checkers), [c.message for c in checkers if c.exceptional]
+    return (time.time() - start, handler.body_bytes[0], len([c for c in checkers if c.not_modified]))
+
+
+def main(site_count, body_kb):
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+    from downtime_notifier import AwsClients
+    server = start_stub_server(versioned_handler(body_kb))
+    for conditional in (False, True):
+        with mock_dynamodb2():
+            from moto.core.models import responses_mock
+            responses_mock.add_passthru('http://127.0.0.1')
+            AwsClients.reset()
+            create_table()
+            for run_number in range(RUNS):
+                server.RequestHandlerClass.version[0] = run_number
+                (seconds, body_bytes, not_modified) = run(server, site_count, conditional)
+                print('{0:>11} run {1}: {2:.2f}s, {3} body bytes, {4}/{5} not modified'.format(
+                    'conditional' if conditional else 'full', run_number, seconds, body_bytes, not_modified,
+                    site_count))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50, int(sys.argv[2]) if len(sys.argv) > 2 else 256)
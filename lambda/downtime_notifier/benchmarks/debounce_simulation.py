@@ -0,0 +1,77 @@
+"""Runs a simulated sequence of check results through debounce and alert grouping, against moto.
+
+Prints what would be notified after each run, for a flapping site, a site that goes down for good, and a
+steady site; with and without debounce and a grouping window.
+
+Usage: python benchmarks/debounce_simulation.py
+"""
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# The stand-ins shared with the tests.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+
+from moto import mock_dynamodb2
+
+from downtime_notifier import AwsClients
+from fakes import FakeChecker
+from fakes import TABLE
+from fakes import create_table
+
+RUN_SECONDS = 300
+
+# Per run: is each site exceptional?
+SEQUENCES = {
+    'flapping': [False, True, False, True, False, True, False, False, False, False],
+    'outage':   [False, False, True, True, True, True, True, False, False, False],
+    'steady':   [False] * 10,
+}
+
+
+def simulate(confirm_after, window_seconds):
+    from downtime_notifier import AlertWindow
+    from downtime_notifier import BatchStateStore
+    from downtime_notifier import StateTracker
+
+    start = datetime.datetime(2026, 1, 1)
+    pages = 0
+    for run_number in range(len(SEQUENCES['steady'])):
+        timestamp = start + datetime.timedelta(seconds=run_number * RUN_SECONDS)
+        trackers = []
+        for (i, name) in enumerate(sorted(SEQUENCES)):
+            checker = FakeChecker(i, SEQUENCES[name][run_number])
+            checker.name = name
+            checker.confirm_after = confirm_after
+            trackers.append(StateTracker(checker, TABLE, timestamp))
+        BatchStateStore(TABLE).put_results(trackers)
+        summaries = [dict(name=t.checker.name, reason=t.reason) for t in trackers
+                     if t.notify and t.reason != 'first_check']
+        released = AlertWindow(TABLE, window_seconds).collect(
+            summaries, now=run_number * RUN_SECONDS + 1)
+        if released:
+            pages += 1
+        print('  run {0}: {1:<28} -> {2}'.format(
+            run_number, ' '.join('X' if SEQUENCES[n][run_number] else '.' for n in sorted(SEQUENCES)),
+            ', '.join('{0} {1}{2}'.format(a['name'], a['reason'],
+                                         ' x{0}'.format(a['changes']) if a.get('changes', 1) > 1 else '')
+                      for a in released) or '-'))
+    return pages
+
+
+def main():
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+    print('sites: {0}'.format(' '.join(sorted(SEQUENCES))))
+    for (confirm_after, window_seconds) in ((1, 0), (3, 0), (3, 900)):
+        with mock_dynamodb2():
+            AwsClients.reset()
+            create_table()
+            print('confirm_after={0}, alert_window_seconds={1}:'.format(confirm_after, window_seconds))
+            print('  {0} pages'.format(simulate(confirm_after, window_seconds)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Compares DNS lookups and wall time per run without and with the shared DnsCache, and with prefetching.
+
+The sites are spread over a few host names under .test, which a stand-in resolver answers with the stub
+server's address after a delay, as a slow VPC resolver would. Connections are closed between runs, so that
+every run connects afresh, as when servers close idle keep-alive connections.
+
+Usage: python benchmarks/dns_benchmark.py [site_count] [host_count] [lookup_ms] [engine]
+"""
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from stub_server import start_stub_server
+
+
+RUNS = 2
+MODES = (('uncached', 0, False), ('cached', 60, False), ('prefetched', 60, True))
+
+
+class SlowResolver(object):
+    """Stands in for socket.getaddrinfo: resolves .test names to localhost after a delay, and counts lookups."""
+
+    def __init__(self, lookup_seconds):
+        self.lookup_seconds = lookup_seconds
+        self.lookups = 0
+        self._lock = threading.Lock()
+        self._getaddrinfo = socket.getaddrinfo
+
+    def __call__(self, host, *args, **kwargs):
+        if host and host.endswith('.test'):
+            with self._lock:
+                self.lookups += 1
+            time.sleep(self.lookup_seconds)
+            host = '127.0.0.1'
+        return self._getaddrinfo(host, *args, **kwargs)
+
+
+def main(site_count, host_count, lookup_ms, engine_name):
+    from downtime_notifier import Checker
+    from downtime_notifier import DnsCache
+    from downtime_notifier import SessionPool
+    from downtime_notifier import engine_from_config
+
+    server = start_stub_server(host='')
+    resolver = SlowResolver(lookup_ms / 1000.0)
+    socket.getaddrinfo = resolver
+
+    print('{0} sites on {1} hosts, {2}ms per lookup, {3} engine'.format(site_count, host_count, lookup_ms,
+                                                                       engine_name))
+    print('{0:>10} {1:>4} {2:>8} {3:>11} {4:>10} {5:>13} {6:>9}'.format(
+        'mode', 'run', 'lookups', 'cache hits', 'wall (s)', 'check DNS (s)', 'failures'))
+    for (mode, ttl, prefetch) in MODES:
+        DnsCache.configure(ttl)
+        DnsCache.invalidate()
+        for run in range(RUNS):
+            SessionPool.reset()
+            checkers = [Checker(url='http://host-{0}.test:{1}/site/{2}'.format(i % host_count, server.server_port, i),
+                                name='site-{0}'.format(i), expected_text='Top Stories') for i in range(site_count)]
+            lookups = resolver.lookups
+            hits = DnsCache.stats()['hits']
+            start = time.time()
+            if prefetch:
+                DnsCache.prefetch([c.hostname for c in checkers])
+            engine_from_config({'check_engine': engine_name}).run(checkers)
+            wall = time.time() - start
+            dns_seconds = sum(c.timing.phases['dns'] for c in checkers if c.timing)
+            print('{0:>10} {1:>4} {2:>8} {3:>11} {4:>10.2f} {5:>13.2f} {6:>9}'.format(
+                mode, run, resolver.lookups - lookups, DnsCache.stats()['hits'] - hits, wall, dns_seconds,
+                len([c for c in checkers if c.exceptional])))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(int(args[0]) if len(args) > 0 else 200, int(args[1]) if len(args) > 1 else 20,
+         int(args[2]) if len(args) > 2 else 50, args[3] if len(args) > 3 else 'pool')
@@ -0,0 +1,59 @@
+"""Compares wall time and peak RSS of the check engines against a local stub server.
+
+Usage: python benchmarks/engine_benchmark.py [site_count ...]
+
+Each (engine, site count) pair runs in its own subprocess, so that peak RSS is measured in isolation.
+"""
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from stub_server import start_stub_server
+
+
+ENGINES = ['threads', 'pool']
+SITE_COUNTS = [100, 1000, 10000]
+
+
+def run_one(engine_name, site_count):
+    """Run the given engine over site_count checks of the stub server; print 'wall_seconds peak_rss_kb'."""
+    from downtime_notifier import Checker
+    from downtime_notifier import engine_from_config
+
+    server = start_stub_server()
+    url = 'http://127.0.0.1:{0}'.format(server.server_port)
+    checkers = [Checker(url='{0}/site/{1}'.format(url, i), name='site-{0}'.format(i), expected_text='Top Stories')
+                for i in range(site_count)]
+
+    start = time.time()
+    engine_from_config({'check_engine': engine_name}).run(checkers)
+    wall = time.time() - start
+
+    failures = len([c for c in checkers if c.exceptional])
+    print('{0:.3f} {1} {2}'.format(wall, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, failures))
+
+
+def main(site_counts):
+    print('{0:>8} {1:>8} {2:>10} {3:>14} {4:>9}'.format('engine', 'sites', 'wall (s)', 'peak RSS (MB)', 'failures'))
+    for site_count in site_counts:
+        for engine_name in ENGINES:
+            proc = subprocess.Popen([sys.executable, __file__, '--run', engine_name, str(site_count)],
+                                    stdout=subprocess.PIPE, stderr=open(os.devnull, 'w'))
+            output = proc.communicate()[0].strip().split('\n')[-1]
+            if proc.returncode:
+                print('{0:>8} {1:>8} {2:>10}'.format(engine_name, site_count, 'FAILED'))
+                continue
+            wall, rss_kb, failures = output.split()
+            print('{0:>8} {1:>8} {2:>10} {3:>14.1f} {4:>9}'.format(
+                engine_name, site_count, wall, int(rss_kb) / 1024.0, failures))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--run':
+        run_one(sys.argv[2], int(sys.argv[3]))
+    else:
+        main([int(n) for n in sys.argv[1:]] or SITE_COUNTS)
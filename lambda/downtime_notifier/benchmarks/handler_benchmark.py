@@ -0,0 +1,270 @@
+"""Load-tests index.handler end to end, against a local fake fleet of sites and moto DynamoDB, SNS and KMS.
+
+Each site is served from its own loopback address (127.x.y.z), so that per-host limits apply as they would
+to a real fleet; with --hosts, the sites share that many. Each site count runs in its own subprocess (so that peak RSS is measured in isolation), with a fresh table:
+the first run records every site for the first time, and the later, steady-state runs are reported on.
+For each, it reports sites/sec, p50/p99 per-check latency (from the function's own EMF TotalTime metrics),
+peak RSS, and the AWS API calls of a steady run. The function runs with the settings of lambda_config/env.yaml,
+overridden by any --env options, and with the SNS topic ARN encrypted by the KMS stub.
+
+With --save, the results are written to a baseline file, keyed by scenario; with --compare, they are checked
+against it, and the exit status is 1 if any has regressed: sites/sec or memory worse by more than --tolerance,
+p99 latency worse by more than --tolerance (and 10ms), or any more AWS calls per run.
+
+Usage: python benchmarks/handler_benchmark.py [--sites 100,1000] [--latency-ms 20] [--failure-rate 0.05]
+                                              [--body-kb 16] [--hosts 0] [--runs 3] [--env key=value ...]
+                                              [--save | --compare] [--baseline FILE] [--tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import StringIO
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# The stand-ins shared with the tests.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+
+from stub_server import StubHandler
+from stub_server import start_stub_server
+
+
+EXPECTED_TEXT = 'Top Stories'
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'handler.json')
+# Below this, a change in p99 latency is noise rather than a regression.
+LATENCY_SLACK_MS = 10
+
+
+def fleet_handler(site_count, latency_ms, failure_rate, body_kb):
+    """(class) A handler serving each site '/<i>' with latency; a failure_rate share of them always fail with 500."""
+    failing = set(random.Random(site_count).sample(range(site_count), int(site_count * failure_rate)))
+    body = 'x' * max(0, body_kb * 1024 - len(EXPECTED_TEXT)) + EXPECTED_TEXT
+
+    class FleetHandler(StubHandler):
+        latency = latency_ms / 1000.0
+
+        def do_GET(self):
+            self.body = body
+            if int(self.path.strip('/')) not in failing:
+                return StubHandler.do_GET(self)
+            time.sleep(self.latency)
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+    return FleetHandler
+
+
+def host_address(i):
+    """(str) The i-th of the loopback addresses standing for distinct site hosts."""
+    return '127.{0}.{1}.{2}'.format(1 + i // 62500, i // 250 % 250 + 1, i % 250 + 1)
+
+
+def percentile(values, p):
+    """(int) The p-th percentile of the values, by nearest rank; None if there are none."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def write_config(config_dir, overrides):
+    """Write the function's env.yaml, with overrides, to config_dir; return the path."""
+    import yaml
+    from downtime_notifier import config
+    env = {}
+    for config_file in config.CONFIG_FILES:
+        if os.path.basename(config_file) == 'env.yaml':
+            with open(config_file) as f:
+                env.update(yaml.safe_load(f))
+    env.update(overrides)
+    path = os.path.join(config_dir, 'env.yaml')
+    with open(path, 'w') as f:
+        yaml.safe_dump(env, f, default_flow_style=False)
+    return path
+
+
+def scheduled_event(run_number, tick_seconds):
+    """(dict) A scheduled event for the run_number-th tick from now; each run is a tick of its own."""
+    epoch = time.time() + run_number * tick_seconds
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(epoch))}
+
+
+def run_scenario(scenario):
+    """Run the handler for one scenario, in this process; print the results as a JSON line."""
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+    import boto3
+    from moto import mock_dynamodb2, mock_ec2, mock_kms, mock_sns
+    from moto.core.models import responses_mock
+    from fakes import AwsCallCounter
+    from fakes import TABLE
+    from fakes import create_table
+    from downtime_notifier import config
+    from downtime_notifier import AwsClients
+
+    mocks = [mock_dynamodb2(), mock_ec2(), mock_kms(), mock_sns()]
+    for mock in mocks:
+        mock.start()
+    responses_mock.add_passthru('http://127.')
+    counter = AwsCallCounter().install()
+    AwsClients.reset()
+
+    site_count = scenario['sites']
+    server = start_stub_server(fleet_handler(
+        site_count, scenario['latency_ms'], scenario['failure_rate'], scenario['body_kb']), host='')
+    hosts = scenario['hosts'] or site_count
+    create_table()
+    topic_arn = boto3.client('sns').create_topic(Name='downtime')['TopicArn']
+    kms = boto3.client('kms')
+    key_id = kms.create_key()['KeyMetadata']['KeyId']
+    ciphertext = kms.encrypt(KeyId=key_id, Plaintext=topic_arn)['CiphertextBlob']
+
+    config_dir = tempfile.mkdtemp()
+    try:
+        overrides = dict(scenario['env'], dynamo_table=TABLE, shard_count=1,
+                         encrypted_topic_arn=ciphertext.encode('base64').replace('\n', ''),
+                         sites=[{'name': 'site-{0}'.format(i), 'expected_text': EXPECTED_TEXT,
+                                 'url': 'http://{0}:{1}/{2}'.format(host_address(i % hosts), server.server_port, i)}
+                                for i in range(site_count)])
+        config.CONFIG_FILES = [write_config(config_dir, overrides)]
+        config.PARSED_CONFIG_FILE = os.path.join(config_dir, 'config.json')
+        import index
+    finally:
+        shutil.rmtree(config_dir)
+
+    runs = []
+    for run_number in range(scenario['runs']):
+        counter.reset()
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()  # The function's EMF metrics lines.
+        try:
+            start = time.time()
+            index.handler(scheduled_event(run_number, index.CONFIG['env'].get('tick_seconds', 300)),
+                          index.LocalContext(timeout=900))
+            seconds = time.time() - start
+            emf = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        latencies = []
+        for line in emf.splitlines():
+            document = json.loads(line)
+            if 'TotalTime' in document and 'Site' not in document:
+                total = document['TotalTime']
+                latencies.extend(total if isinstance(total, list) else [total])
+        runs.append({'seconds': seconds, 'latencies': latencies, 'aws_calls': dict(counter.calls)})
+
+    steady = runs[1:] or runs
+    seconds = sorted(r['seconds'] for r in steady)[len(steady) // 2]
+    latencies = [ms for r in steady for ms in r['latencies']]
+    print(json.dumps({
+        'first_run_seconds': round(runs[0]['seconds'], 3),
+        'sites_per_sec': round(site_count / seconds, 1),
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+        'aws_calls': steady[-1]['aws_calls']}))
+    sys.stdout.flush()
+    os._exit(0)  # Skip tearing down the stub server's and the engine's threads.
+
+
+def scenario_key(scenario):
+    """(str) The key of a scenario in the baseline file."""
+    env = ' '.join('{0}={1}'.format(k, v) for (k, v) in sorted(scenario['env'].items()))
+    return 'sites={0} latency_ms={1} failure_rate={2} body_kb={3} hosts={4} {5}'.format(
+        scenario['sites'], scenario['latency_ms'], scenario['failure_rate'], scenario['body_kb'], scenario['hosts'],
+        env).strip()
+
+
+def regressions(result, baseline, tolerance):
+    """(list) Descriptions of how the result has regressed from the baseline."""
+    found = []
+    if result['sites_per_sec'] < baseline['sites_per_sec'] * (1 - tolerance):
+        found.append('sites/sec {0} < {1}'.format(result['sites_per_sec'], baseline['sites_per_sec']))
+    if result['p99_ms'] > max(baseline['p99_ms'] * (1 + tolerance), baseline['p99_ms'] + LATENCY_SLACK_MS):
+        found.append('p99 {0}ms > {1}ms'.format(result['p99_ms'], baseline['p99_ms']))
+    if result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        found.append('peak RSS {0}MB > {1}MB'.format(result['peak_rss_mb'], baseline['peak_rss_mb']))
+    for (operation, calls) in sorted(result['aws_calls'].items()):
+        if calls > baseline['aws_calls'].get(operation, 0):
+            found.append('{0} calls {1} > {2}'.format(operation, calls, baseline['aws_calls'].get(operation, 0)))
+    return found
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Load-test index.handler end to end.')
+    parser.add_argument('--sites', default='100,1000', help='Comma-separated site counts.')
+    parser.add_argument('--latency-ms', type=int, default=20, help='Latency of each fake site.')
+    parser.add_argument('--failure-rate', type=float, default=0.05, help='Share of sites that return 500.')
+    parser.add_argument('--body-kb', type=int, default=16, help='Body size of each fake site.')
+    parser.add_argument('--hosts', type=int, default=0, help='Distinct hosts the sites share; 0 for one each.')
+    parser.add_argument('--runs', type=int, default=3, help='Handler runs per site count; the first is cold.')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Override an env.yaml setting, e.g. check_engine=pool; values are YAML.')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='The baseline file.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative regression.')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--save', action='store_true', help='Save the results as the baseline.')
+    group.add_argument('--compare', action='store_true', help='Fail if the results regress from the baseline.')
+    group.add_argument('--run', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    import yaml
+    args = parse_args(argv)
+    if args.run:
+        return run_scenario(json.loads(args.run))
+
+    env = dict((k, yaml.safe_load(v)) for (k, v) in (o.split('=', 1) for o in args.env))
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+
+    print('{0:>7} {1:>10} {2:>10} {3:>8} {4:>8} {5:>9}  {6}'.format(
+        'sites', 'first (s)', 'sites/sec', 'p50 ms', 'p99 ms', 'RSS (MB)', 'AWS calls per steady run'))
+    failed = False
+    for site_count in [int(s) for s in args.sites.split(',')]:
+        scenario = {'sites': site_count, 'latency_ms': args.latency_ms, 'failure_rate': args.failure_rate,
+                    'body_kb': args.body_kb, 'hosts': args.hosts, 'runs': args.runs, 'env': env}
+        proc = subprocess.Popen([sys.executable, __file__, '--run', json.dumps(scenario)],
+                                stdout=subprocess.PIPE, stderr=open(os.devnull, 'w'))
+        output = proc.communicate()[0].strip().split('\n')[-1]
+        if proc.returncode:
+            print('{0:>7} FAILED'.format(site_count))
+            failed = True
+            continue
+        result = json.loads(output)
+        print('{0:>7} {1:>10} {2:>10} {3:>8} {4:>8} {5:>9}  {6}'.format(
+            site_count, result['first_run_seconds'], result['sites_per_sec'], result['p50_ms'], result['p99_ms'],
+            result['peak_rss_mb'], ', '.join('{0}={1}'.format(k, v) for (k, v) in sorted(result['aws_calls'].items()))))
+
+        key = scenario_key(scenario)
+        if args.save:
+            baselines[key] = result
+        elif args.compare:
+            if key not in baselines:
+                print('        no baseline for "{0}"'.format(key))
+                continue
+            for regression in regressions(result, baselines[key], args.tolerance):
+                print('        REGRESSION: {0}'.format(regression))
+                failed = True
+
+    if args.save:
+        if not os.path.isdir(os.path.dirname(args.baseline)):
+            os.makedirs(os.path.dirname(args.baseline))
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print('Saved baselines to {0}'.format(args.baseline))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
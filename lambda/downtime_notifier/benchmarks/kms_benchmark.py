@@ -0,0 +1,70 @@
+"""Measures the time configuration() takes with encrypted keys, against a local KMS stub with latency.
+
+Usage: python benchmarks/kms_benchmark.py [encrypted_key_count] [kms_latency_ms]
+"""
+import base64
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from downtime_notifier import config
+from downtime_notifier import AwsClients
+from downtime_notifier import SecretCache
+
+
+class StubKms(object):
+    """Decrypts by echoing the ciphertext, after a fixed latency."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def decrypt(self, CiphertextBlob):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return {'Plaintext': CiphertextBlob}
+
+
+def main(key_count, latency_ms):
+    config_dir = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(config_dir, 'env.yaml'), 'w') as f:
+            for i in range(key_count):
+                f.write('encrypted_secret_{0}: {1}\n'.format(i, base64.b64encode('plaintext-{0}'.format(i))))
+        config.CONFIG_FILES = [os.path.join(config_dir, 'env.yaml')]
+
+        for (label, decrypt_secrets, max_workers) in (('serial', 'eager', 1),
+                                                      ('eager', 'eager', SecretCache.MAX_WORKERS),
+                                                      ('lazy', 'lazy', SecretCache.MAX_WORKERS)):
+            with open(os.path.join(config_dir, 'env.yaml'), 'a') as f:
+                f.write('decrypt_secrets: {0}\n'.format(decrypt_secrets))
+            kms = StubKms(latency_ms / 1000.0)
+            AwsClients.register('kms', kms)
+            SecretCache.invalidate()
+            SecretCache.MAX_WORKERS = max_workers
+
+            start = time.time()
+            loaded = config.configuration()
+            startup = time.time() - start
+            start = time.time()
+            loaded['env']['secret_0']
+            first_read = time.time() - start
+            start = time.time()
+            loaded = config.configuration()
+            warm = time.time() - start
+            print('{0:>6}: startup {1:.3f}s, first read {2:.3f}s, warm startup {3:.3f}s; {4} decrypt calls'.format(
+                label, startup, first_read, warm, kms.calls))
+    finally:
+        shutil.rmtree(config_dir)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 50)
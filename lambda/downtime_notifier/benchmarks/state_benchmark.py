@@ -0,0 +1,88 @@
+"""Counts DynamoDB API calls per run of the per-site, batched and compact state paths, against moto.
+
+Also reports the stored size of the table after the runs, and the cost of a history read from rollups.
+
+Usage: python benchmarks/state_benchmark.py [site_count]
+"""
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# The stand-ins shared with the tests.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+
+from moto import mock_dynamodb2
+
+from downtime_notifier import AwsClients
+from fakes import AwsCallCounter
+from fakes import FakeChecker
+from fakes import TABLE
+from fakes import create_table
+
+
+def run(mode, site_count, run_number):
+    from downtime_notifier import StateTracker
+    from downtime_notifier import BatchStateStore
+    from downtime_notifier import HistoryStore
+
+    # Every third site flips state on each run.
+    checkers = [FakeChecker(i, bool(run_number % 2) and i % 3 == 0) for i in range(site_count)]
+    trackers = [StateTracker(c, TABLE, datetime.datetime.now()) for c in checkers]
+    if mode == 'compact':
+        BatchStateStore(TABLE, history=HistoryStore(TABLE)).put_results(trackers)
+    elif mode == 'batched':
+        BatchStateStore(TABLE).put_results(trackers)
+    else:
+        for tracker in trackers:
+            tracker.put_result()
+    return len([t for t in trackers if t.notify])
+
+
+def main(site_count):
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+    from downtime_notifier import HistoryStore
+    for mode in ('per-site', 'batched', 'compact'):
+        with mock_dynamodb2():
+            counter = AwsCallCounter().install()
+            AwsClients.reset()
+            create_table()
+            for run_number in range(3):
+                counter.reset()
+                start = time.time()
+                notified = run(mode, site_count, run_number)
+                print('{0:>8} run {1}: {2:.2f}s, {3} to notify; calls: {4}'.format(
+                    mode, run_number, time.time() - start, notified, counter))
+
+            items = scan_all()
+            raw = [item for item in items if item['Timestamp'] != 'latest' and '#' not in item['Timestamp']]
+            print('{0:>8} stored: {1} items, {2} bytes; {3} bytes per raw result'.format(
+                mode, len(items), sum(item_size(i) for i in items), sum(item_size(i) for i in raw) // len(raw)))
+            if mode == 'compact':
+                counter.reset()
+                start = time.time()
+                summary = HistoryStore(TABLE).summarize('site-3', 'hour')
+                print('{0:>8} history of one site from rollups: {1:.3f}s, calls: {2}; {3}'.format(
+                    mode, time.time() - start, counter, summary))
+
+
+def scan_all():
+    table = AwsClients.table(TABLE)
+    response = table.scan()
+    items = response['Items']
+    while 'LastEvaluatedKey' in response:
+        response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
+        items.extend(response['Items'])
+    return items
+
+
+def item_size(item):
+    """Approximately as DynamoDB counts it: the lengths of attribute names and values."""
+    return sum(len(name) + len(str(value)) for (name, value) in item.items())
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,50 @@
+"""A local HTTP server standing in for the monitored sites, for use by the benchmarks."""
+import BaseHTTPServer
+import SocketServer
+import threading
+import time
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Responds 200 to every GET with a small page containing 'Top Stories'."""
+
+    protocol_version = 'HTTP/1.1'
+    body = '<html><body>Top Stories</body></html>'
+    latency = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        """Clients closing connections early (e.g. once expected text is found) are expected; ignore them."""
+        pass
+
+
+def start_stub_server(handler=StubHandler, host='127.0.0.1'):
+    """Start a stub server on an ephemeral localhost port in a daemon thread.
+
+    Args:
+        handler: (class) The request handler class to serve with.
+        host: (str) The address to listen on; '' for all, so that any 127.x.y.z address can stand for a host.
+    Returns:
+        (StubServer) The running server; its base url is 'http://127.0.0.1:<server_port>'.
+    """
+    server = StubServer((host, 0), handler)
+    thread = threading.Thread(target=server.serve_forever, name='StubServer')
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,83 @@
+"""Compares reading whole bodies against the streaming validator, on multi-MB local fixtures.
+
+Usage: python benchmarks/validator_benchmark.py [body_mb]
+
+Each (mode, fixture) pair runs in its own subprocess, so that peak RSS is measured in isolation.
+"""
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from stub_server import StubHandler
+from stub_server import start_stub_server
+
+
+EXPECTED_TEXT = 'Top Stories'
+FIXTURES = ['start', 'middle', 'end', 'missing', 'code-only']
+MODES = ['whole', 'streaming']
+
+
+def fixture_handler(body_mb):
+    """(class) A handler serving a body_mb body, with EXPECTED_TEXT placed according to the path."""
+    filler = 'x' * (body_mb * 1024 * 1024 / 2)
+    bodies = {'/start': EXPECTED_TEXT + filler + filler,
+              '/middle': filler + EXPECTED_TEXT + filler,
+              '/end': filler + filler + EXPECTED_TEXT,
+              '/missing': filler + filler,
+              '/code-only': filler + filler}
+
+    class FixtureHandler(StubHandler):
+        def do_GET(self):
+            self.body = bodies[self.path]
+            StubHandler.do_GET(self)
+    return FixtureHandler
+
+
+def run_one(mode, fixture, body_mb):
+    """Check the fixture 10 times, without retries; print 'wall_seconds peak_rss_kb body_bytes_per_check found'."""
+    import requests
+    from downtime_notifier import Checker
+
+    server = start_stub_server(fixture_handler(body_mb))
+    url = 'http://127.0.0.1:{0}/{1}'.format(server.server_port, fixture)
+    expected_text = None if fixture == 'code-only' else EXPECTED_TEXT
+
+    start = time.time()
+    for i in range(10):
+        if mode == 'whole':
+            response = requests.get(url)
+            found = expected_text in response.text if expected_text else True
+            bytes_read = len(response.content)
+        else:
+            checker = Checker(url=url, name=fixture, expected_text=expected_text)
+            found = checker.attempt()
+            bytes_read = checker.bytes_read
+    wall = time.time() - start
+    print('{0:.3f} {1} {2} {3}'.format(wall, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, bytes_read, found))
+
+
+def main(body_mb):
+    print('{0:>10} {1:>10} {2:>10} {3:>14} {4:>14} {5:>6}'.format(
+        'fixture', 'mode', 'wall (s)', 'peak RSS (MB)', 'bytes/check', 'found'))
+    for fixture in FIXTURES:
+        for mode in MODES:
+            proc = subprocess.Popen([sys.executable, __file__, '--run', mode, fixture, str(body_mb)],
+                                    stdout=subprocess.PIPE, stderr=open(os.devnull, 'w'))
+            output = proc.communicate()[0].strip().split('\n')[-1]
+            if proc.returncode:
+                print('{0:>10} {1:>10} {2:>10}'.format(fixture, mode, 'FAILED'))
+                continue
+            wall, rss_kb, bytes_read, found = output.split()
+            print('{0:>10} {1:>10} {2:>10} {3:>14.1f} {4:>14} {5:>6}'.format(
+                fixture, mode, wall, int(rss_kb) / 1024.0, bytes_read, found))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 5 and sys.argv[1] == '--run':
+        run_one(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 8)
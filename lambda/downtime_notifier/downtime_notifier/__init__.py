@@ -1,5 +1,29 @@
+"""Checks sites, tracks their state in DynamoDB, and notifies of changes; the modules behind index.handler.
+
+The package is imported on every cold start, so the modules it imports use only the standard library at module
+level. Third-party modules (boto3, requests, retrying) are imported within the functions that use them, when
+first used, and so cost nothing on invocations that do not need them. Modules that the package does not
+import, such as timed_connections (imported by SessionPool on first use) and analytics, may import them freely.
+"""
 from config import configuration
 from localcontext import LocalContext
 from utility import Utility
+from clients import AwsClients
+from secret_cache import SecretCache
 from checker import Checker
 from state_tracker import StateTracker
+from state_tracker import BatchStateStore
+from history import HistoryStore
+from history import LatencyHistogram
+from alerts import AlertWindow
+from engine import engine_from_config
+from scheduler import CheckScheduler
+from registry import SiteRegistry
+from due_schedule import DueSchedule
+from sharding import shard_sites
+from sharding import LambdaShardRunner
+from sharding import LocalShardRunner
+from sessions import SessionPool
+from dns_cache import DnsCache
+from timing import CheckTiming
+from metrics import RunMetrics
@@ -0,0 +1,60 @@
+import logging
+import time
+
+from clients import AwsClients
+
+logger = logging.getLogger()
+
+
+class AlertWindow(object):
+    """Groups notifications across runs, so that one message covers every change within a time window.
+
+    Alerts are held in a single item of the result table until the window that the first of them opened has
+    passed; then they are all released together. A site that changes state more than once in a window is
+    reported once, with its latest state and the number of changes.
+    """
+
+    TARGET_ID = '#alerts'
+    TIMESTAMP = 'pending'
+
+    def __init__(self, dynamo_table_name, window_seconds=0):
+        """
+        Args:
+            dynamo_table_name: (str) Name of the DynamoDB result table.
+            window_seconds: (int) How long to hold alerts for; 0 to release every run's alerts at once.
+        """
+        assert(dynamo_table_name)
+        self.table_name = dynamo_table_name
+        self.window_seconds = int(window_seconds or 0)
+
+    def collect(self, summaries, now=None):
+        """Add a run's alerts to the window, and release the window's alerts if it has closed.
+
+        Args:
+            summaries: (list) Summaries (see StateTracker.summary) of this run's state changes.
+            now: (float) The current epoch time.
+        Returns:
+            (list) The summaries to notify now; empty while the window is still open.
+        """
+        if not self.window_seconds:
+            return summaries
+        now = int(now or time.time())
+        table = AwsClients.table(self.table_name)
+        key = {'TargetId': self.TARGET_ID, 'Timestamp': self.TIMESTAMP}
+        item = table.get_item(Key=key, ConsistentRead=True).get('Item')
+        if not item and not summaries:
+            return []
+
+        alerts = dict((alert['name'], alert) for alert in (item or {}).get('Alerts', []))
+        for summary in summaries:
+            previous = alerts.get(summary['name'])
+            alerts[summary['name']] = dict(summary, changes=int(previous['changes']) + 1 if previous else 1)
+        opened_at = int(item['OpenedAt']) if item else now
+
+        if now - opened_at >= self.window_seconds:
+            table.delete_item(Key=key)
+            logger.info('Releasing {0} alerts held since {1}'.format(len(alerts), opened_at))
+            return sorted(alerts.values(), key=lambda alert: alert['name'])
+        table.put_item(Item=dict(key, OpenedAt=opened_at, Alerts=alerts.values()))
+        logger.info('Holding {0} alerts until {1}'.format(len(alerts), opened_at + self.window_seconds))
+        return []
@@ -0,0 +1,266 @@
+"""Uptime, outage and latency analytics over the check history in the result table, computed with NumPy.
+
+NumPy is not a dependency of the function itself, so this module is not imported by the package; it is for
+running where the history is analysed, e.g. by `fab analytics`.
+"""
+import csv
+import logging
+import os
+import time
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from clients import AwsClients
+from history import HistoryStore
+
+logger = logging.getLogger()
+
+
+class CheckHistory(object):
+    """The check results of many sites over a time range, held as columns: one array per attribute.
+
+    Rows are sorted by site, then time. Sites are identified by their index in `targets`; each row has the
+    epoch time of the check, whether the site was up, and the total request time in milliseconds (NaN where
+    none was recorded, e.g. for results written before timings were).
+    """
+
+    PERCENTILES = (50, 90, 99)
+    # The position of the total time within a result's Timings (see CheckTiming.PHASES).
+    TOTAL_TIMING = 4
+
+    def __init__(self, targets, target, epoch, up, latency_ms, start, end):
+        """
+        Args:
+            targets: (list) The names of the sites.
+            target: (numpy.ndarray) The index in targets of each row's site.
+            epoch: (numpy.ndarray) The epoch time of each row.
+            up: (numpy.ndarray) Whether the site was up, per row.
+            latency_ms: (numpy.ndarray) The total request time of each row.
+            start: (int) The epoch time of the start of the range.
+            end: (int) The epoch time of the end of the range.
+        """
+        order = np.lexsort((epoch, target))
+        self.targets = list(targets)
+        self.target = target[order]
+        self.epoch = epoch[order]
+        self.up = up[order]
+        self.latency_ms = latency_ms[order]
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def load(cls, dynamo_table_name, targets, days=30, end=None, max_workers=8):
+        """Stream the history of the given sites from the result table, querying many sites in parallel.
+
+        Both full result items and compact ones (see HistoryStore) are read; the latest items, rollups and
+        other bookkeeping items are not.
+
+        Args:
+            dynamo_table_name: (str) Name of the DynamoDB result table.
+            targets: (list) The names of the sites.
+            days: (int) The length of the range, ending at end.
+            end: (int) The epoch time of the end of the range; defaults to now.
+            max_workers: (int) The most sites queried at once.
+        Returns:
+            (CheckHistory) The history.
+        """
+        end = int(end or time.time())
+        start = end - int(days) * 86400
+        started = time.time()
+        pool = ThreadPool(max(1, min(int(max_workers), len(targets))))
+        try:
+            columns = pool.map(lambda name: cls._query_target(dynamo_table_name, name, start, end), targets)
+        finally:
+            pool.close()
+        counts = [len(epoch) for (epoch, up, latency_ms) in columns]
+        history = cls(targets,
+                      np.repeat(np.arange(len(targets)), counts),
+                      np.concatenate([c[0] for c in columns] or [np.zeros(0, np.int64)]),
+                      np.concatenate([c[1] for c in columns] or [np.zeros(0, bool)]),
+                      np.concatenate([c[2] for c in columns] or [np.zeros(0, np.float32)]),
+                      start, end)
+        logger.info('Loaded {0} results of {1} sites in {2:.2f}s'.format(
+            len(history.epoch), len(targets), time.time() - started))
+        return history
+
+    @classmethod
+    def _query_target(cls, dynamo_table_name, name, start, end):
+        """(tuple) The epoch, up and latency_ms columns of one site's results in the range."""
+        client = AwsClients.client('dynamodb')
+        paginator = client.get_paginator('query')
+        # Full result items are keyed by str(datetime) (in the function's time zone; UTC on Lambda), and
+        # compact ones by a zero-padded epoch; the two sort apart, so each is its own key range, and neither
+        # includes the latest items or rollups.
+        ranges = [('full', time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(start)),
+                   time.strftime('%Y-%m-%d %H:%M:%S.999999', time.gmtime(end))),
+                  ('compact', '{0:010d}'.format(start), '{0:010d}'.format(end))]
+        timestamps = []
+        epochs = []
+        up = []
+        latency_ms = []
+        for (form, low, high) in ranges:
+            pages = paginator.paginate(
+                TableName=dynamo_table_name,
+                KeyConditionExpression='#id = :id AND #ts BETWEEN :low AND :high',
+                ProjectionExpression='#ts, IsExceptional, Timings, #t, #e, #p',
+                ExpressionAttributeNames={'#id': 'TargetId', '#ts': 'Timestamp', '#t': HistoryStore.TIME,
+                                          '#e': HistoryStore.EXCEPTIONAL, '#p': HistoryStore.TIMINGS},
+                ExpressionAttributeValues={':id': {'S': name}, ':low': {'S': low}, ':high': {'S': high}})
+            for page in pages:
+                for item in page['Items']:
+                    if form == 'compact':
+                        epochs.append(int(item[HistoryStore.TIME]['N']))
+                        up.append(not item[HistoryStore.EXCEPTIONAL]['BOOL'])
+                        timings = item.get(HistoryStore.TIMINGS)
+                    else:
+                        timestamps.append(item['Timestamp']['S'])
+                        up.append(not item['IsExceptional']['BOOL'])
+                        timings = item.get('Timings')
+                    latency_ms.append(float(timings['L'][cls.TOTAL_TIMING]['N']) if timings else np.nan)
+        full_epochs = np.array(timestamps, dtype='datetime64[us]').astype('datetime64[s]').astype(np.int64)
+        return (np.concatenate([full_epochs, np.array(epochs, dtype=np.int64)]),
+                np.array(up, dtype=bool), np.array(latency_ms, dtype=np.float32))
+
+    def uptime(self):
+        """(numpy.ndarray) The percentage of each site's checks that found it up; NaN for sites with none."""
+        checks = np.bincount(self.target, minlength=len(self.targets))
+        up = np.bincount(self.target, weights=self.up, minlength=len(self.targets))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return 100.0 * up / checks
+
+    def outages(self):
+        """The outages of every site: runs of checks finding it down, from the first to the next check up.
+
+        Returns:
+            (dict) Arrays of each outage's target, start and end epoch, duration in seconds, and whether it is
+            ongoing (the site was still down at its last check); an ongoing outage ends at the end of the range.
+        """
+        down = ~self.up
+        same_target = np.concatenate([[False], self.target[1:] == self.target[:-1]])
+        previous_down = np.concatenate([[False], down[:-1]]) & same_target
+        starts = np.flatnonzero(down & ~previous_down)
+        recoveries = np.flatnonzero(self.up & previous_down)
+
+        # Outages and recoveries alternate within a site; so an outage ends at the first recovery after it,
+        # unless that is another site's (or there is none), when the outage is ongoing.
+        ends = np.append(recoveries, len(self.target))[np.searchsorted(recoveries, starts)]
+        ongoing = np.append(self.target, -1)[ends] != self.target[starts]
+        end_epoch = np.where(ongoing, self.end, np.append(self.epoch, self.end)[ends])
+        return {'target': self.target[starts],
+                'start': self.epoch[starts],
+                'end': end_epoch,
+                'duration': end_epoch - self.epoch[starts],
+                'ongoing': ongoing}
+
+    def latency_percentiles(self, percentiles=PERCENTILES):
+        """(numpy.ndarray) Each site's latency percentiles in milliseconds, by nearest rank; sites by percentiles.
+
+        Args:
+            percentiles: (tuple) The percentiles, from 0 to 100.
+        """
+        timed = ~np.isnan(self.latency_ms)
+        target = self.target[timed]
+        latency_ms = self.latency_ms[timed]
+        # Rows are already grouped by site; sorting each site's latencies is one sort of the latencies offset
+        # by site, far faster than an argsort.
+        span = float(latency_ms.max()) + 1 if len(latency_ms) else 1.0
+        latency_ms = np.sort(target * span + latency_ms) - target * span
+        counts = np.bincount(target, minlength=len(self.targets))
+        offsets = np.cumsum(counts) - counts
+        result = np.full((len(self.targets), len(percentiles)), np.nan, dtype=np.float32)
+        if not len(latency_ms):
+            return result
+        for (i, p) in enumerate(percentiles):
+            ranks = offsets + np.floor(np.maximum(counts - 1, 0) * p / 100.0).astype(np.int64)
+            result[:, i] = np.where(counts > 0, latency_ms[np.minimum(ranks, len(latency_ms) - 1)], np.nan)
+        return result
+
+    def summary(self):
+        """(list) A dict per site: its checks, uptime percentage, outages, MTTR (the mean time to recover from
+        an outage that ended) and longest outage in seconds, and latency percentiles."""
+        outages = self.outages()
+        ended = ~outages['ongoing']
+        sites = len(self.targets)
+        checks = np.bincount(self.target, minlength=sites)
+        outage_count = np.bincount(outages['target'], minlength=sites)
+        recovered = np.bincount(outages['target'][ended], minlength=sites)
+        recovery_time = np.bincount(outages['target'][ended], weights=outages['duration'][ended], minlength=sites)
+        longest = np.zeros(sites, dtype=np.int64)
+        np.maximum.at(longest, outages['target'], outages['duration'])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mttr = np.true_divide(recovery_time, recovered)
+        uptime = self.uptime()
+        percentiles = self.latency_percentiles()
+
+        rows = []
+        for (i, name) in enumerate(self.targets):
+            row = {'target': name, 'checks': int(checks[i]), 'uptime': _number(uptime[i]),
+                   'outages': int(outage_count[i]), 'mttr': _number(mttr[i]), 'longest_outage': int(longest[i])}
+            for (j, p) in enumerate(self.PERCENTILES):
+                row['p{0}'.format(p)] = _number(percentiles[i, j])
+            rows.append(row)
+        return rows
+
+    def export(self, prefix, fmt='csv'):
+        """Write the summary, the outages and the checks themselves, to a file each.
+
+        Args:
+            prefix: (str) The path prefix of the files; e.g. 'history' for 'history-summary.csv', etc.
+            fmt: (str) 'csv', or 'parquet' (which needs pyarrow).
+        Returns:
+            (list) The paths written.
+        """
+        outages = self.outages()
+        names = np.array(self.targets, dtype=object)
+        summary = self.summary()
+        summary_columns = ['target', 'checks', 'uptime', 'outages', 'mttr', 'longest_outage'] + [
+            'p{0}'.format(p) for p in self.PERCENTILES]
+        tables = [
+            ('summary', summary_columns, [np.array([row[c] for row in summary], dtype=object)
+                                          for c in summary_columns]),
+            ('outages', ['target', 'start', 'end', 'duration', 'ongoing'],
+             [names[outages['target']], outages['start'], outages['end'], outages['duration'], outages['ongoing']]),
+            ('checks', ['target', 'epoch', 'up', 'latency_ms'],
+             [names[self.target], self.epoch, self.up, self.latency_ms])]
+
+        directory = os.path.dirname(prefix)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        paths = []
+        for (name, columns, arrays) in tables:
+            path = '{0}-{1}.{2}'.format(prefix, name, fmt)
+            if fmt == 'parquet':
+                _write_parquet(path, columns, arrays)
+            elif fmt == 'csv':
+                _write_csv(path, columns, arrays)
+            else:
+                raise ValueError('Unknown export format {0}'.format(fmt))
+            paths.append(path)
+        return paths
+
+
+def _number(value):
+    """(float) A float, or None for NaN; for summaries."""
+    return None if np.isnan(value) else round(float(value), 1)
+
+
+def _write_csv(path, columns, arrays):
+    """Write columns to a CSV file with a header row."""
+    with open(path, 'wb') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(columns)
+        writer.writerows(zip(*[array.tolist() for array in arrays]))
+
+
+def _write_parquet(path, columns, arrays):
+    """Write columns to a Parquet file; site names are dictionary encoded."""
+    import pyarrow  # Optional; only needed for Parquet.
+    import pyarrow.parquet
+    values = []
+    for (column, array) in zip(columns, arrays):
+        if column == 'target':
+            values.append(pyarrow.array(array.tolist(), type=pyarrow.string()).dictionary_encode())
+        else:
+            values.append(pyarrow.array(array.tolist() if array.dtype == object else array))
+    pyarrow.parquet.write_table(pyarrow.Table.from_arrays(values, columns), path)
@@ -1,7 +1,11 @@
 import logging
-import requests
-import retrying
 import threading
+import urlparse
+
+from sessions import SessionPool
+from timing import CheckTiming
+from validator import StreamingTextValidator
+from validator import release
 
 logger = logging.getLogger()
 
@@ -15,13 +19,20 @@ class Checker(threading.Thread):
         pass
 
 
-    def __init__(self, url=None, name=None, expected_code=200, expected_text=None):
+    def __init__(self, url=None, name=None, expected_code=200, expected_text=None, max_body_size=None,
+                 method='GET', slow_threshold_ms=None, confirm_after=1, conditional_get=False, interval=None):
         """
         Args:
             url: (str) the URL to run a GET against
             name: (str) The name of the site to report in the message
             expected_code: (int) The expected return code of the GET
             expected_text: (str) A string to search for in the returned payload
+            max_body_size: (int) The most bytes of the payload to search for expected_text
+            method: (str) 'GET', or 'HEAD' to skip the payload entirely when there is no expected_text
+            slow_threshold_ms: (int) A successful check whose request takes longer than this is slow
+            confirm_after: (int) How many checks in a row must show a change of state before it is notified
+            conditional_get: (bool) Given validators (see use_validators), make expected_text checks conditional
+            interval: (int) Seconds between scheduled checks of the site; see DueSchedule
         """
         assert(all([url, name]))
         super(Checker, self).__init__()
@@ -29,8 +40,31 @@ class Checker(threading.Thread):
         self.name = name
         self.expected_code = expected_code
         self.expected_text = expected_text
+        self.max_body_size = max_body_size
+        self.method = 'HEAD' if method == 'HEAD' and not expected_text else 'GET'
+        self._bytes_read = 0
         self._exceptional = False
         self._message = ''
+        self.slow_threshold_ms = slow_threshold_ms
+        self.confirm_after = int(confirm_after)
+        self.conditional_get = conditional_get
+        self.interval = interval
+        self._request_headers = None
+        self._validators = {}
+        self._not_modified = False
+        self._attempts = 0
+        self._timing = None
+
+    @property
+    def host(self):
+        """(str) The scheme and network location of the url; e.g. 'https://news.google.com'."""
+        parsed = urlparse.urlparse(self.url)
+        return '{0}://{1}'.format(parsed.scheme, parsed.netloc)
+
+    @property
+    def hostname(self):
+        """(str) The host name of the url, to resolve; e.g. 'news.google.com'."""
+        return urlparse.urlparse(self.url).hostname
 
     @property
     def message(self):
@@ -42,53 +76,181 @@ class Checker(threading.Thread):
         """(bool) True if the GET behaved as expected/desired, else False."""
         return self._exceptional
 
+    @property
+    def attempts(self):
+        """(int) The number of requests made so far."""
+        return self._attempts
+
+    @property
+    def validators(self):
+        """(dict) The ETag and LastModified of the content in which expected_text was last found, if any."""
+        return self._validators
+
+    @property
+    def not_modified(self):
+        """(bool) True if the content was unchanged (HTTP 304) since expected_text was last found in it."""
+        return self._not_modified
+
+    def use_validators(self, etag=None, last_modified=None):
+        """Make requests conditional on the content having changed since expected_text was last found in it.
+
+        A 304 response then counts as success, with the text still present. Only applies with conditional_get,
+        to expected_text checks expecting a 200; any other status code is still checked as usual.
+
+        Args:
+            etag: (str) The ETag of the content, as previously recorded.
+            last_modified: (str) The Last-Modified of the content, as previously recorded.
+        """
+        if not (self.conditional_get and self.expected_text and self.expected_code == 200):
+            return
+        headers = {'If-None-Match': etag, 'If-Modified-Since': last_modified}
+        self._request_headers = dict((k, v) for (k, v) in headers.items() if v) or None
+        self._validators = dict((k, v) for (k, v) in (('ETag', etag), ('LastModified', last_modified)) if v)
+
+    @property
+    def timing(self):
+        """(CheckTiming) The phase timings of the most recent request; None before any request."""
+        return self._timing
+
+    @property
+    def slow(self):
+        """(bool) True if the check succeeded, but its request took longer than the slow threshold."""
+        return (not self.exceptional and self.slow_threshold_ms is not None and self._timing is not None and
+                self._timing.as_dict()['total'] > self.slow_threshold_ms)
+
+    @property
+    def summary(self):
+        """(dict) The outcome of the check, in a JSON-serializable form."""
+        return {'name': self.name, 'url': self.url, 'exceptional': self.exceptional, 'message': self.message,
+                'slow': self.slow, 'timing': self._timing.as_dict() if self._timing else None}
+
+    @property
+    def bytes_read(self):
+        """(int) The number of payload bytes read, across all requests."""
+        return self._bytes_read
+
+    @property
+    def checked(self):
+        """(bool) True once at least one request has been made, and an outcome recorded."""
+        return self._attempts > 0
+
     def run(self):
         """Run a GET on the url, and build a message detailing any exceptional circumstances."""
+        import requests
         try:
             self._attempt_request()
-
-        except requests.exceptions.ConnectionError as e:
-            self._exceptional = True
-            self._message = 'Failed to connect to {0} due to a network problem; result: {1}'.format(self.name, e.message)
+        except (requests.exceptions.RequestException,
+                Checker.UnexpectedHttpStatusError, Checker.ExpectedTextNotFoundError) as e:
+            self._record_failure(e)
             return
+        self._record_success()
 
-        except requests.exceptions.Timeout as e:
-            self._exceptional = True
-            self._message = 'Timed out connecting to {0}; result: {1}'.format(self.name, e.message)
-            return
+    def attempt(self):
+        """Make a single request, without retrying, and record the outcome.
 
-        except requests.exceptions.RequestException as e:
-            self._exceptional = True
-            self._message = 'Got an unspecified error connecting to {0}; result: {1}'.format(self.name, e.message)
-            return
+        Returns:
+            (bool) True if the request behaved as expected.
+        """
+        import requests
+        try:
+            self._request_once()
+        except (requests.exceptions.RequestException,
+                Checker.UnexpectedHttpStatusError, Checker.ExpectedTextNotFoundError) as e:
+            self._record_failure(e)
+            return False
+        self._record_success()
+        return True
 
-        except (Checker.UnexpectedHttpStatusError, Checker.ExpectedTextNotFoundError) as e:
-            self._exceptional = True
-            self._message = e.message
-            return
+    def record_error(self, e):
+        """Record an attempt that raised something other than a request or check failure, as a failure.
 
-        # Looks like everything worked.
-        self._message = 'Successfully connected to {0}; got response {1}!'.format(self.name, self.expected_code)
-        return
+        Args:
+            e: (Exception) The unexpected exception.
+        """
+        self._attempts = max(self._attempts, 1)
+        self._exceptional = True
+        self._message = 'Got an unexpected error checking {0}; result: {1!r}'.format(self.name, e)
 
-    @retrying.retry(
-        stop_max_attempt_number=5,
-        wait_exponential_multiplier=500,
-        wait_exponential_max=5000)
-    def _attempt_request(self):
-        """Attempt to connect; use exponential backoff if an error occurs."""
+    def _record_success(self):
+        """Looks like everything worked."""
+        self._exceptional = False
+        if self._not_modified:
+            self._message = 'Successfully connected to {0}; content unchanged since "{1}" was last found.'.format(
+                self.name, self.expected_text)
+        else:
+            self._message = 'Successfully connected to {0}; got response {1}!'.format(self.name, self.expected_code)
+
+    def _record_failure(self, e):
+        """Build a message detailing the exceptional circumstance.
+
+        Args:
+            e: (Exception) The exception raised by the request.
+        """
+        import requests
+        self._exceptional = True
+        if isinstance(e, requests.exceptions.ConnectionError):
+            self._message = 'Failed to connect to {0} due to a network problem; result: {1}'.format(self.name, e.message)
+        elif isinstance(e, requests.exceptions.Timeout):
+            self._message = 'Timed out connecting to {0}; result: {1}'.format(self.name, e.message)
+        elif isinstance(e, requests.exceptions.RequestException):
+            self._message = 'Got an unspecified error connecting to {0}; result: {1}'.format(self.name, e.message)
+        else:
+            self._message = e.message
+
+    def _request_once(self):
+        """Make a single request, raising if it does not behave as expected."""
         logger.info('Attempting a request for {0}'.format(self.name))
-        req = requests.get(self.url, timeout=self.TIMEOUT, allow_redirects=False)
+        self._attempts += 1
+        self._timing = CheckTiming()
+        with self._timing:
+            self._timed_request()
+
+    def _timed_request(self):
+        """The body of _request_once, run while its CheckTiming is current."""
+        session = SessionPool.session(self.host)
+        req = session.request(self.method, self.url, timeout=self.TIMEOUT, allow_redirects=False, stream=True,
+                              headers=self._request_headers)
+
+        # Content unchanged since the expected text was last found in it; so it still is.
+        self._not_modified = req.status_code == 304 and self._request_headers is not None
+        if self._not_modified:
+            self._bytes_read += release(req)
+            self._update_validators(req)
+            return
 
         # Check the status code against what was expected.
         if req.status_code != self.expected_code:
+            self._bytes_read += release(req)
             message = 'Expected HTTP {0} connecting to {1}; got {2} instead.'.format(
                 self.expected_code, self.name, req.status_code)
             raise Checker.UnexpectedHttpStatusError(message)
 
-        # Validate the text against the expectation, if one was supplied.
-        if self.expected_text and self.expected_text not in req.text:
+        # Validate the text against the expectation, if one was supplied; reading only as far as the text.
+        if not self.expected_text:
+            self._bytes_read += release(req)
+            return
+        (found, bytes_read) = StreamingTextValidator(self.expected_text, self.max_body_size).search(req)
+        self._bytes_read += bytes_read + release(req)
+        self._validators = {}
+        if found and self.conditional_get:
+            self._update_validators(req)
+        if not found:
             message = 'Expected to find "{0}" in request to {1}; was missing'.format(
                 self.expected_text, self.name)
+            if self.max_body_size is not None and bytes_read >= self.max_body_size:
+                message += ' from the first {0} bytes'.format(self.max_body_size)
             raise Checker.ExpectedTextNotFoundError(message)
 
+    def _update_validators(self, response):
+        """Record the ETag and Last-Modified of the response, where it has them."""
+        for (header, key) in (('ETag', 'ETag'), ('Last-Modified', 'LastModified')):
+            if response.headers.get(header):
+                self._validators[key] = response.headers[header]
+
+    def _attempt_request(self):
+        """Attempt to connect; use exponential backoff if an error occurs."""
+        import retrying
+        retrying.Retrying(
+            stop_max_attempt_number=5,
+            wait_exponential_multiplier=500,
+            wait_exponential_max=5000).call(self._request_once)
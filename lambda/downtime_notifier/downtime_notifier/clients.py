@@ -0,0 +1,76 @@
+import threading
+
+
+class AwsClients(object):
+    """Process-wide boto3 clients and resources; created lazily, shared across threads and warm invocations."""
+
+    _clients = {}
+    _resources = {}
+    _tables = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def client(cls, service_name, region_name=None, **kwargs):
+        """(botocore.client.BaseClient) The shared client for the given service and region.
+
+        Args:
+            service_name: (str) e.g. 'sns'.
+            region_name: (str) The region; None for the default region of the environment.
+            kwargs: Further arguments to boto3.client (e.g. config); used only when the client is first created.
+        """
+        import boto3
+        key = (service_name, region_name)
+        with cls._lock:
+            if key not in cls._clients:
+                cls._clients[key] = boto3.client(service_name, region_name=region_name, **kwargs)
+            return cls._clients[key]
+
+    @classmethod
+    def resource(cls, service_name, region_name=None):
+        """(boto3.resources.base.ServiceResource) The shared resource for the given service and region.
+
+        Args:
+            service_name: (str) e.g. 'dynamodb'.
+            region_name: (str) The region; None for the default region of the environment.
+        """
+        import boto3
+        key = (service_name, region_name)
+        with cls._lock:
+            if key not in cls._resources:
+                cls._resources[key] = boto3.resource(service_name, region_name=region_name)
+            return cls._resources[key]
+
+    @classmethod
+    def table(cls, table_name, region_name=None):
+        """(dynamodb.Table) The shared Table resource for the given table name; these are costly to build.
+
+        Args:
+            table_name: (str) Name of the DynamoDB table.
+            region_name: (str) The region; None for the default region of the environment.
+        """
+        dynamo = cls.resource('dynamodb', region_name=region_name)
+        key = (table_name, region_name)
+        with cls._lock:
+            if key not in cls._tables:
+                cls._tables[key] = dynamo.Table(table_name)
+            return cls._tables[key]
+
+    @classmethod
+    def register(cls, service_name, client, region_name=None):
+        """Use the given client for a service and region; e.g. to substitute a local stub.
+
+        Args:
+            service_name: (str) e.g. 'kms'.
+            client: (object) The client to use.
+            region_name: (str) The region; None for the default region of the environment.
+        """
+        with cls._lock:
+            cls._clients[(service_name, region_name)] = client
+
+    @classmethod
+    def reset(cls):
+        """Discard every client and resource; they are recreated on next use."""
+        with cls._lock:
+            cls._clients = {}
+            cls._resources = {}
+            cls._tables = {}
@@ -1,17 +1,29 @@
-import boto3
 import glob
+import json
 import os
-import yaml
 
-from base64 import b64decode
+from registry import REGISTRY_FILE
+from secret_cache import ConfigBag
+from secret_cache import EncryptedValue
+from secret_cache import SecretCache
 
 
 CONFIG_DIR = os.path.join(os.path.dirname(__file__), '..', 'lambda_config')
 CONFIG_EXT = '*.yaml'
 CONFIG_FILES = sorted(glob.glob(os.path.join(CONFIG_DIR, CONFIG_EXT)), reverse=True)
 
-def configuration():
-    """Load configuration from config files, with .local.yaml files overriding non-local."""
+# The merged config files, pre-parsed to JSON by `fab build`; preferred over the YAML when present.
+PARSED_CONFIG_FILE = os.path.join(CONFIG_DIR, 'config.json')
+
+# The sites, compiled by `fab build` into an indexed registry; preferred over the `sites` config key when present.
+SITE_REGISTRY_FILE = os.path.join(CONFIG_DIR, REGISTRY_FILE)
+
+# The config bag holding the `decrypt_secrets` and `secrets_ttl` settings.
+SETTINGS_BAG = 'env'
+
+def load_config_files():
+    """(dict) The config files, keyed by basename, with .local.yaml files overriding non-local."""
+    import yaml  # Only needed when there is no pre-parsed config; e.g. when running locally.
     config = {}
     for config_file in CONFIG_FILES:
         with open(config_file, 'r') as config_file_contents:
@@ -23,18 +35,37 @@ def configuration():
                 config[basename].update(data)
             else:
                 config[basename] = data
+    return config
 
-    # Decrypt any `encrypted_` parameters, and replace in the dict with plaintext variants.
-    # This will fail if the Lambda execution role was not granted decrypt:* in the key policy of
+
+def configuration():
+    """Load configuration from the pre-parsed config if present, else from the config files."""
+    if os.path.exists(PARSED_CONFIG_FILE):
+        with open(PARSED_CONFIG_FILE, 'r') as parsed_config_contents:
+            config = json.load(parsed_config_contents)
+    else:
+        config = load_config_files()
+
+    # Replace any `encrypted_` parameters in the dict with values that are decrypted (and cached) when read.
+    # Reads will fail if the Lambda execution role was not granted decrypt:* in the key policy of
     # the KMS key that was used to create the ciphertext.
+    ciphertexts = []
     for (name, config_bag) in config.iteritems():
-        new_config = {}
+        new_config = ConfigBag()
         for (k,v) in config_bag.iteritems():
             key = k
             value = v
             if k.startswith('encrypted_'):
                 key = k.split('encrypted_')[-1]
-                value = boto3.client('kms').decrypt(CiphertextBlob=b64decode(v))['Plaintext']
+                value = EncryptedValue(v)
+                ciphertexts.append(v)
             new_config[key] = value
         config[name] = new_config
+
+    # With `decrypt_secrets: eager` (the default), decrypt everything concurrently up front; with `lazy`,
+    # each secret is decrypted when it is first read.
+    settings = config.get(SETTINGS_BAG, {})
+    SecretCache.configure(ttl=settings.get('secrets_ttl', SecretCache.DEFAULT_TTL))
+    if settings.get('decrypt_secrets', 'eager') == 'eager':
+        SecretCache.prefetch(ciphertexts)
     return config
@@ -0,0 +1,133 @@
+import logging
+import socket
+import threading
+import time
+
+logger = logging.getLogger()
+
+
+class DnsCache(object):
+    """Resolved host addresses, shared by every check and cached for `ttl` seconds; kept across warm invocations.
+
+    Checks of sites on the same host, and retries of a check, are served from the cache instead of each
+    resolving the host again. Concurrent lookups of a host that is not cached wait on the first one, rather
+    than each making their own. Failed lookups are not cached, so a host that fails to resolve is tried again.
+    """
+
+    # getaddrinfo does not give the TTLs of the records it resolves, so this is the longest addresses are
+    # reused for; keep it at or below the TTLs of the sites' records.
+    DEFAULT_TTL = 60
+    MAX_WORKERS = 16
+
+    _entries = {}
+    _pending = {}
+    _lock = threading.Lock()
+    _ttl = DEFAULT_TTL
+    _stats = {'hits': 0, 'misses': 0, 'failures': 0, 'resolution_seconds': 0.0}
+
+    @classmethod
+    def configure(cls, ttl=DEFAULT_TTL):
+        """
+        Args:
+            ttl: (int) Seconds for which a host's addresses are reused before resolving it again; 0 to not cache.
+        """
+        cls._ttl = int(ttl)
+
+    @classmethod
+    def resolve(cls, host, port, family=socket.AF_UNSPEC):
+        """(list) The addresses of the host, to connect to in order; resolved if not cached or expired.
+
+        Args:
+            host: (str) The host name.
+            port: (int) The port to connect to; None if not yet known.
+            family: (int) The address family to resolve for; as for socket.getaddrinfo.
+        Raises:
+            socket.gaierror: The host could not be resolved.
+        """
+        # The addresses of a host do not depend on the port, so it is not part of the key.
+        key = (host.lower(), family)
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry and entry[1] > time.time():
+                cls._stats['hits'] += 1
+                return entry[0]
+            pending = cls._pending.get(key)
+            if pending is None:
+                cls._pending[key] = threading.Event()
+
+        if pending is not None:
+            # Another thread is resolving the host; use its result, or resolve it here if that failed.
+            pending.wait()
+            with cls._lock:
+                entry = cls._entries.get(key)
+                if entry and entry[1] > time.time():
+                    cls._stats['hits'] += 1
+                    return entry[0]
+            return cls._getaddrinfo(host, port, family, None)
+        return cls._getaddrinfo(host, port, family, key)
+
+    @classmethod
+    def _getaddrinfo(cls, host, port, family, key):
+        """(list) The addresses of the host, resolved now; cached, and waiting threads released, if key is given."""
+        started = time.time()
+        addresses = None
+        try:
+            infos = socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+            addresses = [info[4][0] for info in infos]
+            return addresses
+        finally:
+            with cls._lock:
+                cls._stats['misses'] += 1
+                cls._stats['resolution_seconds'] += time.time() - started
+                if addresses is None:
+                    cls._stats['failures'] += 1
+                elif cls._ttl > 0:
+                    cls._entries[(host.lower(), family)] = (addresses, time.time() + cls._ttl)
+                if key is not None:
+                    cls._pending.pop(key).set()
+
+    @classmethod
+    def prefetch(cls, hosts, max_workers=None):
+        """Resolve the given hosts concurrently, so that the checks of them are served from the cache.
+
+        Failures are logged rather than raised; the check of the host resolves it again, and reports the failure.
+
+        Args:
+            hosts: (list) Host names.
+            max_workers: (int) The most lookups to have in flight at once; MAX_WORKERS if None.
+        """
+        hosts = sorted(set(host.lower() for host in hosts))
+        if not hosts:
+            return
+        from urllib3.util.connection import allowed_gai_family
+        from multiprocessing.pool import ThreadPool
+        family = allowed_gai_family()
+        pool = ThreadPool(min(max_workers or cls.MAX_WORKERS, len(hosts)))
+        try:
+            pool.map(lambda host: cls._try_resolve(host, family), hosts)
+        finally:
+            pool.close()
+
+    @classmethod
+    def _try_resolve(cls, host, family):
+        try:
+            cls.resolve(host, None, family)
+        except socket.gaierror as e:
+            logger.warn('Unable to resolve {0}; will retry when it is checked. Exception: {1}'.format(host, e))
+
+    @classmethod
+    def stats(cls):
+        """(dict) Cumulative counts of cache hits, misses (lookups made) and failed lookups, and the time spent
+        on lookups, across all hosts."""
+        with cls._lock:
+            return dict(cls._stats, hosts=len(cls._entries))
+
+    @classmethod
+    def invalidate(cls, host=None):
+        """Discard the cached addresses of the given host, or of every host if None."""
+        with cls._lock:
+            if host is None:
+                cls._entries = {}
+            else:
+                for key in [k for k in cls._entries if k[0] == host.lower()]:
+                    del cls._entries[key]
@@ -0,0 +1,96 @@
+import heapq
+import json
+import logging
+
+from clients import AwsClients
+
+logger = logging.getLogger()
+
+
+class DueSchedule(object):
+    """Decides which of a tick's sites to check, and in what order, from when each is next due.
+
+    The site registry's slots decide which sites are candidates on a tick. Each check records when its site is
+    next due (the time it was due, plus its interval) in its latest state item, and a candidate is only checked
+    once that time has come; so a site is not checked twice in an interval when its slot moves, e.g. when its
+    interval or tick_seconds changes. Latest state items are kept only with batch state, so without it every
+    candidate is due. Sites that were due but not checked before the deadline are carried over,
+    in an item of the result table, to the next tick. Due sites are checked from a priority queue: the most
+    overdue first, then those with the shortest interval.
+    """
+
+    TARGET_ID = '#schedule'
+
+    def __init__(self, dynamo_table_name, due_at, tick_seconds, shard=None):
+        """
+        Args:
+            dynamo_table_name: (str) Name of the DynamoDB result table.
+            due_at: (int) The epoch time of this tick.
+            tick_seconds: (int) The time between ticks.
+            shard: (int) The shard this invocation checks, which carries over its own sites; None if unsharded.
+        """
+        assert(dynamo_table_name)
+        self.table_name = dynamo_table_name
+        self.due_at = int(due_at)
+        self.tick_seconds = int(tick_seconds)
+        self.key = {'TargetId': self.TARGET_ID,
+                    'Timestamp': 'overdue' if shard is None else 'overdue#{0}'.format(shard)}
+        self._due = {}
+        self._carried_over = False
+
+    def due(self, sites, store=None):
+        """The sites to check on this tick, in the order to check them.
+
+        Args:
+            sites: (list) Site dicts of the sites whose slot is this tick.
+            store: (BatchStateStore) The state store, whose latest items hold next-due times; None if there is
+                none, in which case every candidate is due.
+        Returns:
+            (list) The due site dicts, with those carried over from previous ticks, in priority order.
+        """
+        item = AwsClients.table(self.table_name).get_item(Key=self.key, ConsistentRead=True).get('Item')
+        self._carried_over = bool(item)
+        candidates = dict((site['name'], (self.due_at, site)) for site in sites)
+        carried = [json.loads(entry) for entry in (item or {}).get('Sites', [])]
+        for (due_at, site) in carried:
+            # A site's current definition wins over the carried one; its due time does not.
+            candidates[site['name']] = (due_at, candidates.get(site['name'], (None, site))[1])
+
+        if not store and candidates:
+            logger.warn('Next due times need batch_state or compact storage; checking all {0} candidates'.format(
+                len(candidates)))
+        latest = store.load_latest(candidates.keys()) if store else {}
+        queue = []
+        not_yet = 0
+        for (name, (due_at, site)) in candidates.items():
+            next_due = latest.get(name, {}).get('NextDue')
+            if next_due is not None and int(next_due) > due_at + self.tick_seconds / 2:
+                not_yet += 1
+                continue
+            heapq.heappush(queue, (due_at, site.get('interval') or self.tick_seconds, name, site))
+
+        due = []
+        while queue:
+            (due_at, interval, name, site) = heapq.heappop(queue)
+            self._due[name] = (due_at, site)
+            due.append(site)
+        logger.info('{0} sites due ({1} carried over); {2} not yet due'.format(len(due), len(carried), not_yet))
+        return due
+
+    def carry_over(self, checkers):
+        """Record the due sites that were not checked, to check first on the next tick.
+
+        Args:
+            checkers: (list) The Checker objects of the due sites, once run.
+        """
+        unchecked = [self._due[c.name] for c in checkers if not c.checked]
+        table = AwsClients.table(self.table_name)
+        if unchecked:
+            logger.warn('Carrying over {0} unchecked sites to the next tick'.format(len(unchecked)))
+            table.put_item(Item=dict(self.key, Sites=[json.dumps(entry, sort_keys=True) for entry in unchecked]))
+        elif self._carried_over:
+            table.delete_item(Key=self.key)
+
+    def next_due(self, checker):
+        """(int) The epoch time at which a checked site is next due: when it was due, plus its interval."""
+        return self._due[checker.name][0] + (checker.interval or self.tick_seconds)
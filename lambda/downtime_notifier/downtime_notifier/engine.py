@@ -0,0 +1,134 @@
+import collections
+import logging
+import threading
+
+from scheduler import CheckScheduler
+
+logger = logging.getLogger()
+
+
+class ThreadPerSiteEngine(object):
+    """Runs each Checker as its own thread; the original execution model."""
+
+    def run(self, checkers):
+        """Start a thread per Checker and join on the set.
+
+        Args:
+            checkers: (list) Checker objects to run.
+        """
+        for checker in checkers:
+            checker.start()
+        for checker in checkers:
+            checker.join()
+        return checkers
+
+
+class PoolEngine(object):
+    """Runs Checkers on a bounded pool of worker threads, limiting concurrent requests per host.
+
+    Checkers are queued per host, and workers take from the hosts in turn, skipping those at their limit; so
+    no worker waits on a busy host while checks of other hosts are queued.
+    """
+
+    def __init__(self, max_concurrency=50, per_host_concurrency=4):
+        """
+        Args:
+            max_concurrency: (int) The number of worker threads; i.e. the most checks in flight.
+            per_host_concurrency: (int) The most checks in flight against any single host.
+        """
+        assert(max_concurrency > 0 and per_host_concurrency > 0)
+        self.max_concurrency = int(max_concurrency)
+        self.per_host_concurrency = int(per_host_concurrency)
+        self._queues = {}
+        self._ready = collections.deque()
+        self._in_flight = collections.defaultdict(int)
+        self._pending = 0
+        self._condition = threading.Condition()
+
+    def run(self, checkers):
+        """Run every Checker to completion on the worker pool.
+
+        Args:
+            checkers: (list) Checker objects to run. Each is run synchronously; none are started as threads.
+        """
+        with self._condition:
+            for checker in checkers:
+                queue = self._queues.setdefault(checker.host, collections.deque())
+                if not queue:
+                    self._ready.append(checker.host)
+                queue.append(checker)
+            self._pending += len(checkers)
+
+        workers = []
+        for i in range(min(self.max_concurrency, len(checkers))):
+            worker = threading.Thread(target=self._work, name='CheckWorker-{0}'.format(i))
+            worker.start()
+            workers.append(worker)
+        for worker in workers:
+            worker.join()
+        return checkers
+
+    def _work(self):
+        """Run Checkers until none are left to take."""
+        while True:
+            checker = self._next()
+            if checker is None:
+                return
+            try:
+                checker.run()
+            except Exception as e:
+                # Recorded as the check's outcome, so the worker carries on with the other Checkers.
+                logger.exception('Unexpected error checking {0}'.format(checker.name))
+                checker.record_error(e)
+            finally:
+                self._done(checker)
+
+    def _next(self):
+        """(Checker) The next Checker of a host that is below its limit; None when there is no more work."""
+        with self._condition:
+            # Every queued host is at its limit; one of its checks finishing makes it ready again.
+            while not self._ready:
+                if not self._pending:
+                    return None
+                self._condition.wait()
+            host = self._ready.popleft()
+            checker = self._queues[host].popleft()
+            self._in_flight[host] += 1
+            self._pending -= 1
+            # Back of the line, so that hosts take turns.
+            if self._queues[host] and self._in_flight[host] < self.per_host_concurrency:
+                self._ready.append(host)
+            if not self._pending:
+                self._condition.notify_all()
+            return checker
+
+    def _done(self, checker):
+        """Release the Checker's place against its host, making the host ready again if it was at its limit."""
+        with self._condition:
+            host = checker.host
+            self._in_flight[host] -= 1
+            if self._queues[host] and self._in_flight[host] == self.per_host_concurrency - 1:
+                self._ready.append(host)
+                self._condition.notify()
+
+
+def engine_from_config(env, deadline=None):
+    """Build the check engine selected by the `check_engine` key of the env config.
+
+    Args:
+        env: (dict) The `env` configuration bag.
+        deadline: (float) The time by which all checks must be finished; only the `scheduled` engine honours it.
+    """
+    name = env.get('check_engine', 'threads')
+    if name == 'threads':
+        return ThreadPerSiteEngine()
+    if name == 'pool':
+        return PoolEngine(max_concurrency=env.get('max_concurrency', 50),
+                          per_host_concurrency=env.get('per_host_concurrency', 4))
+    if name == 'scheduled':
+        return CheckScheduler(max_concurrency=env.get('max_concurrency', 50),
+                              per_host_rate=env.get('per_host_rate', 20),
+                              per_host_burst=env.get('per_host_burst', 10),
+                              max_attempts=env.get('max_attempts', 5),
+                              deadline=deadline)
+    raise ValueError('Unknown check_engine: {0}'.format(name))
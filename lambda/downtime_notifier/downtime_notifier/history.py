@@ -0,0 +1,227 @@
+import logging
+import time
+
+from clients import AwsClients
+
+logger = logging.getLogger()
+
+
+class LatencyHistogram(object):
+    """Counts of latencies in fixed, roughly logarithmic buckets; cheap to store, and to merge by adding.
+
+    Percentiles are approximate: each is reported as the upper bound of the bucket it falls in (or, past the
+    last bound, as that bound).
+    """
+
+    BOUNDS_MS = (25, 50, 75, 100, 150, 200, 300, 400, 500, 750, 1000, 1500, 2000, 3000, 5000, 7500, 10000)
+
+    def __init__(self, counts=None):
+        """
+        Args:
+            counts: (list) The count in each bucket; one more than there are BOUNDS_MS, for the overflow.
+        """
+        self.counts = [int(c) for c in counts] if counts else [0] * (len(self.BOUNDS_MS) + 1)
+
+    def add(self, milliseconds):
+        """Count a latency."""
+        for (i, bound) in enumerate(self.BOUNDS_MS):
+            if milliseconds <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def merge(self, other):
+        """Add the counts of another histogram to this one."""
+        self.counts = [a + b for (a, b) in zip(self.counts, other.counts)]
+
+    def percentile(self, p):
+        """(int) The approximate p-th percentile, in milliseconds; None if nothing has been counted.
+
+        Args:
+            p: (float) The percentile, from 0 to 100.
+        """
+        total = sum(self.counts)
+        if not total:
+            return None
+        rank = total * p / 100.0
+        seen = 0
+        for (i, count) in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.BOUNDS_MS[min(i, len(self.BOUNDS_MS) - 1)]
+        return self.BOUNDS_MS[-1]
+
+
+class HistoryStore(object):
+    """Compact, expiring storage of check results, with hourly and daily rollups per site.
+
+    Raw results are written with short attribute names and epoch int times, without the URL, and expire
+    through the table's TTL attribute. Alongside them, each site has an hourly and a daily rollup item
+    (uptime, slow and latency histogram counts), which are read and rewritten in the same batches as the
+    latest items, so history can be queried from a handful of rollups instead of every raw result.
+
+    All items share the result table's keys. Raw results use a zero-padded epoch as their Timestamp; rollups
+    use 'h#' or 'd#' and the epoch of the start of their period. Both sort before 'latest', and rollups after
+    every raw or full result; so a query for a site's newest result must bound its Timestamp below 'd#' (see
+    StateTracker.RESULT_TIMESTAMP_BOUND), and decode a raw result it finds with full_item.
+    """
+
+    # Short attribute names of raw and rollup items.
+    TIME = 't'
+    EXCEPTIONAL = 'e'
+    MESSAGE = 'm'
+    SLOW = 's'
+    TIMINGS = 'p'
+    ATTEMPTS = 'a'
+    BYTES_READ = 'b'
+    EXPIRES = 'x'
+    CHECKS = 'n'
+    UP = 'u'
+    HISTOGRAM = 'k'
+
+    PERIODS = {'hour': ('h#', 3600), 'day': ('d#', 86400)}
+    DEFAULT_TTL_DAYS = {'raw': 7, 'hour': 35, 'day': 400}
+
+    def __init__(self, dynamo_table_name, ttl_days=None):
+        """
+        Args:
+            dynamo_table_name: (str) Name of the DynamoDB result table.
+            ttl_days: (dict) Days to keep 'raw' results, and 'hour' and 'day' rollups; see DEFAULT_TTL_DAYS.
+        """
+        assert(dynamo_table_name)
+        self.table_name = dynamo_table_name
+        self.ttl_days = dict(self.DEFAULT_TTL_DAYS, **(ttl_days or {}))
+
+    @classmethod
+    def rollup_key(cls, target_id, period, epoch):
+        """(dict) The key of the rollup item of the period containing the epoch."""
+        (prefix, seconds) = cls.PERIODS[period]
+        return {'TargetId': target_id, 'Timestamp': '{0}{1:010d}'.format(prefix, epoch - epoch % seconds)}
+
+    def raw_item(self, tracker):
+        """(dict) The compact, expiring result item for a StateTracker."""
+        checker = tracker.checker
+        item = {
+          'TargetId': checker.name,
+          'Timestamp': '{0:010d}'.format(tracker.epoch),
+          self.TIME: tracker.epoch,
+          self.EXCEPTIONAL: checker.exceptional,
+          self.EXPIRES: tracker.epoch + self.ttl_days['raw'] * 86400
+        }
+        if checker.exceptional:
+            item[self.MESSAGE] = checker.message
+        if checker.slow:
+            item[self.SLOW] = True
+        if checker.timing:
+            item[self.TIMINGS] = checker.timing.milliseconds
+            item[self.ATTEMPTS] = checker.attempts
+            item[self.BYTES_READ] = checker.bytes_read
+        return item
+
+    @classmethod
+    def full_item(cls, raw_item):
+        """(dict) A raw result item, with the attribute names of a full one; for reading the previous state.
+
+        Raw items do not keep the debounced state, so the observed state stands in for the confirmed one.
+        """
+        item = {'TargetId': raw_item['TargetId'], 'Timestamp': raw_item['Timestamp'],
+                'IsExceptional': raw_item[cls.EXCEPTIONAL]}
+        if cls.MESSAGE in raw_item:
+            item['message'] = raw_item[cls.MESSAGE]
+        if raw_item.get(cls.SLOW):
+            item['IsSlow'] = True
+        return item
+
+    def rollup_keys(self, trackers):
+        """(list) The keys of the rollup items that the given StateTrackers' results fall into."""
+        return [self.rollup_key(t.checker.name, period, t.epoch) for t in trackers for period in self.PERIODS]
+
+    def rollup_items(self, trackers, existing):
+        """The rollup items, updated with the given StateTrackers' results.
+
+        Args:
+            trackers: (list) StateTracker objects for this run.
+            existing: (dict) The current rollup items, keyed by (TargetId, Timestamp).
+        Returns:
+            (list) The updated rollup items, to write.
+        """
+        updated = {}
+        for tracker in trackers:
+            checker = tracker.checker
+            for period in self.PERIODS:
+                key = self.rollup_key(checker.name, period, tracker.epoch)
+                key_tuple = (key['TargetId'], key['Timestamp'])
+                item = updated.get(key_tuple) or dict(existing.get(key_tuple) or self._new_rollup(key, period))
+                item[self.CHECKS] = int(item[self.CHECKS]) + 1
+                item[self.UP] = int(item[self.UP]) + (0 if checker.exceptional else 1)
+                item[self.SLOW] = int(item[self.SLOW]) + (1 if checker.slow else 0)
+                if checker.timing and not checker.exceptional:
+                    histogram = LatencyHistogram(item[self.HISTOGRAM])
+                    histogram.add(checker.timing.as_dict()['total'])
+                    item[self.HISTOGRAM] = histogram.counts
+                updated[key_tuple] = item
+        return updated.values()
+
+    def rollups(self, target_id, period='hour', start=None, end=None):
+        """Read a site's rollups for a time range; the raw results are not touched.
+
+        Args:
+            target_id: (str) The name of the site.
+            period: (str) 'hour' or 'day'.
+            start: (int) The epoch of the start of the range; defaults to a week (for hours) or a year ago.
+            end: (int) The epoch of the end of the range; defaults to now.
+        Returns:
+            (list) Dicts of each period's start epoch, checks, uptime percentage, slow checks, and p50, p90
+            and p99 latency in milliseconds, oldest first.
+        """
+        return [self.describe(item) for item in self._query_rollups(target_id, period, start, end)]
+
+    def summarize(self, target_id, period='hour', start=None, end=None):
+        """(dict) As for rollups, but combined over the whole time range; 'start' is that of the first rollup."""
+        items = self._query_rollups(target_id, period, start, end)
+        combined = {self.TIME: int(items[0][self.TIME]) if items else None,
+                    self.CHECKS: 0, self.UP: 0, self.SLOW: 0}
+        histogram = LatencyHistogram()
+        for item in items:
+            for attribute in (self.CHECKS, self.UP, self.SLOW):
+                combined[attribute] += int(item[attribute])
+            histogram.merge(LatencyHistogram(item[self.HISTOGRAM]))
+        combined[self.HISTOGRAM] = histogram.counts
+        return self.describe(combined)
+
+    def _query_rollups(self, target_id, period, start, end):
+        """(list) The rollup items of a site for a time range, oldest first."""
+        from boto3.dynamodb.conditions import Key
+        end = int(end or time.time())
+        start = int(start or end - (7 if period == 'hour' else 365) * 86400)
+        low = self.rollup_key(target_id, period, start)['Timestamp']
+        high = self.rollup_key(target_id, period, end)['Timestamp']
+
+        table = AwsClients.table(self.table_name)
+        kwargs = {'KeyConditionExpression': Key('TargetId').eq(target_id) & Key('Timestamp').between(low, high)}
+        items = []
+        while True:
+            response = table.query(**kwargs)
+            items.extend(response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def describe(self, item):
+        """(dict) A rollup item, in readable form."""
+        histogram = LatencyHistogram(item[self.HISTOGRAM])
+        checks = int(item[self.CHECKS])
+        return {'start': item[self.TIME] if item[self.TIME] is None else int(item[self.TIME]),
+                'checks': checks,
+                'uptime': 100.0 * int(item[self.UP]) / checks if checks else None,
+                'slow': int(item[self.SLOW]),
+                'p50': histogram.percentile(50),
+                'p90': histogram.percentile(90),
+                'p99': histogram.percentile(99)}
+
+    def _new_rollup(self, key, period):
+        """(dict) An empty rollup item."""
+        start = int(key['Timestamp'][len(self.PERIODS[period][0]):] or 0)
+        return dict(key, **{self.TIME: start, self.CHECKS: 0, self.UP: 0, self.SLOW: 0,
+                            self.HISTOGRAM: LatencyHistogram().counts,
+                            self.EXPIRES: start + self.ttl_days[period] * 86400})
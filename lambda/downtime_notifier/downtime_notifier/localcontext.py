@@ -1,3 +1,4 @@
+import time
 import uuid
 
 from utility import Utility
@@ -6,6 +7,17 @@ from utility import Utility
 class LocalContext(object):
     """A simulated context object for local execution of Lambda functions."""
 
+    def __init__(self, timeout=180):
+        """
+        Args:
+            timeout: (int) Seconds; the simulated function timeout.
+        """
+        self._deadline = time.time() + timeout
+
+    def get_remaining_time_in_millis(self):
+        """Simulate the time remaining before the function times out."""
+        return max(0, int((self._deadline - time.time()) * 1000))
+
     @property
     def invoked_function_arn(self):
         """Simulate the Lambda ARN that comes into the context object."""
@@ -0,0 +1,92 @@
+import json
+import os
+import sys
+import time
+
+
+class RunMetrics(object):
+    """Emits the timings and outcomes of a run of checks as CloudWatch Embedded Metric Format (EMF) log lines.
+
+    CloudWatch extracts metrics from EMF lines written to stdout, with no API calls from the function. The
+    timings of every check in the run go into one document as arrays of values, giving a latency distribution
+    for the whole run; with per_site, each site also gets a document of its own under a Site dimension.
+    """
+
+    # The most values EMF accepts in one metric's array.
+    MAX_VALUES = 100
+
+    TIMING_METRICS = (('dns', 'DnsTime'), ('connect', 'ConnectTime'), ('tls', 'TlsTime'),
+                      ('ttfb', 'TimeToFirstByte'), ('total', 'TotalTime'))
+
+    def __init__(self, namespace, per_site=False):
+        """
+        Args:
+            namespace: (str) The CloudWatch namespace of the metrics.
+            per_site: (bool) Also emit metrics for each site, under a Site dimension.
+        """
+        self.namespace = namespace
+        self.per_site = per_site
+        self.function = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+
+    def documents(self, checkers, dns=None):
+        """The EMF documents for a run.
+
+        Args:
+            checkers: (list) The checked Checker objects of the run.
+            dns: (dict) The run's DnsCache hits, misses, failures, resolution_seconds and prefetch_seconds;
+                None to leave out DNS metrics.
+        Returns:
+            (list) The documents, as dicts.
+        """
+        timed = [c for c in checkers if c.timing]
+        counts = {'Checks': len(checkers),
+                  'Failures': len([c for c in checkers if c.exceptional]),
+                  'SlowChecks': len([c for c in checkers if c.slow])}
+        if dns:
+            counts.update(DnsCacheHits=dns['hits'], DnsCacheMisses=dns['misses'], DnsFailures=dns['failures'])
+        documents = [self._document(['Function'], counts, 'Count')]
+        if dns:
+            self._add(documents[0], 'DnsResolutionTime', int(round(dns['resolution_seconds'] * 1000)), 'Milliseconds')
+            self._add(documents[0], 'DnsPrefetchTime', int(round(dns['prefetch_seconds'] * 1000)), 'Milliseconds')
+        for i in range(0, len(timed), self.MAX_VALUES):
+            documents.append(self._timing_document(['Function'], timed[i:i + self.MAX_VALUES]))
+        if self.per_site:
+            for checker in timed:
+                documents.append(self._timing_document(['Function', 'Site'], [checker], Site=checker.name))
+        return documents
+
+    def emit(self, checkers, stream=None, dns=None):
+        """Write the EMF documents for a run, one per line.
+
+        Args:
+            checkers: (list) The checked Checker objects of the run.
+            stream: (file) Where to write; stdout by default, as the log formatter would break EMF lines.
+            dns: (dict) The run's DnsCache stats, as for documents.
+        """
+        stream = stream or sys.stdout
+        for document in self.documents(checkers, dns):
+            stream.write(json.dumps(document, separators=(',', ':')) + '\n')
+        stream.flush()
+
+    def _timing_document(self, dimensions, checkers, **dimension_values):
+        """(dict) An EMF document of the phase timings, attempts and bytes read of the given checkers."""
+        values = dict((name, [c.timing.as_dict()[phase] for c in checkers]) for (phase, name) in self.TIMING_METRICS)
+        document = self._document(dimensions, values, 'Milliseconds', **dimension_values)
+        self._add(document, 'Attempts', [c.attempts for c in checkers], 'Count')
+        self._add(document, 'BytesRead', [c.bytes_read for c in checkers], 'Bytes')
+        return document
+
+    def _document(self, dimensions, values, unit, **dimension_values):
+        """(dict) An EMF document of the given metric values, all in one unit."""
+        document = dict(dimension_values, Function=self.function)
+        document['_aws'] = {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{'Namespace': self.namespace, 'Dimensions': [dimensions], 'Metrics': []}]}
+        for name in sorted(values):
+            self._add(document, name, values[name], unit)
+        return document
+
+    def _add(self, document, name, value, unit):
+        """Add a metric to a document."""
+        document['_aws']['CloudWatchMetrics'][0]['Metrics'].append({'Name': name, 'Unit': unit})
+        document[name] = value[0] if isinstance(value, list) and len(value) == 1 else value
@@ -0,0 +1,228 @@
+"""The compiled site registry: the `sites` config list, validated, deduplicated and indexed by schedule tick.
+
+This module uses only the standard library, so that `fab build` can load it on its own to compile the registry.
+"""
+import hashlib
+import json
+import threading
+import urlparse
+
+
+# The registry file, within lambda_config/.
+REGISTRY_FILE = 'sites.registry'
+REGISTRY_VERSION = 1
+
+# The keyword arguments of Checker.
+SITE_KEYS = ('url', 'name', 'expected_code', 'expected_text', 'max_body_size', 'method', 'slow_threshold_ms',
+             'confirm_after', 'conditional_get', 'interval')
+
+DEFAULT_TICK_SECONDS = 300
+
+
+class SiteRegistryError(Exception):
+    """The `sites` config list is not valid; the message lists every problem found."""
+    pass
+
+
+def _slot(name, ticks):
+    """(int) The tick, modulo its interval in ticks, on which the named site is due; stable across processes."""
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    return int(hashlib.md5(name).hexdigest(), 16) % ticks
+
+
+def _host(url):
+    """(str) The scheme, host name and any port of a split URL; e.g. 'https://news.google.com:8443'.
+
+    The host name is lowercased, as by Checker.hostname, and any userinfo left out; so that the sites of a
+    host are grouped together however their URLs spell it.
+
+    Raises:
+        ValueError: The URL's port is not a number.
+    """
+    hostname = '[{0}]'.format(url.hostname) if ':' in url.hostname else url.hostname
+    return '{0}://{1}{2}'.format(url.scheme, hostname, '' if url.port is None else ':{0}'.format(url.port))
+
+
+def _validate(site):
+    """(list) The problems with a site dict; empty if it is valid."""
+    if not isinstance(site, dict):
+        return ['{0!r} is not a mapping'.format(site)]
+    label = site.get('name') or site.get('url') or repr(site)
+    problems = ['{0}: unknown key "{1}"'.format(label, k) for k in sorted(site) if k not in SITE_KEYS]
+    if not site.get('name'):
+        problems.append('{0}: has no name'.format(label))
+    url = urlparse.urlsplit(site.get('url') or '')
+    if url.scheme not in ('http', 'https') or not url.hostname:
+        problems.append('{0}: url "{1}" is not an absolute http(s) URL'.format(label, site.get('url')))
+    else:
+        try:
+            _host(url)
+        except ValueError:
+            problems.append('{0}: url "{1}" has an invalid port'.format(label, site.get('url')))
+    if not isinstance(site.get('expected_code', 200), int) or not 100 <= site.get('expected_code', 200) < 600:
+        problems.append('{0}: expected_code {1!r} is not an HTTP status code'.format(label, site['expected_code']))
+    if site.get('method', 'GET') not in ('GET', 'HEAD'):
+        problems.append('{0}: method {1!r} is not GET or HEAD'.format(label, site['method']))
+    for key in ('interval', 'max_body_size', 'slow_threshold_ms', 'confirm_after'):
+        if key in site and (not isinstance(site[key], (int, float)) or site[key] <= 0):
+            problems.append('{0}: {1} {2!r} is not a positive number'.format(label, key, site[key]))
+    return problems
+
+
+def compile_registry(sites, env=None):
+    """Validate, deduplicate and index a `sites` config list, for SiteRegistry.
+
+    Each site's interval (or the `check_interval` default) is rounded to a whole number of schedule ticks,
+    of `tick_seconds` each, and the site is given a slot: the ticks on which it is due. The sites of each
+    (interval, slot) bucket are stored on a line of their own, grouped by host, after a header line that
+    indexes the buckets by offset; so that only the due buckets need be read and parsed.
+
+    Args:
+        sites: (list) Site dicts, as in the `sites` config key.
+        env: (dict) The `env` config, for `tick_seconds` and `check_interval`.
+    Returns:
+        (tuple) The registry file contents, and a dict of counts of its sites, duplicates, hosts and buckets.
+    Raises:
+        SiteRegistryError: A site is invalid, or two different sites share a name.
+    """
+    env = env or {}
+    tick_seconds = int(env.get('tick_seconds', DEFAULT_TICK_SECONDS))
+    default_interval = env.get('check_interval', tick_seconds)
+
+    problems = []
+    unique = {}
+    duplicates = 0
+    for site in sites:
+        site_problems = _validate(site)
+        problems.extend(site_problems)
+        if site_problems:
+            continue
+        if site['name'] in unique:
+            if unique[site['name']] != site:
+                problems.append('{0}: defined more than once, differently'.format(site['name']))
+            duplicates += 1
+            continue
+        unique[site['name']] = site
+    if problems:
+        raise SiteRegistryError('Invalid sites:\n  ' + '\n  '.join(problems))
+
+    # Bucket the sites by (interval in ticks, slot), and group each bucket by host. A site's URL is stored
+    # relative to its host; or in full, if it has userinfo or otherwise differs from the host, to keep it exact.
+    buckets = {}
+    for (name, site) in unique.items():
+        ticks = max(1, int(round(float(site.get('interval', default_interval)) / tick_seconds)))
+        url = urlparse.urlsplit(site['url'])
+        host = _host(url)
+        path = urlparse.urlunsplit(('', '', url.path, url.query, url.fragment))
+        if '{0}://{1}'.format(url.scheme, url.netloc) != host:
+            path = site['url']
+        options = dict((k, v) for (k, v) in site.items() if k not in ('url', 'name', 'interval'))
+        hosts = buckets.setdefault((ticks, _slot(name, ticks)), {})
+        hosts.setdefault(host, []).append([name, path, options])
+
+    index = []
+    lines = []
+    offset = 0
+    for (ticks, slot) in sorted(buckets):
+        hosts = buckets[(ticks, slot)]
+        line = json.dumps([[host, sorted(hosts[host])] for host in sorted(hosts)], separators=(',', ':'),
+                          sort_keys=True) + '\n'
+        index.append([ticks, slot, offset, len(line), sum(len(s) for s in hosts.values())])
+        lines.append(line)
+        offset += len(line)
+    header = json.dumps({'version': REGISTRY_VERSION, 'tick_seconds': tick_seconds, 'buckets': index},
+                        separators=(',', ':'), sort_keys=True) + '\n'
+    stats = {'sites': len(unique), 'duplicates': duplicates, 'buckets': len(index),
+             'hosts': len(set(host for hosts in buckets.values() for host in hosts))}
+    return (header + ''.join(lines), stats)
+
+
+class SiteRegistry(object):
+    """The sites to check, read from a compiled registry (see compile_registry) a bucket at a time.
+
+    Loaded registries, and the buckets read from them, are cached at class level, so warm invocations
+    neither reread nor reparse them.
+    """
+
+    _registries = {}
+    _lock = threading.Lock()
+
+    def __init__(self, contents=None, path=None):
+        """
+        Args:
+            contents: (str) The registry file contents; or
+            path: (str) The path of the registry file.
+        """
+        self.path = path
+        self._contents = contents
+        if path:
+            with open(path, 'rb') as registry_file:
+                header = json.loads(registry_file.readline())
+                self._body_start = registry_file.tell()
+        else:
+            header = json.loads(contents[:contents.index('\n')])
+            self._body_start = contents.index('\n') + 1
+        if header['version'] != REGISTRY_VERSION:
+            raise SiteRegistryError('Unsupported site registry version {0}'.format(header['version']))
+        self.tick_seconds = header['tick_seconds']
+        self._index = header['buckets']
+        self._buckets = {}
+        self._bucket_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        """(SiteRegistry) The registry compiled to the given path, cached across invocations."""
+        with cls._lock:
+            if path not in cls._registries:
+                cls._registries[path] = cls(path=path)
+            return cls._registries[path]
+
+    @classmethod
+    def from_sites(cls, sites, env=None):
+        """(SiteRegistry) A registry compiled in memory from a `sites` list; e.g. when running from the YAML.
+
+        Raises:
+            SiteRegistryError: As for compile_registry.
+        """
+        return cls(contents=compile_registry(sites, env)[0])
+
+    def __len__(self):
+        return sum(bucket[4] for bucket in self._index)
+
+    def tick(self, epoch):
+        """(int) The schedule tick of an invocation at the given epoch time; the nearest, to allow for jitter."""
+        return int(round(float(epoch) / self.tick_seconds))
+
+    def due(self, tick):
+        """(list) Site dicts, as in the `sites` config key, of the sites due on the given tick; grouped by host.
+
+        Each site's interval is given as it was rounded to whole ticks.
+        """
+        sites = []
+        for (ticks, slot, offset, length, count) in self._index:
+            if tick % ticks == slot:
+                sites.extend(self._bucket(ticks, offset, length))
+        return sites
+
+    def all(self):
+        """(list) Site dicts of every site."""
+        return [site for (ticks, slot, offset, length, count) in self._index
+                for site in self._bucket(ticks, offset, length)]
+
+    def _bucket(self, ticks, offset, length):
+        """(list) The site dicts of a bucket, read and parsed on first use."""
+        with self._bucket_lock:
+            if offset not in self._buckets:
+                if self.path:
+                    with open(self.path, 'rb') as registry_file:
+                        registry_file.seek(self._body_start + offset)
+                        line = registry_file.read(length)
+                else:
+                    line = self._contents[self._body_start + offset:self._body_start + offset + length]
+                interval = ticks * self.tick_seconds
+                self._buckets[offset] = [dict(options, name=name, interval=interval,
+                                              url=path if urlparse.urlsplit(path).scheme else host + path)
+                                         for (host, host_sites) in json.loads(line)
+                                         for (name, path, options) in host_sites]
+            return self._buckets[offset]
@@ -0,0 +1,176 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger()
+
+
+class TokenBucket(object):
+    """Permits `rate` requests per second, in bursts of up to `capacity`.
+
+    Tokens are reserved rather than waited for: reserve() returns the time at which the caller may go ahead,
+    so that nothing need sleep while holding the bucket.
+    """
+
+    def __init__(self, rate, capacity):
+        """
+        Args:
+            rate: (float) Tokens added per second.
+            capacity: (int) The most tokens the bucket holds; i.e. the largest burst.
+        """
+        assert(rate > 0 and capacity >= 1)
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._updated = time.time()
+
+    def reserve(self, now):
+        """Take a token, going into debt if none is available.
+
+        Args:
+            now: (float) The current time.
+        Returns:
+            (float) The time at which the token may be used.
+        """
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return now if self._tokens >= 0 else now - self._tokens / self.rate
+
+
+class CheckScheduler(object):
+    """Runs Checkers on a bounded pool of workers, and owns all of their retries.
+
+    Attempts are queued by the time they are due. Each host has a token bucket, so that many failing sites on
+    one host do not retry against it all at once; retries back off exponentially, with full jitter. Nothing is
+    started that could not finish before the deadline: Checkers left unattempted are reported as unchecked
+    (see Checker.checked), and those mid-retry keep the outcome of their last attempt.
+    """
+
+    def __init__(self, max_concurrency=50, per_host_rate=20, per_host_burst=10, max_attempts=5,
+                 backoff_base=0.5, backoff_max=5.0, deadline=None):
+        """
+        Args:
+            max_concurrency: (int) The number of worker threads; i.e. the most checks in flight.
+            per_host_rate: (float) The most requests per second against any single host, once its burst is spent.
+            per_host_burst: (int) The most requests that may be made against a host at once.
+            max_attempts: (int) The most requests made per Checker.
+            backoff_base: (float) Seconds; the backoff before the nth retry is up to backoff_base * 2^(n-1).
+            backoff_max: (float) Seconds; the most backoff before any retry.
+            deadline: (float) The time by which all checks must be finished; None for no deadline.
+        """
+        assert(max_concurrency > 0 and max_attempts > 0)
+        self.max_concurrency = int(max_concurrency)
+        self.per_host_rate = float(per_host_rate)
+        self.per_host_burst = int(per_host_burst)
+        self.max_attempts = int(max_attempts)
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.deadline = deadline
+        self._buckets = {}
+        self._queue = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def run(self, checkers):
+        """Run every Checker to completion, or until the deadline.
+
+        Args:
+            checkers: (list) Checker objects to run. Each is run synchronously; none are started as threads.
+        """
+        now = time.time()
+        for checker in checkers:
+            self._push(now, checker, reserved=False)
+
+        workers = []
+        for i in range(min(self.max_concurrency, len(checkers))):
+            worker = threading.Thread(target=self._work, name='CheckWorker-{0}'.format(i))
+            worker.start()
+            workers.append(worker)
+        for worker in workers:
+            worker.join()
+
+        unchecked = [c for c in checkers if not c.checked]
+        if unchecked:
+            logger.warn('{0} sites were not checked before the deadline: {1}'.format(
+                len(unchecked), ', '.join(c.name for c in unchecked)))
+        return checkers
+
+    def _push(self, due, checker, reserved):
+        """Queue an attempt of the Checker at the due time. Call with the condition held, once workers run."""
+        heapq.heappush(self._queue, (due, next(self._sequence), checker, reserved))
+
+    def _next(self):
+        """(Checker) The next Checker to attempt, once it is due; None when there is no more work."""
+        with self._condition:
+            while True:
+                if not self._queue:
+                    if not self._in_flight or not self._in_time(time.time(), None):
+                        return None
+                    # Bounded by the deadline, so that no worker waits on an attempt that never finishes.
+                    self._condition.wait(None if self.deadline is None else self.deadline - time.time())
+                    continue
+
+                now = time.time()
+                (due, _, checker, reserved) = self._queue[0]
+
+                # Nothing is started that could not finish before the deadline.
+                if not self._in_time(due, checker):
+                    heapq.heappop(self._queue)
+                    continue
+                if due > now:
+                    self._condition.wait(due - now)
+                    continue
+                heapq.heappop(self._queue)
+
+                # Take a token for the host; if none is available, wait in the queue until it is.
+                if not reserved:
+                    start = self._bucket(checker.host).reserve(now)
+                    if start > now:
+                        if self._in_time(start, checker):
+                            self._push(start, checker, reserved=True)
+                        continue
+
+                self._in_flight += 1
+                return checker
+
+    def _work(self):
+        """Attempt Checkers as they come due, requeuing failed attempts with backoff."""
+        while True:
+            checker = self._next()
+            if checker is None:
+                return
+            (succeeded, retry) = (False, True)
+            try:
+                succeeded = checker.attempt()
+            except Exception as e:
+                # Anything attempt() does not expect is recorded as the outcome, and not retried; the worker
+                # carries on with the other Checkers.
+                logger.exception('Unexpected error checking {0}'.format(checker.name))
+                checker.record_error(e)
+                retry = False
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                    if not succeeded and retry and checker.attempts < self.max_attempts:
+                        self._push(time.time() + self._backoff(checker.attempts), checker, reserved=False)
+                    self._condition.notify_all()
+
+    def _in_time(self, start, checker):
+        """(bool) Whether an attempt of the Checker started at the given time would finish before the deadline;
+        with no Checker, whether the given time is before the deadline."""
+        return self.deadline is None or start + (checker.TIMEOUT if checker else 0) <= self.deadline
+
+    def _backoff(self, attempts):
+        """(float) Seconds to wait after the given number of failed attempts; exponential, with full jitter."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1)))
+
+    def _bucket(self, host):
+        """(TokenBucket) The token bucket of the given host. Call with the condition held."""
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.per_host_rate, self.per_host_burst)
+        return self._buckets[host]
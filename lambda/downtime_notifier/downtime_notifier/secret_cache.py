@@ -0,0 +1,127 @@
+import imp
+import logging
+import threading
+import time
+
+from base64 import b64decode
+from clients import AwsClients
+
+logger = logging.getLogger()
+
+
+class SecretCache(object):
+    """KMS-decrypted secrets, cached by ciphertext for `ttl` seconds; kept across warm invocations."""
+
+    DEFAULT_TTL = 900
+    MAX_WORKERS = 8
+
+    _entries = {}
+    _lock = threading.Lock()
+    _ttl = DEFAULT_TTL
+
+    @classmethod
+    def configure(cls, ttl=DEFAULT_TTL):
+        """
+        Args:
+            ttl: (int) Seconds for which a decrypted value is reused before decrypting it again.
+        """
+        cls._ttl = int(ttl)
+
+    @classmethod
+    def get(cls, ciphertext):
+        """(str) The plaintext of the given base64 ciphertext; decrypted via KMS if not cached or expired.
+
+        Args:
+            ciphertext: (str) The base64 encoded KMS ciphertext.
+        """
+        with cls._lock:
+            entry = cls._entries.get(ciphertext)
+        if entry and entry[1] > time.time():
+            return entry[0]
+
+        plaintext = AwsClients.client('kms').decrypt(CiphertextBlob=b64decode(ciphertext))['Plaintext']
+        with cls._lock:
+            cls._entries[ciphertext] = (plaintext, time.time() + cls._ttl)
+        return plaintext
+
+    @classmethod
+    def prefetch(cls, ciphertexts, max_workers=None):
+        """Decrypt the given ciphertexts concurrently, so that later reads are served from the cache.
+
+        Failures (e.g. KMS throttling) are logged rather than raised; the value is decrypted again on first read.
+
+        Args:
+            ciphertexts: (list) Base64 encoded KMS ciphertexts.
+            max_workers: (int) The most decrypt calls to have in flight at once; MAX_WORKERS if None.
+        """
+        if not ciphertexts:
+            return
+        if imp.lock_held():
+            # Called as a module is imported, e.g. by configuration() as index is; a worker thread that imported
+            # anything (as boto3 does on first use) would wait on the import lock forever. Decrypt them here.
+            for ciphertext in ciphertexts:
+                cls._try_get(ciphertext)
+            return
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(max_workers or cls.MAX_WORKERS, len(ciphertexts)))
+        try:
+            pool.map(cls._try_get, ciphertexts)
+        finally:
+            pool.close()
+
+    @classmethod
+    def _try_get(cls, ciphertext):
+        try:
+            cls.get(ciphertext)
+        except Exception as e:
+            logger.warn('Unable to decrypt secret; will retry on first read. Exception: {0}'.format(e))
+
+    @classmethod
+    def invalidate(cls, ciphertext=None):
+        """Discard the cached plaintext of the given ciphertext, or of every ciphertext if None."""
+        with cls._lock:
+            if ciphertext is None:
+                cls._entries = {}
+            else:
+                cls._entries.pop(ciphertext, None)
+
+
+class EncryptedValue(object):
+    """A config value that is decrypted through the SecretCache when read."""
+
+    def __init__(self, ciphertext):
+        self.ciphertext = ciphertext
+
+    @property
+    def plaintext(self):
+        return SecretCache.get(self.ciphertext)
+
+    def __repr__(self):
+        return '<encrypted>'
+
+
+class ConfigBag(dict):
+    """A dict of config values, in which EncryptedValues are decrypted when read.
+
+    Values read by key, or through items() and values() (and their iterators), are decrypted. Copies made
+    with dict() or copy() are not: they hold the EncryptedValues, so that logging a copy does not log secrets.
+    """
+
+    def __getitem__(self, key):
+        value = super(ConfigBag, self).__getitem__(key)
+        return value.plaintext if isinstance(value, EncryptedValue) else value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def iteritems(self):
+        return ((key, self[key]) for key in self)
+
+    def itervalues(self):
+        return (self[key] for key in self)
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return list(self.itervalues())
@@ -0,0 +1,77 @@
+import logging
+import threading
+
+logger = logging.getLogger()
+
+
+class SessionPool(object):
+    """Process-wide keep-alive requests Sessions, one per scheme+host.
+
+    Sessions are held at class level, so they (and their open connections) survive across warm
+    invocations of the Lambda function. Their connections record request phases in the current CheckTiming.
+    They keep no cookies: every check sees what a fresh client would, though cookies set within one request's
+    redirects are still sent on along them.
+    """
+
+    DEFAULT_POOL_MAXSIZE = 10
+
+    _sessions = {}
+    _lock = threading.Lock()
+    _pool_maxsize = DEFAULT_POOL_MAXSIZE
+
+    @classmethod
+    def configure(cls, pool_maxsize=DEFAULT_POOL_MAXSIZE):
+        """Set the number of connections kept alive per host. Applies to Sessions created afterwards.
+
+        Args:
+            pool_maxsize: (int) The maximum number of connections to keep alive per host.
+        """
+        cls._pool_maxsize = int(pool_maxsize)
+
+    @classmethod
+    def session(cls, host):
+        """(requests.Session) The shared Session for the given host, created on first use.
+
+        Args:
+            host: (str) The scheme and network location; e.g. 'https://news.google.com'.
+        """
+        import cookielib
+        import requests
+        from timed_connections import TimedHTTPAdapter
+        with cls._lock:
+            if host not in cls._sessions:
+                session = requests.Session()
+                session.cookies.set_policy(cookielib.DefaultCookiePolicy(allowed_domains=[]))
+                adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=cls._pool_maxsize)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                cls._sessions[host] = session
+            return cls._sessions[host]
+
+    @classmethod
+    def stats(cls):
+        """(dict) Cumulative counts of requests made, and connections opened vs. reused, across all hosts."""
+        requests_made = 0
+        new_connections = 0
+        with cls._lock:
+            sessions = cls._sessions.values()
+        for session in sessions:
+            pools = session.get_adapter('http://').poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                requests_made += pool.num_requests
+                new_connections += pool.num_connections
+        return {'hosts': len(sessions),
+                'requests': requests_made,
+                'new_connections': new_connections,
+                'reused_connections': requests_made - new_connections}
+
+    @classmethod
+    def reset(cls):
+        """Close and discard every Session."""
+        with cls._lock:
+            for session in cls._sessions.values():
+                session.close()
+            cls._sessions = {}
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import time
+
+logger = logging.getLogger()
+
+
+def shard_index(name, shard_count):
+    """(int) The shard of the named site; stable across runs and processes, unlike hash().
+
+    Args:
+        name: (str) The name of the site.
+        shard_count: (int) The number of shards.
+    """
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    return int(hashlib.md5(name).hexdigest(), 16) % shard_count
+
+
+def shard_sites(sites, shard_count):
+    """(list) The sites split into shard_count lists, by the hash of their name.
+
+    Args:
+        sites: (list) Site dicts, as in the `sites` config key.
+        shard_count: (int) The number of shards.
+    """
+    shards = [[] for i in range(shard_count)]
+    for site in sites:
+        shards[shard_index(site['name'], shard_count)].append(site)
+    return shards
+
+
+def shard_event(index, shard_count, tick=None, deadline=None):
+    """(dict) The event that runs the function as the worker for one shard, on the coordinator's schedule tick,
+    returning by the coordinator's deadline."""
+    return {'shard': {'index': index, 'count': shard_count, 'tick': tick, 'deadline': deadline}}
+
+
+class LambdaShardRunner(object):
+    """Runs each shard as a concurrent, synchronous invocation of the deployed function itself."""
+
+    # Shards may run for as long as the function's own timeout, unless the coordinator has a deadline; and must
+    # not be retried, or they would run twice.
+    READ_TIMEOUT = 900
+
+    def __init__(self, function_arn):
+        """
+        Args:
+            function_arn: (str) The ARN of the function; i.e. context.invoked_function_arn.
+        """
+        assert(function_arn)
+        self.function_arn = function_arn
+
+    def run(self, shard_count, tick=None, deadline=None):
+        """(list) The result of each shard's invocation, in shard order.
+
+        Args:
+            shard_count: (int) The number of shards.
+            tick: (int) The schedule tick whose due sites the shards check.
+            deadline: (float) The time by which the shards must return; a shard still running then is failed.
+        """
+        import boto3
+        from botocore.config import Config
+        from multiprocessing.pool import ThreadPool
+        read_timeout = self.READ_TIMEOUT if deadline is None else max(1, int(deadline - time.time()))
+        # Not the shared client: its read timeout is this run's time left, so differs from run to run.
+        client = boto3.client('lambda', config=Config(read_timeout=read_timeout, retries={'max_attempts': 0}))
+        pool = ThreadPool(shard_count)
+        try:
+            return pool.map(lambda i: self._invoke(client, i, shard_count, tick, deadline), range(shard_count))
+        finally:
+            pool.close()
+
+    def _invoke(self, client, index, shard_count, tick, deadline):
+        """(dict) The result of invoking the function for one shard; with an 'error' key if it failed."""
+        try:
+            response = client.invoke(FunctionName=self.function_arn,
+                                     InvocationType='RequestResponse',
+                                     Payload=json.dumps(shard_event(index, shard_count, tick, deadline)))
+            payload = json.loads(response['Payload'].read())
+        except Exception as e:
+            payload = {'errorMessage': str(e)}
+            response = {'FunctionError': 'Unhandled'}
+        if 'FunctionError' in response:
+            logger.error('Shard {0} failed: {1}'.format(index, payload))
+            return {'shard': index, 'notify': [], 'error': payload.get('errorMessage', str(payload))}
+        return payload
+
+
+class LocalShardRunner(object):
+    """Runs each shard in a local process pool; for running the function, sharded, without AWS Lambda."""
+
+    def __init__(self, handler):
+        """
+        Args:
+            handler: (function) The module-level Lambda entry point; i.e. index.handler.
+        """
+        self.handler = handler
+
+    def run(self, shard_count, tick=None, deadline=None):
+        """(list) The result of each shard's run, in shard order.
+
+        Args:
+            shard_count: (int) The number of shards.
+            tick: (int) The schedule tick whose due sites the shards check.
+            deadline: (float) The time by which the shards must return.
+        """
+        import multiprocessing
+        pool = multiprocessing.Pool(shard_count)
+        try:
+            return pool.map(_run_local_shard, [(self.handler, shard_event(i, shard_count, tick, deadline))
+                                              for i in range(shard_count)])
+        finally:
+            pool.close()
+            pool.join()
+
+
+def _run_local_shard(args):
+    """Run the handler for one shard, in a pool process, with a simulated context; with an 'error' key if it
+    failed, as for LambdaShardRunner."""
+    from localcontext import LocalContext
+    (handler, event) = args
+    index = event['shard']['index']
+    try:
+        return handler(event, LocalContext())
+    except Exception as e:
+        logger.exception('Shard {0} failed'.format(index))
+        return {'shard': index, 'notify': [], 'error': '{0}: {1}'.format(type(e).__name__, e)}
@@ -1,13 +1,39 @@
-import boto3
 import logging
+import time
 
-from boto3.dynamodb.conditions import Key, Attr
+from clients import AwsClients
+from history import HistoryStore
 
 logger = logging.getLogger()
 
 
+def debounce(confirmed, observed, pending, confirm_after):
+    """Confirm a change of state only once it has been observed confirm_after times in a row.
+
+    Args:
+        confirmed: (bool) The confirmed state.
+        observed: (bool) The state observed by this check.
+        pending: (int) How many checks in a row, before this one, have disagreed with the confirmed state.
+        confirm_after: (int) How many checks in a row must disagree for the change to be confirmed.
+    Returns:
+        (tuple) The new confirmed state, the new pending count, and whether the state changed.
+    """
+    if observed == confirmed:
+        return (confirmed, 0, False)
+    if pending + 1 >= confirm_after:
+        return (observed, 0, True)
+    return (confirmed, pending + 1, False)
+
+
 class StateTracker(object):
 
+    # The range key of the per-target item that mirrors its most recent result, for BatchStateStore. It sorts
+    # after every str(datetime) timestamp; the per-site path does not keep it up to date, so it queries below it.
+    LATEST_TIMESTAMP = 'latest'
+    # Result items, full (str(datetime)) and compact (zero-padded epoch), have Timestamps starting with a digit;
+    # HistoryStore's rollups ('h#...', 'd#...') and the latest item sort above this.
+    RESULT_TIMESTAMP_BOUND = ':'
+
     def __init__(self, checker, dynamo_table_name, timestamp):
         """
         Args:
@@ -17,52 +43,258 @@ class StateTracker(object):
         """
         assert(all([checker, dynamo_table_name, timestamp]))
         self.checker = checker
-        self.dynamo = boto3.resource('dynamodb')
+        self.dynamo = AwsClients.resource('dynamodb')
         self.timestamp = str(timestamp)
-        self.table = self.dynamo.Table(dynamo_table_name)
+        self.epoch = int(time.mktime(timestamp.timetuple()))
+        self.table = AwsClients.table(dynamo_table_name)
         self._first_check = False
+        self._previous_slow = False
+        self._pending = 0
+        self._slow_pending = 0
+        self._confirmed = None
+        self._confirmed_slow = None
         self._notify = False
+        self._reason = None
+        # When the site is next due to be checked, as set by DueSchedule; None if not scheduled.
+        self.next_due = None
 
     def put_result(self):
         """Records the latest value of the check to the result table."""
         self._examine_latest()
+        self.evaluate()
+        self.table.put_item(Item=self.item)
 
-        # If it's either the first time around, or the state has changed, we should notify.
-        if self._first_check or self._previous_exceptional != self.checker.exceptional:
+    def evaluate(self):
+        """Decides whether to notify, by comparing the check against the previous, confirmed state.
+
+        A change of state is only confirmed (and notified) once the checker's confirm_after checks in a row
+        have shown it; the count so far is kept in the state item.
+        """
+        confirm_after = self.checker.confirm_after
+        # If it's the first time around, that is the confirmed state; we should notify.
+        if self._first_check:
+            (self._confirmed, self._confirmed_slow) = (self.checker.exceptional, self.checker.slow)
             self._notify = True
+            self._reason = 'first_check'
+            return
 
-        # Now write this new value to the table.
-        item = {
-          'TargetId': self.checker.name,
-          'TargetUrl': self.checker.url,
-          'Timestamp': self.timestamp,
-          'IsExceptional': self.checker.exceptional
-        }
-        if self.checker.exceptional:
-            item['message'] = self.checker.message
-        self.table.put_item(Item=item)
+        (self._confirmed, self._pending, changed) = debounce(
+            self._previous_exceptional, self.checker.exceptional, self._pending, confirm_after)
+        self._confirmed_slow = self._previous_slow
+        if changed:
+            self._notify = True
+            self._reason = 'down' if self._confirmed else 'up'
+            self._confirmed_slow = self.checker.slow
+            self._slow_pending = 0
+        # While up, crossing the slow threshold either way is a state change of its own.
+        elif not self._confirmed and not self.checker.exceptional:
+            (self._confirmed_slow, self._slow_pending, changed) = debounce(
+                self._previous_slow, self.checker.slow, self._slow_pending, confirm_after)
+            if changed:
+                self._notify = True
+                self._reason = 'slow' if self._confirmed_slow else 'recovered'
 
+    def load_previous(self, previous_item):
+        """Record the previous value of the check, as already fetched from the result table.
+
+        Args:
+            previous_item: (dict) The previous result item, or None if there is none.
+        """
+        if previous_item:      # There is a pre-existing check value.
+            self._previous_exceptional = previous_item.get('ConfirmedExceptional', previous_item['IsExceptional'])
+            self._previous_message = previous_item.get('message')
+            self._previous_slow = previous_item.get('ConfirmedSlow', previous_item.get('IsSlow', False))
+            self._pending = int(previous_item.get('PendingCount', 0))
+            self._slow_pending = int(previous_item.get('SlowPendingCount', 0))
+        else:                  # This is the first time we've seen this value.
+            self._first_check = True
 
     def _examine_latest(self):
-        """Examines the previous value of the check for this Checker."""
+        """Examines the previous value of the check for this Checker.
+
+        The previous result may be a compact one, if the table was written with `storage: compact` before.
+        """
+        from boto3.dynamodb.conditions import Key
         response = self.table.query(
             Limit=1,
             ScanIndexForward=False,
             ConsistentRead=True,
-            KeyConditionExpression=Key('TargetId').eq(self.checker.name))
-
-
-        if response['Count']:  # There is a pre-existing check value.
-            self._previous_exceptional = response['Items'][0]['IsExceptional']
-            self._previous_message = response['Items'][0].get('message')
-        else:                  # This is the first time we've seen this value.
-            self._first_check = True
+            KeyConditionExpression=Key('TargetId').eq(self.checker.name) &
+                Key('Timestamp').lt(self.RESULT_TIMESTAMP_BOUND))
 
+        previous_item = response['Items'][0] if response['Count'] else None
+        if previous_item and 'IsExceptional' not in previous_item:
+            previous_item = HistoryStore.full_item(previous_item)
+        self.load_previous(previous_item)
         logger.info(response)
 
+    @property
+    def item(self):
+        """(dict) The result item to write for this check."""
+        item = {
+          'TargetId': self.checker.name,
+          'TargetUrl': self.checker.url,
+          'Timestamp': self.timestamp,
+          'IsExceptional': self.checker.exceptional
+        }
+        if self.checker.exceptional:
+            item['message'] = self.checker.message
+        if self.checker.slow:
+            item['IsSlow'] = True
+        if self._confirmed is not None:
+            # The debounced state, which may lag the observed one; see evaluate.
+            item['ConfirmedExceptional'] = self._confirmed
+            item['ConfirmedSlow'] = self._confirmed_slow
+            item['PendingCount'] = self._pending
+            item['SlowPendingCount'] = self._slow_pending
+        if self.checker.timing:
+            # Milliseconds, in the order of CheckTiming.PHASES.
+            item['Timings'] = self.checker.timing.milliseconds
+            item['Attempts'] = self.checker.attempts
+            item['BytesRead'] = self.checker.bytes_read
+        if self.next_due is not None:
+            item['NextDue'] = self.next_due
+        if not self.checker.exceptional:
+            # Where expected_text was found, for the next check to make a conditional GET against.
+            item.update(self.checker.validators)
+        return item
+
+    @property
+    def latest_item(self):
+        """(dict) The item mirroring this result under the LATEST_TIMESTAMP key, for bulk reads."""
+        item = self.item
+        item['Timestamp'] = self.LATEST_TIMESTAMP
+        item['CheckedAt'] = self.timestamp
+        return item
 
     @property
     def notify(self):
         """(bool) Whether or not the tracked situation warrants notification."""
         return self._notify
 
+    @property
+    def reason(self):
+        """(str) Why to notify: 'first_check', 'down', 'up', 'slow' or 'recovered'; None if not notifying."""
+        return self._reason
+
+    @property
+    def summary(self):
+        """(dict) The checker's summary, with the reason for notification and a message fit for it."""
+        summary = dict(self.checker.summary, reason=self._reason)
+        if self.checker.slow:
+            summary['message'] = 'Slow response from {0}: took {1}ms, over the {2}ms threshold ({3})'.format(
+                self.checker.name, self.checker.timing.as_dict()['total'], self.checker.slow_threshold_ms,
+                self.checker.timing)
+        return summary
+
+
+class BatchStateStore(object):
+    """Reads the previous state of, and writes the results for, a whole run of StateTrackers in bulk.
+
+    Rather than one query and one put_item per target, the latest result of each target is mirrored to
+    an item with a LATEST_TIMESTAMP range key; these are read with BatchGetItem, and all items are
+    written with BatchWriteItem. Given a HistoryStore, results are written in its compact form instead,
+    and its rollup items are read and rewritten in the same batches.
+    """
+
+    BATCH_GET_SIZE = 100
+    BATCH_WRITE_SIZE = 25
+    MAX_ATTEMPTS = 8
+    BACKOFF_SECONDS = 0.05
+
+    def __init__(self, dynamo_table_name, history=None):
+        """
+        Args:
+            dynamo_table_name: (str) Name of the DynamoDB table to interrogate.
+            history: (HistoryStore) Write compact results and rollups with this; None for full result items.
+        """
+        assert(dynamo_table_name)
+        self.dynamo = AwsClients.resource('dynamodb')
+        self.table_name = dynamo_table_name
+        self.history = history
+        self._latest = {}
+
+    def load_latest(self, target_ids):
+        """Read the latest result items of the given targets ahead of the run, e.g. for their validators.
+
+        put_results then reuses them, rather than reading them again.
+
+        Args:
+            target_ids: (list) The names of the targets.
+        Returns:
+            (dict) The latest result items that exist, keyed by TargetId.
+        """
+        keys = [{'TargetId': name, 'Timestamp': StateTracker.LATEST_TIMESTAMP} for name in target_ids
+                if (name, StateTracker.LATEST_TIMESTAMP) not in self._latest]
+        self._latest.update(self._batch_get(keys))
+        return dict((name, self._latest[(name, StateTracker.LATEST_TIMESTAMP)]) for name in target_ids
+                    if (name, StateTracker.LATEST_TIMESTAMP) in self._latest)
+
+    def put_results(self, trackers):
+        """Load the previous state of each tracker, decide on notification, and write all results.
+
+        Args:
+            trackers: (list) StateTracker objects for this run.
+        """
+        keys = [{'TargetId': t.checker.name, 'Timestamp': StateTracker.LATEST_TIMESTAMP} for t in trackers]
+        keys = [k for k in keys if (k['TargetId'], k['Timestamp']) not in self._latest]
+        if self.history:
+            keys.extend(self.history.rollup_keys(trackers))
+        existing = dict(self._latest)
+        existing.update(self._batch_get(keys))
+        for tracker in trackers:
+            previous_item = existing.get((tracker.checker.name, StateTracker.LATEST_TIMESTAMP))
+            if previous_item is None:
+                # Targets recorded before the latest items existed fall back to a query.
+                tracker._examine_latest()
+            else:
+                tracker.load_previous(previous_item)
+            tracker.evaluate()
+
+        items = []
+        for tracker in trackers:
+            raw_item = self.history.raw_item(tracker) if self.history else tracker.item
+            items.extend([raw_item, tracker.latest_item])
+        if self.history:
+            items.extend(self.history.rollup_items(trackers, existing))
+        self._batch_write(items)
+
+    def _batch_get(self, keys):
+        """(dict) Those of the items with the given keys that exist, keyed by (TargetId, Timestamp)."""
+        keys = dict(((k['TargetId'], k['Timestamp']), k) for k in keys).values()  # A batch may not repeat a key.
+        found = {}
+        for i in range(0, len(keys), self.BATCH_GET_SIZE):
+            request = {self.table_name: {'Keys': keys[i:i + self.BATCH_GET_SIZE], 'ConsistentRead': True}}
+            for attempt in range(self.MAX_ATTEMPTS):
+                response = self.dynamo.batch_get_item(RequestItems=request)
+                for item in response.get('Responses', {}).get(self.table_name, []):
+                    found[(item['TargetId'], item['Timestamp'])] = item
+                request = response.get('UnprocessedKeys')
+                if not request:
+                    break
+                self._backoff(attempt)
+            else:
+                raise RuntimeError('Unable to read {0} keys after {1} attempts'.format(
+                    len(request[self.table_name]['Keys']), self.MAX_ATTEMPTS))
+        return found
+
+    def _batch_write(self, items):
+        """Write all of the given items, retrying any that DynamoDB leaves unprocessed."""
+        # A batch may not contain the same key twice (e.g. two sites sharing a name); the last item wins.
+        unique = dict(((item['TargetId'], item['Timestamp']), item) for item in items).values()
+        for i in range(0, len(unique), self.BATCH_WRITE_SIZE):
+            request = {self.table_name: [{'PutRequest': {'Item': item}}
+                                         for item in unique[i:i + self.BATCH_WRITE_SIZE]]}
+            for attempt in range(self.MAX_ATTEMPTS):
+                response = self.dynamo.batch_write_item(RequestItems=request)
+                request = response.get('UnprocessedItems')
+                if not request:
+                    break
+                self._backoff(attempt)
+            else:
+                raise RuntimeError('Unable to write {0} items after {1} attempts'.format(
+                    len(request[self.table_name]), self.MAX_ATTEMPTS))
+
+    def _backoff(self, attempt):
+        """Sleep with exponential backoff before retrying unprocessed items."""
+        time.sleep(self.BACKOFF_SECONDS * (2 ** attempt))
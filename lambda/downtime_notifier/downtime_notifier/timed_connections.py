@@ -0,0 +1,92 @@
+import socket
+import time
+
+import requests
+from urllib3 import connection
+from urllib3 import connectionpool
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+
+from dns_cache import DnsCache
+from timing import CheckTiming
+
+
+def _record(phase, started):
+    """Add the time since started to a phase of the current CheckTiming, if there is one."""
+    timing = CheckTiming.current()
+    if timing is not None:
+        timing.add(phase, time.time() - started)
+
+
+class TimedHTTPConnection(connection.HTTPConnection):
+    """An HTTPConnection that records DNS, connect and time to first byte in the current CheckTiming.
+
+    The host is resolved separately from connecting, through the shared DnsCache, so the two can be timed apart;
+    each resolved address is then tried in turn, as socket.create_connection would.
+    """
+
+    def resolve(self):
+        """(list) The addresses of the host, to connect to in order."""
+        started = time.time()
+        try:
+            return DnsCache.resolve(self._dns_host, self.port, allowed_gai_family())
+        except socket.gaierror as e:
+            raise NewConnectionError(self, 'Failed to establish a new connection: {0}'.format(e))
+        finally:
+            _record('dns', started)
+
+    def _new_conn(self):
+        addresses = self.resolve()
+        dns_host = self._dns_host
+        started = time.time()
+        try:
+            for (i, address) in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    return super(TimedHTTPConnection, self)._new_conn()
+                except (NewConnectionError, ConnectTimeoutError):
+                    if i == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = dns_host
+            _record('connect', started)
+
+    def getresponse(self, *args, **kwargs):
+        started = time.time()
+        try:
+            return super(TimedHTTPConnection, self).getresponse(*args, **kwargs)
+        finally:
+            _record('ttfb', started)
+
+
+class TimedHTTPSConnection(TimedHTTPConnection, connection.HTTPSConnection):
+    """A TimedHTTPConnection for HTTPS, which also records the TLS handshake."""
+
+    def connect(self):
+        timing = CheckTiming.current()
+        before = (timing.phases['dns'] + timing.phases['connect']) if timing else 0.0
+        started = time.time()
+        try:
+            super(TimedHTTPSConnection, self).connect()
+        finally:
+            if timing is not None:
+                # Whatever connect() spent beyond resolving and opening the socket was the handshake.
+                timing.add('tls', time.time() - started - (timing.phases['dns'] + timing.phases['connect'] - before))
+
+
+class TimedHTTPConnectionPool(connectionpool.HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(connectionpool.HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+    """An HTTPAdapter whose connection pools record request phases in the current CheckTiming."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(TimedHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool,
+                                                   'https': TimedHTTPSConnectionPool}
@@ -0,0 +1,55 @@
+import threading
+import time
+
+
+class CheckTiming(object):
+    """The time spent in each phase of a single request: DNS, connect, TLS, time to first byte, and total.
+
+    While active (as a context manager), the timing is current for its thread, and the instrumented
+    connections in timed_connections add the phases they see to it. Phases that a reused keep-alive
+    connection skips stay at zero.
+    """
+
+    PHASES = ('dns', 'connect', 'tls', 'ttfb', 'total')
+
+    _local = threading.local()
+
+    def __init__(self):
+        self.phases = dict((phase, 0.0) for phase in self.PHASES)
+        self._started = None
+
+    @classmethod
+    def current(cls):
+        """(CheckTiming) The timing active on this thread; None if there is none."""
+        return getattr(cls._local, 'timing', None)
+
+    def add(self, phase, seconds):
+        """Add time to a phase.
+
+        Args:
+            phase: (str) One of PHASES.
+            seconds: (float) The time spent.
+        """
+        self.phases[phase] += seconds
+
+    def __enter__(self):
+        self._started = time.time()
+        self._local.timing = self
+        return self
+
+    def __exit__(self, *exc_info):
+        self.phases['total'] = time.time() - self._started
+        self._local.timing = None
+        return False
+
+    @property
+    def milliseconds(self):
+        """(list) The phases in milliseconds, as ints in the order of PHASES; a compact form for storage."""
+        return [int(round(self.phases[phase] * 1000)) for phase in self.PHASES]
+
+    def as_dict(self):
+        """(dict) The phases in milliseconds, keyed by phase name."""
+        return dict(zip(self.PHASES, self.milliseconds))
+
+    def __str__(self):
+        return ', '.join('{0} {1}ms'.format(phase, ms) for (phase, ms) in zip(self.PHASES, self.milliseconds))
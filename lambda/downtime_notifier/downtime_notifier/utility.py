@@ -1,4 +1,4 @@
-import boto3
+from clients import AwsClients
 
 
 class Utility(object):
@@ -10,6 +10,6 @@ class Utility(object):
     def aws_account_id(cls):
         """Query for the current account ID by inspecting the default security group."""
         if cls._aws_account_id is None:
-            cls._aws_account_id = int(boto3.client('ec2').describe_security_groups(
+            cls._aws_account_id = int(AwsClients.client('ec2').describe_security_groups(
                 GroupNames=['default'])['SecurityGroups'][0]['OwnerId'])
         return cls._aws_account_id
@@ -0,0 +1,68 @@
+class StreamingTextValidator(object):
+    """Searches a streamed response body for expected text, a chunk at a time.
+
+    Reading stops as soon as the text is found, or once max_body_size bytes have been read. A match may span
+    chunk boundaries, so the tail of each chunk is carried into the search of the next.
+    """
+
+    CHUNK_SIZE = 16 * 1024
+
+    def __init__(self, expected_text, max_body_size=None):
+        """
+        Args:
+            expected_text: (str) The text to search for.
+            max_body_size: (int) The most bytes of the body to read; None to read it all if need be.
+        """
+        assert(expected_text)
+        self.expected_text = expected_text
+        self.max_body_size = max_body_size
+
+    def search(self, response):
+        """Read the body of the response until the expected text is found.
+
+        Args:
+            response: (requests.Response) A response requested with stream=True.
+        Returns:
+            (tuple) (bool) Whether the text was found, and (int) the number of body bytes read.
+        """
+        needle = self.expected_text
+        if isinstance(needle, unicode):
+            needle = needle.encode(response.encoding or 'utf-8', 'replace')
+
+        bytes_read = 0
+        tail = ''
+        for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+            if self.max_body_size is not None:
+                chunk = chunk[:self.max_body_size - bytes_read]
+            bytes_read += len(chunk)
+            if needle in tail + chunk:
+                return (True, bytes_read)
+            tail = (tail + chunk)[-(len(needle) - 1):] if len(needle) > 1 else ''
+            if self.max_body_size is not None and bytes_read >= self.max_body_size:
+                break
+        return (False, bytes_read)
+
+
+# Reading off at most this many remaining body bytes lets a connection go back to the pool; beyond it, the
+# connection is closed instead, as reading the rest would cost more than a new connection.
+DRAIN_LIMIT = 64 * 1024
+
+
+def release(response):
+    """Release a streamed response; returning its connection to the pool if the rest of the body is small.
+
+    Args:
+        response: (requests.Response) A response requested with stream=True.
+    Returns:
+        (int) The number of further body bytes read.
+    """
+    drained = 0
+    try:
+        remaining = int(response.headers.get('Content-Length')) - response.raw.tell()
+    except (TypeError, ValueError):
+        remaining = None
+    if remaining is not None and 0 < remaining <= DRAIN_LIMIT:
+        for chunk in response.iter_content(chunk_size=DRAIN_LIMIT):
+            drained += len(chunk)
+    response.close()
+    return drained
@@ -1,11 +1,28 @@
-import boto3
+import calendar
 import datetime
 import logging
+import os
 import sys
+import time
 
 from downtime_notifier import configuration
+from downtime_notifier import AlertWindow
+from downtime_notifier import AwsClients
 from downtime_notifier import Checker
+from downtime_notifier import DnsCache
+from downtime_notifier import DueSchedule
+from downtime_notifier import engine_from_config
+from downtime_notifier import LocalContext
+from downtime_notifier import RunMetrics
+from downtime_notifier import shard_sites
+from downtime_notifier import SiteRegistry
+from downtime_notifier import LambdaShardRunner
+from downtime_notifier import LocalShardRunner
+from downtime_notifier import SessionPool
 from downtime_notifier import StateTracker
+from downtime_notifier import BatchStateStore
+from downtime_notifier import HistoryStore
+from downtime_notifier.config import SITE_REGISTRY_FILE
 
 
 MAX_LEN = 100
@@ -31,55 +48,220 @@ def setup_logging(request_id):
 
 
 def handler(event, context):
-    """Entry point for the Lambda function."""
+    """Entry point for the Lambda function.
+
+    With `shard_count` > 1, this invocation is the coordinator: it runs each shard of the sites as a separate
+    invocation of this handler (or, locally, in a process pool), and notifies on their merged results. An event
+    with a `shard` key runs this invocation as the worker for that shard, and returns its results.
+
+    Only the sites due on this invocation's schedule tick (see SiteRegistry and DueSchedule) are checked.
+    """
     global logger
     logger = setup_logging(context.aws_request_id)
     logger.info('Using configuration: {0}'.format(CONFIG))
     logger.info('Using event: {0}'.format(event))
     logger.info('Using context: {0}'.format(context))
 
+    env = CONFIG.get('env', {})
+    registry = site_registry(env)
+    shard = (event or {}).get('shard')
+    shard_count = int(env.get('shard_count', 1))
+    if shard:
+        # The coordinator's tick, if it was a scheduled invocation.
+        tick = shard.get('tick')
+        schedule = due_schedule(env, registry, tick, shard=shard['index'])
+        tick = registry.tick(time.time()) if tick is None else tick
+        sites = shard_sites(registry.due(tick), shard['count'])[shard['index']]
+        logger.info('Checking shard {0} of {1}: {2} sites'.format(shard['index'], shard['count'], len(sites)))
+        return {'shard': shard['index'], 'notify': check_sites(sites, context, schedule,
+                                                               return_by=shard.get('deadline'))}
 
-    # Build a Checker object; start each as a thread and join on the set.
-    checkers = []
-    for site in CONFIG.get('env', {}).get('sites', []):
-        c = Checker(**site)
-        c.start()
-        checkers.append(c)
-
-    for checker in checkers:
-        checker.join()
-
-    # Record the outcome of each Checker in the result table via a StateTracker.
-    timestamp = datetime.datetime.now()
-    trackers = [StateTracker(c, CONFIG['env']['dynamo_table'], timestamp) for c in checkers]
-    for tracker in trackers:
-        tracker.put_result()
+    # Only scheduled invocations keep to due times; others (e.g. `fab invoke`) check all of their tick's sites.
+    tick = registry.tick(event_epoch(event))
+    scheduled = bool((event or {}).get('time'))
+    if shard_count > 1:
+        if isinstance(context, LocalContext):
+            runner = LocalShardRunner(handler)
+        else:
+            runner = LambdaShardRunner(context.invoked_function_arn)
+        # Shards must return in time for this invocation to record and notify their results.
+        deadline = time.time() + context.get_remaining_time_in_millis() / 1000.0 - env.get(
+            'deadline_margin_seconds', 20)
+        results = runner.run(shard_count, tick if scheduled else None, deadline)
+        to_notify = [summary for result in results for summary in result['notify']]
+        to_notify += shard_failures(results, shard_sites(registry.due(tick), shard_count), context)
+    else:
+        sites = registry.due(tick)
+        logger.info('Tick {0}: {1} of {2} sites due'.format(tick, len(sites), len(registry)))
+        to_notify = check_sites(sites, context, due_schedule(env, registry, tick if scheduled else None))
 
-    # Notify the SNS topic if any StateTracker indicates thusly.
-    checkers_to_notify = [t.checker for t in trackers if t.notify]
-    if checkers_to_notify:
-        if any([c.exceptional for c in checkers_to_notify]):
+    # Notify the SNS topic if any StateTracker indicates thusly; grouped across runs, if so configured.
+    to_notify = AlertWindow(env['dynamo_table'], env.get('alert_window_seconds', 0)).collect(to_notify)
+    if to_notify:
+        if any([r['exceptional'] for r in to_notify]):
             title_prefix = CONFIG['env']['downtime_detected_prefix']
+        elif any([r.get('reason') == 'slow' for r in to_notify]):
+            title_prefix = CONFIG['env'].get('slow_detected_prefix', 'Slow Response Detected!')
         else:
             title_prefix = CONFIG['env']['state_changed_prefix']
         logger.warn('{0} Will notify SNS topic'.format(title_prefix))
-        notify(checkers_to_notify, title_prefix)
+        notify(to_notify, title_prefix)
     else:
         logger.info('All checks passed.')
 
 
-def notify(checkers, title_prefix):
+def site_registry(env):
+    """(SiteRegistry) The registry compiled by `fab build`, if there is one; otherwise one compiled from `sites`."""
+    if os.path.exists(SITE_REGISTRY_FILE):
+        return SiteRegistry.load(SITE_REGISTRY_FILE)
+    return SiteRegistry.from_sites(env.get('sites', []), env)
+
+
+def due_schedule(env, registry, tick, shard=None):
+    """(DueSchedule) The due times of the sites on a scheduled invocation's tick; None if tick is None."""
+    if tick is None:
+        return None
+    return DueSchedule(env['dynamo_table'], tick * registry.tick_seconds, registry.tick_seconds, shard=shard)
+
+
+def shard_failures(results, shards, context):
+    """(list) An exceptional summary per shard that failed, so that its unchecked sites are notified of.
+
+    Args:
+        results: (list) The result of each shard, in shard order; with an 'error' key if it failed.
+        shards: (list) The sites of each shard, in shard order.
+        context: (object) The Lambda context.
+    """
+    summaries = []
+    for result in results:
+        if not result.get('error'):
+            continue
+        index = result['shard']
+        summaries.append({'name': 'Shard {0}'.format(index), 'url': context.invoked_function_arn,
+                          'exceptional': True, 'reason': 'shard_failed',
+                          'message': 'Shard {0} of {1} failed, so its {2} sites were not checked: {3}'.format(
+                              index, len(shards), len(shards[index]), result['error'])})
+    return summaries
+
+
+def event_epoch(event):
+    """(float) The time a scheduled event was for, so that a late invocation keeps its tick; otherwise now."""
+    if event and event.get('time'):
+        return calendar.timegm(time.strptime(event['time'], '%Y-%m-%dT%H:%M:%SZ'))
+    return time.time()
+
+
+def check_sites(sites, context, schedule=None, return_by=None):
+    """Check the given sites, and record their outcomes in the result table.
+
+    Args:
+        sites: (list) Site dicts, as in the `sites` config key.
+        context: (object) The Lambda context.
+        schedule: (DueSchedule) Check only those of the sites that are due, in its order; None to check them all.
+        return_by: (float) The time by which to return, if sooner than the context's; e.g. a coordinator's deadline.
+    Returns:
+        (list) Summaries of the checks whose StateTracker indicates notification.
+    """
+    # Build a Checker object per site, and run the set on the configured engine. Connections are
+    # pooled per host, and hosts' addresses cached, across warm invocations.
+    SessionPool.configure(CONFIG.get('env', {}).get('pool_maxsize_per_host', SessionPool.DEFAULT_POOL_MAXSIZE))
+    DnsCache.configure(CONFIG.get('env', {}).get('dns_ttl', DnsCache.DEFAULT_TTL))
+    pool_stats = SessionPool.stats()
+    dns_stats = DnsCache.stats()
+    # The run must finish with enough time left to record results and notify, whatever the checks do.
+    margin = CONFIG.get('env', {}).get('deadline_margin_seconds', 20)
+    deadline = time.time() + context.get_remaining_time_in_millis() / 1000.0 - margin
+    if return_by is not None:
+        deadline = min(deadline, return_by - margin)
+    site_defaults = {'slow_threshold_ms': CONFIG.get('env', {}).get('slow_threshold_ms'),
+                     'confirm_after': CONFIG.get('env', {}).get('confirm_after', 1),
+                     'conditional_get': CONFIG.get('env', {}).get('conditional_get', False)}
+    store = state_store(CONFIG['env'])
+    if schedule:
+        sites = schedule.due(sites, store)
+    checkers = [Checker(**dict(site_defaults, **site)) for site in sites]
+    load_validators(checkers, store)
+    prefetch_started = time.time()
+    if CONFIG.get('env', {}).get('dns_prefetch', True):
+        # Resolve every host at once up front, rather than as each check first connects to it.
+        DnsCache.prefetch([c.hostname for c in checkers if c.hostname], CONFIG.get('env', {}).get('dns_prefetch_workers'))
+    prefetch_seconds = time.time() - prefetch_started
+    engine_from_config(CONFIG.get('env', {}), deadline=deadline).run(checkers)
+    run_pool_stats = SessionPool.stats()
+    logger.info('Connection pool: {0} new connections, {1} reused'.format(
+        run_pool_stats['new_connections'] - pool_stats['new_connections'],
+        run_pool_stats['reused_connections'] - pool_stats['reused_connections']))
+    run_dns_stats = DnsCache.stats()
+    run_dns_stats = dict((k, run_dns_stats[k] - dns_stats[k])
+                         for k in ('hits', 'misses', 'failures', 'resolution_seconds'))
+    run_dns_stats['prefetch_seconds'] = prefetch_seconds
+    logger.info('DNS: {0} lookups ({1} failed) taking {2:.0f}ms, {3} cache hits; prefetch took {4:.0f}ms'.format(
+        run_dns_stats['misses'], run_dns_stats['failures'], run_dns_stats['resolution_seconds'] * 1000,
+        run_dns_stats['hits'], prefetch_seconds * 1000))
+
+    # Record the outcome of each Checker in the result table via a StateTracker. Any that were not checked
+    # before the deadline keep their previous state, and are carried over to the next tick.
+    if schedule:
+        schedule.carry_over(checkers)
+    checkers = [c for c in checkers if c.checked]
+    RunMetrics(CONFIG.get('env', {}).get('metrics_namespace', 'DowntimeNotifier'),
+               per_site=CONFIG.get('env', {}).get('metrics_per_site', False)).emit(checkers, dns=run_dns_stats)
+    timestamp = datetime.datetime.now()
+    trackers = [StateTracker(c, CONFIG['env']['dynamo_table'], timestamp) for c in checkers]
+    if schedule:
+        for tracker in trackers:
+            tracker.next_due = schedule.next_due(tracker.checker)
+    if store:
+        store.put_results(trackers)
+    else:
+        for tracker in trackers:
+            tracker.put_result()
+    return [t.summary for t in trackers if t.notify]
+
+
+def state_store(env):
+    """(BatchStateStore) The store to record results with, per the environment; None to record them per site."""
+    if env.get('storage') == 'compact':
+        return BatchStateStore(env['dynamo_table'], history=HistoryStore(env['dynamo_table'], env.get('ttl_days')))
+    elif env.get('batch_state'):
+        return BatchStateStore(env['dynamo_table'])
+    return None
+
+
+def load_validators(checkers, store):
+    """Give conditional_get checkers the ETag and Last-Modified recorded by their previous check.
+
+    Args:
+        checkers: (list) The Checker objects of the run.
+        store: (BatchStateStore) The state store, whose latest items hold the validators; None if there is none.
+    """
+    conditional = [c for c in checkers if c.conditional_get and c.expected_text]
+    if not conditional:
+        return
+    if not store:
+        logger.warn('conditional_get needs batch_state or compact storage; checking {0} sites in full'.format(
+            len(conditional)))
+        return
+    latest = store.load_latest([c.name for c in conditional])
+    for checker in conditional:
+        item = latest.get(checker.name) or {}
+        checker.use_validators(item.get('ETag'), item.get('LastModified'))
+
+
+def notify(results, title_prefix):
     """Craft a message about the site downtime, and publish to the SNS topic.
 
     Args:
-        checkers: (list) Sites which failed the check.
+        results: (list) Summaries (see StateTracker.summary) of the sites to notify about.
         title_prefix: (str) A prefix for the SNS message.
     """
-    subject = "{0} {1}".format(title_prefix, ', '.join([r.name for r in checkers]))
+    subject = "{0} {1}".format(title_prefix, ', '.join([r['name'] for r in results]))
     message = '\n\n'.join(
-        ['{0}) {1} ({2}): {3}'.format(i, r.name, r.url, r.message) for i, r in enumerate(checkers)])
+        ['{0}) {1} ({2}): {3}{4}'.format(i, r['name'], r['url'], r['message'],
+                                        ' [changed state {0} times]'.format(r['changes']) if r.get('changes', 1) > 1 else '')
+         for i, r in enumerate(results)])
 
-    client = boto3.client('sns')
+    client = AwsClients.client('sns')
     response = client.publish(
         TopicArn=CONFIG['env']['topic_arn'],
         Message=message,
@@ -90,6 +272,5 @@ def notify(checkers, title_prefix):
 
 if __name__ == '__main__':
     # For invoking the lambda function in the local environment.
-    from downtime_notifier import LocalContext
     context = LocalContext()
     handler(None, context)
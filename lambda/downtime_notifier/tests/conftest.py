@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+LAMBDA_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, LAMBDA_ROOT)
+
+
+@pytest.fixture
+def dynamodb():
+    """A moto DynamoDB with the result table; yields an AwsCallCounter of the calls made against it."""
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+    from moto import mock_dynamodb2
+    from fakes import AwsCallCounter
+    from downtime_notifier import AwsClients
+    from fakes import create_table
+    with mock_dynamodb2():
+        counter = AwsCallCounter().install()
+        AwsClients.reset()
+        create_table()
+        counter.reset()
+        yield counter
+    AwsClients.reset()
@@ -0,0 +1,63 @@
+"""Stand-ins shared by the tests and the benchmarks: a fake Checker, the moto result table, and an AWS call
+counter. The benchmarks import them from here, so that editing a benchmark cannot break a test."""
+import collections
+
+import boto3
+
+
+TABLE = 'ResultTable'
+
+
+class FakeChecker(object):
+    """Stands in for a Checker that has been run, for StateTrackers: up or down, with a fixed timing."""
+
+    def __init__(self, i, exceptional):
+        from downtime_notifier import CheckTiming
+        self.name = 'site-{0}'.format(i)
+        self.url = 'http://127.0.0.1/{0}'.format(i)
+        self.exceptional = exceptional
+        self.message = 'down' if exceptional else 'up'
+        self.slow = False
+        self.confirm_after = 1
+        self.attempts = 1
+        self.bytes_read = 0
+        self.validators = {}
+        self.interval = None
+        self.timing = CheckTiming()
+        self.timing.phases.update(dns=0.002, connect=0.01, tls=0.03, ttfb=0.05 + i % 7 * 0.1, total=0.1 + i % 7 * 0.1)
+
+
+def create_table():
+    """Create the result table, with the keys of the stack's, in the current (moto) DynamoDB."""
+    boto3.resource('dynamodb').create_table(
+        TableName=TABLE,
+        KeySchema=[{'AttributeName': 'TargetId', 'KeyType': 'HASH'},
+                   {'AttributeName': 'Timestamp', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'TargetId', 'AttributeType': 'S'},
+                              {'AttributeName': 'Timestamp', 'AttributeType': 'S'}],
+        ProvisionedThroughput={'ReadCapacityUnits': 10, 'WriteCapacityUnits': 10})
+
+
+class AwsCallCounter(object):
+    """Counts every API call made by boto3 clients created after install(), by operation name.
+
+    Clients copy the event hooks of the session they are created from, so this must be installed
+    before the code under measurement creates its clients (and after moto has reset the default session).
+    """
+
+    def __init__(self):
+        self.calls = collections.Counter()
+
+    def install(self):
+        boto3.setup_default_session()
+        boto3.DEFAULT_SESSION.events.register('before-call', self._count)
+        return self
+
+    def reset(self):
+        self.calls.clear()
+
+    def _count(self, model, **kwargs):
+        self.calls['{0}.{1}'.format(model.service_model.service_name, model.name)] += 1
+
+    def __str__(self):
+        return ', '.join('{0}={1}'.format(k, v) for (k, v) in sorted(self.calls.items())) or 'none'
@@ -0,0 +1,54 @@
+import datetime
+
+from fakes import FakeChecker
+from fakes import TABLE
+
+
+RUN_SECONDS = 300
+
+
+def notifications(sequence, confirm_after, window_seconds=0):
+    """The alerts released for a site whose checks are exceptional per the sequence; after its first check."""
+    from downtime_notifier import AlertWindow
+    from downtime_notifier import BatchStateStore
+    from downtime_notifier import StateTracker
+
+    released = []
+    for (run_number, exceptional) in enumerate(sequence):
+        checker = FakeChecker(0, exceptional)
+        checker.confirm_after = confirm_after
+        tracker = StateTracker(checker, TABLE, datetime.datetime(2026, 1, 1) +
+                               datetime.timedelta(seconds=run_number * RUN_SECONDS))
+        BatchStateStore(TABLE).put_results([tracker])
+        summaries = []
+        if tracker.notify and tracker.reason != 'first_check':
+            summaries.append(dict(name=checker.name, exceptional=exceptional, reason=tracker.reason))
+        released.extend(AlertWindow(TABLE, window_seconds).collect(summaries, now=run_number * RUN_SECONDS + 1))
+    return released
+
+
+def test_flapping_is_not_notified_with_confirm_after_2(dynamodb):
+    flaps = [False] + [True, False] * 10
+    assert notifications(flaps, confirm_after=2) == []
+
+
+def test_flapping_is_notified_on_every_change_with_confirm_after_1(dynamodb):
+    flaps = [False] + [True, False] * 10
+    assert len(notifications(flaps, confirm_after=1)) == 20
+
+
+def test_sustained_outage_is_notified_once(dynamodb):
+    released = notifications([False] + [True] * 10, confirm_after=2)
+    assert [(a['exceptional'], a['reason']) for a in released] == [(True, 'down')]
+
+
+def test_recovery_is_notified_once_confirmed(dynamodb):
+    released = notifications([False] + [True] * 5 + [False] * 5, confirm_after=2)
+    assert [a['reason'] for a in released] == ['down', 'up']
+
+
+def test_alert_window_groups_changes(dynamodb):
+    released = notifications([False, True, False, True, False, False, False, False], confirm_after=1,
+                             window_seconds=900)
+    # Four changes within the window, released together as one alert.
+    assert [(a['reason'], a['changes']) for a in released] == [('up', 4)]
@@ -0,0 +1,91 @@
+import threading
+import time
+
+
+class SleepingChecker(object):
+    """Stands in for a Checker: sleeps for a time, and records the most checks of its host in flight at once."""
+
+    def __init__(self, host, seconds, tracker):
+        self.name = host
+        self.host = host
+        self.seconds = seconds
+        self.tracker = tracker
+        self.finished = None
+
+    def run(self):
+        self.tracker.enter(self.host)
+        time.sleep(self.seconds)
+        self.tracker.leave(self.host)
+        self.finished = time.time()
+
+
+class FailingChecker(SleepingChecker):
+    """Raises from run, as a check might on something it does not expect."""
+
+    def run(self):
+        self.tracker.enter(self.host)
+        self.tracker.leave(self.host)
+        raise ValueError('unexpected')
+
+    def record_error(self, e):
+        self.finished = time.time()
+        self.error = e
+
+
+class InFlightTracker(object):
+    def __init__(self):
+        self.in_flight = {}
+        self.peak = {}
+        self._lock = threading.Lock()
+
+    def enter(self, host):
+        with self._lock:
+            self.in_flight[host] = self.in_flight.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), self.in_flight[host])
+
+    def leave(self, host):
+        with self._lock:
+            self.in_flight[host] -= 1
+
+
+def test_workers_do_not_wait_on_a_busy_host():
+    from downtime_notifier.engine import PoolEngine
+
+    tracker = InFlightTracker()
+    # The slow host's checks are queued first; with 4 workers and a limit of 1 per host, the other 3 workers
+    # must check the fast host meanwhile, rather than wait on the slow one.
+    slow = [SleepingChecker('slow', 0.2, tracker) for i in range(5)]
+    fast = [SleepingChecker('fast-{0}'.format(i % 10), 0.02, tracker) for i in range(30)]
+    start = time.time()
+    PoolEngine(max_concurrency=4, per_host_concurrency=1).run(slow + fast)
+
+    assert all(c.finished for c in slow + fast)
+    assert max(tracker.peak.values()) == 1
+    # Serial on the slow host; the fast hosts' 0.6s of checks fit alongside on the other workers.
+    assert max(c.finished for c in fast) - start < 0.5
+    assert time.time() - start < 1.2
+
+
+def test_per_host_limit_is_kept_across_runs():
+    from downtime_notifier.engine import PoolEngine
+
+    tracker = InFlightTracker()
+    engine = PoolEngine(max_concurrency=8, per_host_concurrency=3)
+    for run in range(2):
+        checkers = [SleepingChecker('host-{0}'.format(i % 2), 0.02, tracker) for i in range(24)]
+        engine.run(checkers)
+        assert all(c.finished for c in checkers)
+    assert tracker.peak == {'host-0': 3, 'host-1': 3}
+
+
+def test_unexpected_errors_are_recorded_without_losing_workers():
+    from downtime_notifier.engine import PoolEngine
+
+    tracker = InFlightTracker()
+    # More failures than workers; each worker must carry on to the checks queued behind them.
+    failing = [FailingChecker('host-{0}'.format(i), 0, tracker) for i in range(6)]
+    others = [SleepingChecker('host-{0}'.format(i), 0.01, tracker) for i in range(6)]
+    PoolEngine(max_concurrency=2, per_host_concurrency=1).run(failing + others)
+
+    assert all(isinstance(c.error, ValueError) for c in failing)
+    assert all(c.finished for c in others)
@@ -0,0 +1,115 @@
+import json
+import os
+import sys
+
+import pytest
+
+from conftest import LAMBDA_ROOT
+
+# The fabfile is at the root of the repository, two levels above the function.
+sys.path.insert(0, os.path.join(LAMBDA_ROOT, '..', '..'))
+
+
+@pytest.fixture
+def fabfile(tmpdir, monkeypatch):
+    """The fabfile, rendering its templates into a temporary directory."""
+    import fabfile
+    monkeypatch.setattr(fabfile, 'OUTPUT_DIR', str(tmpdir))
+    return fabfile
+
+
+def write_template(fabfile, name, body):
+    with open(os.path.join(fabfile.OUTPUT_DIR, name + fabfile.OUTPUT_EXT), 'w') as output_contents:
+        json.dump(body, output_contents)
+
+
+def export(name):
+    return {'Outputs': {'Out': {'Value': 'x', 'Export': {'Name': name}}}}
+
+
+def imports(*names):
+    return {'Resources': {'R{0}'.format(i): {'Properties': {'Ref': {'Fn::ImportValue': name}}}
+                          for (i, name) in enumerate(names)}}
+
+
+def test_dependencies_come_from_imports_and_config(fabfile):
+    write_template(fabfile, 'network', export('vpc-id'))
+    write_template(fabfile, 'app', dict(imports('vpc-id', 'unmanaged-export'), **export('app-url')))
+    write_template(fabfile, 'alarms', {'Resources': {}})
+    config = {'alarms': {'depends_on': ['app', 'not-provisioned']}}
+
+    dependencies = fabfile.template_dependencies(['alarms', 'app', 'network'], config)
+    assert dependencies == {'network': set(), 'app': {'network'}, 'alarms': {'app'}}
+    assert fabfile.topological_order(dependencies) == ['network', 'app', 'alarms']
+
+
+def test_independent_templates_are_ordered_together():
+    import fabfile
+
+    order = fabfile.topological_order({'d': {'b', 'c'}, 'c': {'a'}, 'b': {'a'}, 'a': set()})
+    assert order == ['a', 'b', 'c', 'd']
+
+
+def test_circular_dependencies_abort():
+    import fabfile
+
+    with pytest.raises(SystemExit):
+        fabfile.topological_order({'a': {'b'}, 'b': {'c'}, 'c': {'b'}})
+
+
+def event(number, status='CREATE_IN_PROGRESS', logical_id='Resource', resource_type='AWS::S3::Bucket'):
+    return {'EventId': 'e{0}'.format(number), 'Timestamp': number, 'ResourceStatus': status,
+            'LogicalResourceId': logical_id, 'ResourceType': resource_type}
+
+
+class FakeCloudFormation(object):
+    """Stands in for a CloudFormation client: pages a stack's events newest first, and records each call."""
+
+    def __init__(self, page_size=2):
+        self.events = []
+        self.page_size = page_size
+        self.calls = []
+
+    def describe_stack_events(self, StackName, NextToken=None):
+        self.calls.append(NextToken)
+        start = int(NextToken or 0)
+        newest_first = list(reversed(self.events))
+        response = {'StackEvents': newest_first[start:start + self.page_size]}
+        if start + self.page_size < len(newest_first):
+            response['NextToken'] = str(start + self.page_size)
+        return response
+
+
+def test_new_events_are_paged_only_back_to_the_last_one_seen():
+    import fabfile
+
+    client = FakeCloudFormation()
+    client.events = [event(i) for i in range(5)]
+    streamer = fabfile.StackEventStreamer(client, 'stack')
+    assert [e['EventId'] for e in streamer.new_events()] == ['e0', 'e1', 'e2', 'e3', 'e4']
+    assert client.calls == [None, '2', '4']
+
+    client.calls = []
+    assert streamer.new_events() == []
+    assert client.calls == [None]
+
+    # The last event seen is on the second page; the third is not fetched.
+    client.calls = []
+    client.events.extend(event(i) for i in range(5, 8))
+    assert [e['EventId'] for e in streamer.new_events()] == ['e5', 'e6', 'e7']
+    assert client.calls == [None, '2']
+
+
+def test_mark_skips_earlier_events_and_wait_returns_the_final_status(monkeypatch):
+    import fabfile
+
+    client = FakeCloudFormation()
+    client.events = [event(0, 'UPDATE_COMPLETE', 'stack', 'AWS::CloudFormation::Stack')]
+    streamer = fabfile.StackEventStreamer(client, 'stack')
+    streamer.mark()
+
+    client.events.extend([event(1, 'UPDATE_IN_PROGRESS', 'stack', 'AWS::CloudFormation::Stack'),
+                          event(2, 'UPDATE_COMPLETE'),
+                          event(3, 'UPDATE_ROLLBACK_COMPLETE', 'stack', 'AWS::CloudFormation::Stack')])
+    monkeypatch.setattr(fabfile.time, 'sleep', lambda seconds: None)
+    assert streamer.wait() == 'UPDATE_ROLLBACK_COMPLETE'
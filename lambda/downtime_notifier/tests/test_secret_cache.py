@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def bag(monkeypatch):
+    from downtime_notifier.secret_cache import ConfigBag
+    from downtime_notifier.secret_cache import EncryptedValue
+    from downtime_notifier.secret_cache import SecretCache
+
+    monkeypatch.setattr(SecretCache, 'get', classmethod(lambda cls, ciphertext: 'plain:' + ciphertext))
+    return ConfigBag(region='us-west-2', topic_arn=EncryptedValue('cipher'))
+
+
+def test_config_bag_decrypts_on_every_read(bag):
+    assert bag['topic_arn'] == bag.get('topic_arn') == 'plain:cipher'
+    assert sorted(bag.items()) == sorted(bag.iteritems()) == [('region', 'us-west-2'), ('topic_arn', 'plain:cipher')]
+    assert sorted(bag.values()) == sorted(bag.itervalues()) == ['plain:cipher', 'us-west-2']
+
+
+def test_config_bag_copies_keep_secrets_encrypted(bag):
+    assert repr(dict(bag)['topic_arn']) == '<encrypted>'
+
+
+IMPORTS_PREFETCH = '''
+from downtime_notifier.secret_cache import SecretCache
+
+def get(cls, ciphertext):
+    import json  # Worker threads importing anything must not wait on the import lock held by this import.
+    return ciphertext
+
+SecretCache.get = classmethod(get)
+SecretCache.prefetch(['a', 'b'])
+'''
+
+
+def test_prefetch_while_importing_does_not_deadlock(tmpdir):
+    import subprocess
+    import sys
+    import time
+    from conftest import LAMBDA_ROOT
+
+    tmpdir.join('prefetching_module.py').write(IMPORTS_PREFETCH)
+    process = subprocess.Popen([sys.executable, '-c', 'import prefetching_module'], cwd=str(tmpdir),
+                               env=dict(os.environ, PYTHONPATH=LAMBDA_ROOT))
+    deadline = time.time() + 30
+    while process.poll() is None and time.time() < deadline:
+        time.sleep(0.05)
+    if process.poll() is None:
+        process.kill()
+    assert process.returncode == 0
@@ -0,0 +1,53 @@
+import BaseHTTPServer
+import SocketServer
+import threading
+
+import pytest
+
+
+class CookieHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Sets a cookie on /login, and redirects from there to /echo; /echo responds with the cookie it was sent."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/login':
+            self.send_response(302)
+            self.send_header('Set-Cookie', 'consent=yes; Path=/')
+            self.send_header('Location', '/echo')
+            body = ''
+        else:
+            self.send_response(200)
+            body = self.headers.get('Cookie') or 'none'
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CookieServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def server():
+    server = CookieServer(('127.0.0.1', 0), CookieHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:{0}'.format(server.server_port)
+    server.shutdown()
+
+
+def test_pooled_sessions_keep_no_cookies_between_requests(server):
+    from downtime_notifier import SessionPool
+
+    SessionPool.reset()
+    session = SessionPool.session(server)
+    # Within the one request, the cookie is sent on along the redirect, as by a fresh client.
+    assert session.get(server + '/login').text == 'consent=yes'
+    assert session.get(server + '/echo').text == 'none'
+    assert len(session.cookies) == 0
+    SessionPool.reset()
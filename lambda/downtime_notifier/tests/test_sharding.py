@@ -0,0 +1,15 @@
+def failing_handler(event, context):
+    """Stands in for index.handler: shard 1 fails, and the others return their shard index."""
+    if event['shard']['index'] == 1:
+        raise ValueError('shard 1 is broken')
+    return {'shard': event['shard']['index'], 'notify': [{'name': 'site-{0}'.format(event['shard']['index'])}]}
+
+
+def test_local_shard_failures_are_returned_as_for_lambda_shards():
+    from downtime_notifier import LocalShardRunner
+
+    results = LocalShardRunner(failing_handler).run(3)
+    assert [r['shard'] for r in results] == [0, 1, 2]
+    assert [len(r['notify']) for r in results] == [1, 0, 1]
+    assert results[1]['error'] == 'ValueError: shard 1 is broken'
+    assert 'error' not in results[0] and 'error' not in results[2]
@@ -0,0 +1,81 @@
+import datetime
+
+import pytest
+
+from fakes import FakeChecker
+from fakes import TABLE
+
+
+SITES = 50
+
+
+def run(mode, run_number, sites=SITES):
+    """Record a run of results, in which every third site flips state each run; return the StateTrackers."""
+    from downtime_notifier import BatchStateStore
+    from downtime_notifier import HistoryStore
+    from downtime_notifier import StateTracker
+
+    checkers = [FakeChecker(i, bool(run_number % 2) and i % 3 == 0) for i in range(sites)]
+    timestamp = datetime.datetime(2026, 1, 1) + datetime.timedelta(minutes=5 * run_number)
+    trackers = [StateTracker(c, TABLE, timestamp) for c in checkers]
+    if mode == 'compact':
+        BatchStateStore(TABLE, history=HistoryStore(TABLE)).put_results(trackers)
+    elif mode == 'batched':
+        BatchStateStore(TABLE).put_results(trackers)
+    else:
+        for tracker in trackers:
+            tracker.put_result()
+    return trackers
+
+
+def test_batched_runs_read_latest_in_one_batch_get(dynamodb):
+    run('batched', 0)
+    for run_number in (1, 2):
+        dynamodb.reset()
+        run('batched', run_number)
+        # A result and a latest item per site, 25 to a BatchWriteItem; no per-site queries or puts.
+        assert dict(dynamodb.calls) == {'dynamodb.BatchGetItem': 1, 'dynamodb.BatchWriteItem': SITES * 2 // 25}
+
+
+def test_first_batched_run_queries_sites_without_latest_items(dynamodb):
+    run('batched', 0)
+    assert dynamodb.calls['dynamodb.BatchGetItem'] == 1
+    assert dynamodb.calls['dynamodb.Query'] == SITES
+
+
+def test_batch_get_is_split_at_100_keys(dynamodb):
+    run('batched', 0, sites=150)
+    dynamodb.reset()
+    run('batched', 1, sites=150)
+    assert dynamodb.calls['dynamodb.BatchGetItem'] == 2
+    assert dynamodb.calls['dynamodb.BatchWriteItem'] == 150 * 2 // 25
+
+
+def test_compact_runs_batch_latest_items_and_rollups(dynamodb):
+    run('compact', 0)
+    for run_number in (1, 2):
+        dynamodb.reset()
+        run('compact', run_number)
+        # One BatchGetItem for the latest items, and one for the hourly and daily rollups; a raw result, a
+        # latest item and two rollups per site, 25 to a BatchWriteItem.
+        assert dict(dynamodb.calls) == {'dynamodb.BatchGetItem': 2, 'dynamodb.BatchWriteItem': SITES * 4 // 25}
+
+
+@pytest.mark.parametrize('mode', ['batched', 'compact'])
+def test_batched_paths_notify_as_per_site_path(dynamodb, mode):
+    expected = [[t.notify for t in run('per-site', n)] for n in range(3)]
+    from downtime_notifier import AwsClients
+    from fakes import create_table
+    AwsClients.table(TABLE).delete()
+    create_table()
+    assert [[t.notify for t in run(mode, n)] for n in range(3)] == expected
+
+
+def test_per_site_run_after_compact_runs_reads_the_compact_result(dynamodb):
+    # Rollup items sort above every result; the per-site query must not take one for the previous result.
+    run('compact', 0)
+    run('compact', 1)
+    trackers = run('per-site', 2)
+    # Every third site was down on run 1 and is up again; the others are unchanged.
+    assert [t.reason for t in trackers if t.notify] == ['up'] * len(range(0, SITES, 3))
+    assert [t.notify for t in run('per-site', 3)] == [i % 3 == 0 for i in range(SITES)]